@@ -0,0 +1,353 @@
+"""
+audio_cache.py
+
+Persistent, disk-budgeted, content-addressed audio cache.
+(c) 2025 FrozenBots
+"""
+
+import os
+import json
+import time
+import hashlib
+import tempfile
+import logging
+from FrozenMusic.infra.vector.url_classifier import classify_url
+
+logger = logging.getLogger(__name__)
+
+AUDIO_CACHE_DIR = os.environ.get(
+    "AUDIO_CACHE_DIR", os.path.join(tempfile.gettempdir(), "frozen_audio_cache")
+)
+AUDIO_CACHE_MAX_BYTES = int(os.environ.get("AUDIO_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+AUDIO_CACHE_POLICY = os.environ.get("AUDIO_CACHE_POLICY", "lru").lower()
+INDEX_FILE_NAME = "index.json"
+INDEX_FLUSH_INTERVAL = 30
+PARTIAL_SUFFIX = ".part"
+
+
+TELEGRAM_KEY_PREFIX = "tg:"
+
+
+def telegram_track_id(file_unique_id: str) -> str:
+    """Cache key of a Telegram file; `file_unique_id` is stable across re-posts and bots."""
+    return TELEGRAM_KEY_PREFIX + file_unique_id
+
+
+def canonical_track_id(url: str) -> str:
+    """
+    Map any URL form of a track onto one stable cache key.
+    YouTube links collapse onto their video ID, Telegram media keys pass
+    through unchanged; anything else is hashed.
+    """
+    url = (url or "").strip()
+    if url.startswith(TELEGRAM_KEY_PREFIX):
+        return url
+    video_id = classify_url(url).video_id
+    if video_id:
+        return f"yt:{video_id}"
+    return "url:" + hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+
+class AudioCache:
+    """
+    On-disk audio cache keyed by canonical track ID.
+
+    The index is a JSON document next to the audio files so it survives
+    restarts. Entries are evicted by LRU (or LFU when configured) until the
+    byte budget is met; pinned keys (queued or playing tracks) are never evicted.
+    An entry may carry derived variants (e.g. a loudness-normalised transcode)
+    stored next to the original and evicted together with it.
+    """
+
+    def __init__(self, root=AUDIO_CACHE_DIR, max_bytes=AUDIO_CACHE_MAX_BYTES, policy=AUDIO_CACHE_POLICY):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.policy = policy if policy in ("lru", "lfu") else "lru"
+        self.entries = {}
+        self.pins = {}
+        self.total_bytes = 0
+        self._loaded = False
+        self._dirty = False
+        self._last_flush = 0.0
+
+    # ─── Index persistence ──────────────────────────────────────────
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.root, INDEX_FILE_NAME)
+
+    def load(self):
+        os.makedirs(self.root, exist_ok=True)
+        self._loaded = True
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+        except FileNotFoundError:
+            raw = {}
+        except Exception as e:
+            logger.warning(f"Audio cache index unreadable, starting empty: {e}")
+            raw = {}
+
+        self.entries = {}
+        self.total_bytes = 0
+        for key, entry in raw.get("entries", {}).items():
+            path = os.path.join(self.root, entry.get("file", ""))
+            if not os.path.isfile(path):
+                continue
+            entry["size"] = os.path.getsize(path)
+            variants = {}
+            for name, variant in entry.get("variants", {}).items():
+                variant_path = os.path.join(self.root, variant.get("file", ""))
+                if os.path.isfile(variant_path):
+                    variant["size"] = os.path.getsize(variant_path)
+                    variants[name] = variant
+                    entry["size"] += variant["size"]
+            entry["variants"] = variants
+            self.entries[key] = entry
+            self.total_bytes += entry["size"]
+        self._dirty = True
+        self.flush()
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def flush(self):
+        if not self._dirty:
+            return
+        tmp_path = self.index_path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"entries": self.entries}, f)
+            os.replace(tmp_path, self.index_path)
+            self._dirty = False
+            self._last_flush = time.time()
+        except Exception as e:
+            logger.warning(f"Failed to write audio cache index: {e}")
+
+    def _maybe_flush(self):
+        if self._dirty and time.time() - self._last_flush >= INDEX_FLUSH_INTERVAL:
+            self.flush()
+
+    # ─── Paths ──────────────────────────────────────────────────────
+    @staticmethod
+    def file_name_for(key: str, suffix: str = ".mp3") -> str:
+        return hashlib.sha1(key.encode("utf-8")).hexdigest() + suffix
+
+    def path_for(self, key: str, suffix: str = ".mp3") -> str:
+        return os.path.join(self.root, self.file_name_for(key, suffix))
+
+    def partial_path(self, key: str, suffix: str = ".mp3") -> str:
+        self._ensure_loaded()
+        return self.path_for(key, suffix) + PARTIAL_SUFFIX
+
+    def variant_partial_path(self, key: str, name: str, suffix: str) -> str:
+        self._ensure_loaded()
+        return self.path_for(key, f".{name}{suffix}") + PARTIAL_SUFFIX
+
+    def discard_partial(self, path: str):
+        """Delete an abandoned partial download, if it is still there."""
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Failed to delete partial download {path}: {e}")
+
+    # ─── Lookup / insert ────────────────────────────────────────────
+    def peek(self, key: str, variant: str = None):
+        """Like `lookup` but without touching recency/frequency stats."""
+        self._ensure_loaded()
+        entry = self.entries.get(key)
+        if not entry:
+            return None
+        if variant and variant in entry.get("variants", {}):
+            path = os.path.join(self.root, entry["variants"][variant]["file"])
+            if os.path.isfile(path):
+                return path
+        path = os.path.join(self.root, entry["file"])
+        return path if os.path.isfile(path) else None
+
+    def lookup(self, key: str, variant: str = None):
+        """
+        Return the cached file path for `key`, or None on a miss. When `variant`
+        is given and exists, its path is returned instead of the original.
+        """
+        path = self.peek(key, variant)
+        if path is None:
+            if key in self.entries:
+                self._drop(key)
+            return None
+        entry = self.entries[key]
+        entry["last_access"] = time.time()
+        entry["hits"] = entry.get("hits", 0) + 1
+        self._dirty = True
+        self._maybe_flush()
+        return path
+
+    def meta(self, key: str) -> dict:
+        """Metadata stored with an entry (source URL, title, duration, …), or {}."""
+        self._ensure_loaded()
+        entry = self.entries.get(key)
+        return entry.get("meta", {}) if entry else {}
+
+    def has_variant(self, key: str, name: str) -> bool:
+        entry = self.entries.get(key)
+        return bool(entry and name in entry.get("variants", {}))
+
+    def variant_info(self, key: str, name: str):
+        entry = self.entries.get(key)
+        if not entry:
+            return None
+        return entry.get("variants", {}).get(name)
+
+    def add_variant(self, key: str, name: str, partial_path: str, info: dict = None):
+        """Attach a derived file to an existing entry. Returns its path, or None if the entry is gone."""
+        self._ensure_loaded()
+        entry = self.entries.get(key)
+        if entry is None:
+            self.discard_partial(partial_path)
+            return None
+        final_path = partial_path[:-len(PARTIAL_SUFFIX)] if partial_path.endswith(PARTIAL_SUFFIX) else partial_path
+        if final_path != partial_path:
+            os.replace(partial_path, final_path)
+        size = os.path.getsize(final_path)
+
+        variants = entry.setdefault("variants", {})
+        old = variants.pop(name, None)
+        if old:
+            entry["size"] -= old.get("size", 0)
+            self.total_bytes -= old.get("size", 0)
+        variants[name] = {"file": os.path.basename(final_path), "size": size, **(info or {})}
+        entry["size"] += size
+        self.total_bytes += size
+        self._dirty = True
+        # The entry just extended must survive, or the returned path would be gone.
+        self.evict(keep=key)
+        self.flush()
+        return final_path
+
+    def commit(self, key: str, partial_path: str, meta: dict = None) -> str:
+        """Move a finished download into place and account for it in the index."""
+        self._ensure_loaded()
+        final_path = partial_path[:-len(PARTIAL_SUFFIX)] if partial_path.endswith(PARTIAL_SUFFIX) else partial_path
+        if final_path != partial_path:
+            os.replace(partial_path, final_path)
+        size = os.path.getsize(final_path)
+
+        if key in self.entries:
+            self._drop(key, delete_file=self.entries[key]["file"] != os.path.basename(final_path))
+        self.evict(size)
+
+        now = time.time()
+        self.entries[key] = {
+            "file": os.path.basename(final_path),
+            "size": size,
+            "created": now,
+            "last_access": now,
+            "hits": 0,
+            "meta": meta or {},
+        }
+        self.total_bytes += size
+        self._dirty = True
+        self.flush()
+        return final_path
+
+    def discard(self, key: str):
+        self._ensure_loaded()
+        if key in self.entries:
+            self._drop(key)
+            self.flush()
+
+    def _drop(self, key: str, delete_file: bool = True):
+        entry = self.entries.pop(key, None)
+        if not entry:
+            return
+        self.total_bytes -= entry.get("size", 0)
+        self._dirty = True
+        files = [v["file"] for v in entry.get("variants", {}).values()]
+        if delete_file:
+            files.append(entry["file"])
+        for name in files:
+            try:
+                os.remove(os.path.join(self.root, name))
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.warning(f"Failed to delete cached file for {key}: {e}")
+
+    # ─── Pinning ────────────────────────────────────────────────────
+    def pin(self, key: str):
+        self.pins[key] = self.pins.get(key, 0) + 1
+
+    def unpin(self, key: str):
+        count = self.pins.get(key, 0) - 1
+        if count > 0:
+            self.pins[key] = count
+        else:
+            self.pins.pop(key, None)
+
+    def is_pinned(self, key: str) -> bool:
+        return key in self.pins
+
+    # ─── Eviction ───────────────────────────────────────────────────
+    def _eviction_order(self, keep=None):
+        candidates = [(k, e) for k, e in self.entries.items() if k not in self.pins and k != keep]
+        if self.policy == "lfu":
+            candidates.sort(key=lambda item: (item[1].get("hits", 0), item[1].get("last_access", 0)))
+        else:
+            candidates.sort(key=lambda item: item[1].get("last_access", 0))
+        return [k for k, _ in candidates]
+
+    def evict(self, incoming_bytes: int = 0, keep: str = None) -> int:
+        """
+        Evict unpinned entries (other than `keep`) until `incoming_bytes` fits
+        the budget. Returns bytes freed.
+        """
+        self._ensure_loaded()
+        freed = 0
+        if self.total_bytes + incoming_bytes <= self.max_bytes:
+            return freed
+        for key in self._eviction_order(keep):
+            if self.total_bytes + incoming_bytes <= self.max_bytes:
+                break
+            freed += self.entries[key].get("size", 0)
+            self._drop(key)
+        if freed:
+            logger.info(f"Audio cache evicted {freed} bytes ({self.policy})")
+        return freed
+
+    def shrink(self, nbytes: int) -> int:
+        """Evict unpinned entries until at least `nbytes` are freed, ignoring the budget."""
+        self._ensure_loaded()
+        freed = 0
+        for key in self._eviction_order():
+            if freed >= nbytes:
+                break
+            freed += self.entries[key].get("size", 0)
+            self._drop(key)
+        if freed:
+            self.flush()
+            logger.info(f"Audio cache shrunk by {freed} bytes to free disk space")
+        return freed
+
+    def referenced_files(self) -> set:
+        """Names of every file in the cache directory that the index accounts for."""
+        self._ensure_loaded()
+        names = {INDEX_FILE_NAME}
+        for entry in self.entries.values():
+            names.add(entry["file"])
+            names.update(v["file"] for v in entry.get("variants", {}).values())
+        return names
+
+    def stats(self) -> dict:
+        self._ensure_loaded()
+        return {
+            "entries": len(self.entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "pinned": len(self.pins),
+            "policy": self.policy,
+        }
+
+
+audio_cache = AudioCache()
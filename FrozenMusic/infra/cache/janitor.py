@@ -0,0 +1,190 @@
+"""
+janitor.py
+
+Reclaims orphaned media files and gates downloads on free disk space.
+(c) 2025 FrozenBots
+"""
+
+import os
+import time
+import shutil
+import asyncio
+import logging
+import tempfile
+from contextlib import asynccontextmanager
+from FrozenMusic.infra.cache.audio_cache import audio_cache, PARTIAL_SUFFIX
+
+logger = logging.getLogger(__name__)
+
+# Directory earlier releases downloaded reply media into; all media now lives in
+# the audio cache, so anything left here is reclaimed at startup.
+MEDIA_DOWNLOAD_DIR = os.environ.get(
+    "MEDIA_DOWNLOAD_DIR", os.path.join(tempfile.gettempdir(), "frozen_media")
+)
+# Unreferenced files and partials younger than this are assumed to be in use.
+ORPHAN_GRACE_SECONDS = int(os.environ.get("ORPHAN_GRACE_SECONDS", "600"))
+JANITOR_INTERVAL = int(os.environ.get("JANITOR_INTERVAL", "600"))
+# Free space that must always remain after an admitted download.
+DISK_RESERVE_BYTES = int(os.environ.get("DISK_RESERVE_BYTES", str(512 * 1024 ** 2)))
+# Assumed size of a download whose length is not known up front.
+DOWNLOAD_SIZE_ESTIMATE = int(os.environ.get("DOWNLOAD_SIZE_ESTIMATE", str(32 * 1024 ** 2)))
+# How long a download waits for space before it is refused; 0 refuses at once.
+DISK_ADMISSION_WAIT = float(os.environ.get("DISK_ADMISSION_WAIT", "60"))
+DISK_ADMISSION_POLL = 5.0
+
+
+class InsufficientDiskSpace(Exception):
+    def __init__(self, needed: int, free: int):
+        super().__init__(
+            f"Not enough disk space: need {needed // (1024 ** 2)} MB, {free // (1024 ** 2)} MB free"
+        )
+        self.needed = needed
+        self.free = free
+
+
+class FileJanitor:
+    """
+    Keeps the audio cache directory free of files the cache index no longer
+    references, including stale partial downloads, and reclaims what earlier
+    releases left in their own media directory. Only directories the bot
+    owns are ever swept.
+
+    Downloads reserve their expected size through `reserve()`; when the disk
+    is short the janitor sweeps and shrinks the audio cache, then waits up to
+    DISK_ADMISSION_WAIT for space before refusing with InsufficientDiskSpace.
+    """
+
+    def __init__(self, legacy_dir=MEDIA_DOWNLOAD_DIR, cache=audio_cache, reserve_bytes=DISK_RESERVE_BYTES):
+        self.legacy_dir = legacy_dir
+        self.cache = cache
+        self.reserve_bytes = reserve_bytes
+        self.reserved = 0
+        self._task = None
+
+    # ─── Sweeping ───────────────────────────────────────────────────
+    def sweep(self, include_legacy: bool = False) -> int:
+        """Delete orphaned files. Returns the number of bytes reclaimed."""
+        now = time.time()
+        freed = 0
+
+        referenced = self.cache.referenced_files()
+        for path in _list_files(self.cache.root):
+            name = os.path.basename(path)
+            if name in referenced:
+                continue
+            # Partials are rewritten continuously while their transfer runs,
+            # so only ones that have gone quiet are abandoned.
+            if _age(path, now) > ORPHAN_GRACE_SECONDS:
+                freed += _remove(path)
+                if name.endswith(PARTIAL_SUFFIX):
+                    logger.info(f"Reclaimed stale partial download {name}")
+
+        if include_legacy and self.legacy_dir:
+            for path in _list_files(self.legacy_dir):
+                freed += _remove(path)
+            try:
+                os.rmdir(self.legacy_dir)
+            except OSError:
+                pass
+
+        if freed:
+            logger.info(f"Janitor reclaimed {freed} bytes")
+        return freed
+
+    async def run_periodically(self, interval: float = JANITOR_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.warning(f"Janitor sweep failed: {e}")
+
+    def start(self):
+        """Sweep once, including legacy leftovers, then keep sweeping in the background."""
+        self.sweep(include_legacy=True)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_event_loop().create_task(self.run_periodically())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    # ─── Admission control ──────────────────────────────────────────
+    def free_bytes(self, path: str = None) -> int:
+        path = path or self.cache.root
+        while not os.path.exists(path):
+            path = os.path.dirname(path)
+        return shutil.disk_usage(path).free
+
+    def shortfall(self, nbytes: int, path: str = None) -> int:
+        """Bytes that must be freed before `nbytes` more can be written under `path`."""
+        return nbytes + self.reserved + self.reserve_bytes - self.free_bytes(path)
+
+    def reclaim(self, nbytes: int) -> int:
+        """Free at least `nbytes` if possible: orphans first, then unpinned cache entries."""
+        freed = self.sweep()
+        if freed < nbytes:
+            freed += self.cache.shrink(nbytes - freed)
+        return freed
+
+    @asynccontextmanager
+    async def reserve(self, nbytes: int = None, path: str = None):
+        """
+        Hold `nbytes` of disk space for the duration of a download, waiting up
+        to DISK_ADMISSION_WAIT for space to appear if the disk is short.
+        """
+        nbytes = nbytes or DOWNLOAD_SIZE_ESTIMATE
+        deadline = time.monotonic() + DISK_ADMISSION_WAIT
+        while True:
+            short = self.shortfall(nbytes, path)
+            if short > 0:
+                self.reclaim(short)
+                short = self.shortfall(nbytes, path)
+            if short <= 0:
+                break
+            if time.monotonic() >= deadline:
+                raise InsufficientDiskSpace(nbytes + self.reserve_bytes, self.free_bytes(path))
+            await asyncio.sleep(DISK_ADMISSION_POLL)
+
+        self.reserved += nbytes
+        try:
+            yield
+        finally:
+            self.reserved -= nbytes
+
+    def stats(self) -> dict:
+        return {
+            "reserved_bytes": self.reserved,
+            "free_bytes": self.free_bytes(),
+        }
+
+
+def _list_files(directory: str):
+    try:
+        with os.scandir(directory) as it:
+            return [os.path.abspath(e.path) for e in it if e.is_file()]
+    except FileNotFoundError:
+        return []
+
+
+def _age(path: str, now: float) -> float:
+    try:
+        return now - os.path.getmtime(path)
+    except OSError:
+        return 0.0
+
+
+def _remove(path: str) -> int:
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+        return size
+    except FileNotFoundError:
+        return 0
+    except Exception as e:
+        logger.warning(f"Failed to delete {path}: {e}")
+        return 0
+
+
+janitor = FileJanitor()
@@ -0,0 +1,195 @@
+"""
+search_cache.py
+
+Bounded TTL cache of search results keyed by normalised query.
+(c) 2025 FrozenBots
+"""
+
+import os
+import json
+import time
+import logging
+import functools
+import urllib.parse
+from collections import OrderedDict
+from FrozenMusic.infra.concurrency.single_flight import SingleFlight
+from FrozenMusic.infra.vector.results import TrackResult, PlaylistResult, result_to_json, result_from_json
+from FrozenMusic.infra.vector.url_classifier import classify_url, canonical_video_url
+
+logger = logging.getLogger(__name__)
+
+SEARCH_CACHE_MAX_ENTRIES = int(os.environ.get("SEARCH_CACHE_MAX_ENTRIES", "5000"))
+SEARCH_CACHE_TTL = float(os.environ.get("SEARCH_CACHE_TTL", str(6 * 3600)))
+SEARCH_CACHE_NEGATIVE_TTL = float(os.environ.get("SEARCH_CACHE_NEGATIVE_TTL", "300"))
+# JSON file the cache is persisted to; empty keeps it in memory only.
+SEARCH_CACHE_PATH = os.environ.get("SEARCH_CACHE_PATH", "")
+SEARCH_CACHE_FLUSH_INTERVAL = 60
+
+TRACKING_PARAMS = {"si", "feature", "pp", "fbclid", "gclid", "igshid", "ref", "ab_channel"}
+
+MISS = object()
+
+
+def normalize_query(query: str) -> str:
+    """
+    Collapse equivalent queries onto one key. Free text is case-folded and
+    whitespace-collapsed; URLs keep their case-sensitive path and IDs but
+    lose tracking parameters, and their remaining parameters are sorted.
+    """
+    query = " ".join((query or "").split())
+    parsed = urllib.parse.urlsplit(query)
+    if parsed.scheme in ("http", "https") and parsed.netloc:
+        params = [
+            (k, v) for k, v in urllib.parse.parse_qsl(parsed.query, keep_blank_values=True)
+            if k.lower() not in TRACKING_PARAMS and not k.lower().startswith("utm_")
+        ]
+        host = parsed.netloc.lower()
+        if host.startswith("www.") or host.startswith("m."):
+            host = host.split(".", 1)[1]
+        return urllib.parse.urlunsplit(
+            ("https", host, parsed.path.rstrip("/"), urllib.parse.urlencode(sorted(params)), "")
+        )
+    return query.casefold()
+
+
+def is_negative(result) -> bool:
+    """True for an answer that found nothing: no link, or an empty playlist."""
+    if isinstance(result, PlaylistResult):
+        return not result.items
+    return not result or not result[0]
+
+
+class SearchCache:
+    """
+    LRU cache of search results with separate TTLs for hits and for
+    "nothing found" answers. Failed lookups are never cached. When `path` is
+    set, entries survive restarts via a periodically rewritten JSON file.
+    """
+
+    def __init__(self, max_entries=SEARCH_CACHE_MAX_ENTRIES, ttl=SEARCH_CACHE_TTL,
+                 negative_ttl=SEARCH_CACHE_NEGATIVE_TTL, path=SEARCH_CACHE_PATH):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.path = path
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._dirty = False
+        self._last_flush = 0.0
+
+    def get(self, query: str):
+        """Return the cached result for `query`, or MISS."""
+        key = normalize_query(query)
+        entry = self.entries.get(key)
+        if entry is None or entry[0] <= time.time():
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return MISS
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, query: str, result):
+        ttl = self.negative_ttl if is_negative(result) else self.ttl
+        if ttl <= 0:
+            return
+        key = normalize_query(query)
+        self.entries[key] = (time.time() + ttl, result)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        self._dirty = True
+        self._maybe_flush()
+
+    def peek(self, query: str):
+        """Like `get` but without touching recency or hit statistics."""
+        entry = self.entries.get(normalize_query(query))
+        if entry is None or entry[0] <= time.time():
+            return MISS
+        return entry[1]
+
+    def remember_tracks(self, result):
+        """Index every track in `result` under its canonical video URL for direct-ID lookups."""
+        items = result.items if isinstance(result, PlaylistResult) else (result,)
+        for item in items:
+            video_id = classify_url(item.link).video_id if item and item.link else None
+            if video_id:
+                self.put(canonical_video_url(video_id), item)
+
+    def track_for_video(self, video_id: str):
+        result = self.peek(canonical_video_url(video_id))
+        return result if isinstance(result, TrackResult) and result.link else None
+
+    def invalidate(self, query: str):
+        self.entries.pop(normalize_query(query), None)
+
+    # ─── Persistence ────────────────────────────────────────────────
+    def load(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.warning(f"Search cache file unreadable, starting empty: {e}")
+            return
+        now = time.time()
+        for key, expires, result in raw.get("entries", []):
+            if expires > now:
+                self.entries[key] = (expires, result_from_json(result))
+        logger.info(f"Loaded {len(self.entries)} cached search results")
+
+    def flush(self):
+        if not self.path or not self._dirty:
+            return
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"entries": [[k, e, result_to_json(r)] for k, (e, r) in self.entries.items()]}, f)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+            self._last_flush = time.time()
+        except Exception as e:
+            logger.warning(f"Failed to write search cache: {e}")
+
+    def _maybe_flush(self):
+        if self.path and time.time() - self._last_flush >= SEARCH_CACHE_FLUSH_INTERVAL:
+            self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+search_cache = SearchCache()
+
+
+def cached_search(fn):
+    """
+    Serve `fn(query)` from the search cache, and collapse concurrent identical
+    queries onto one upstream call. Results from every search upstream share
+    one cache, since they answer the same question.
+    """
+    inflight = SingleFlight()
+
+    @functools.wraps(fn)
+    async def wrapper(query: str):
+        result = search_cache.get(query)
+        if result is not MISS:
+            return result
+
+        async def fetch():
+            fresh = await fn(query)
+            search_cache.put(query, fresh)
+            return fresh
+
+        return await inflight.do(normalize_query(query), fetch)
+
+    return wrapper
@@ -0,0 +1,35 @@
+"""
+iso_duration.py
+
+Cheap parsing of the ISO-8601 durations YouTube reports ("PT3M45S").
+(c) 2025 FrozenBots
+"""
+
+import re
+
+_ISO_DURATION = re.compile(
+    r"^P(?:(?P<days>\d+)D)?(?:T(?:(?P<hours>\d+)H)?(?:(?P<minutes>\d+)M)?(?:(?P<seconds>\d+(?:\.\d+)?)S)?)?$"
+)
+
+
+def parse_iso_duration(value: str):
+    """Seconds in an ISO-8601 duration, or None if it is not one."""
+    m = _ISO_DURATION.match(value or "")
+    if not m or value in ("P", "PT"):
+        return None
+    days, hours, minutes, seconds = m.group("days", "hours", "minutes", "seconds")
+    return (
+        int(days or 0) * 86400
+        + int(hours or 0) * 3600
+        + int(minutes or 0) * 60
+        + int(float(seconds or 0))
+    )
+
+
+def humanize_seconds(total_seconds: int) -> str:
+    """`H:MM:SS` or `M:SS`, as shown in queue and now-playing messages."""
+    hours, remainder = divmod(int(total_seconds), 3600)
+    minutes, seconds = divmod(remainder, 60)
+    if hours > 0:
+        return f"{hours}:{minutes:02}:{seconds:02}"
+    return f"{minutes}:{seconds:02}"
@@ -0,0 +1,127 @@
+"""
+chat_actor.py
+
+One actor task per chat, running that chat's commands strictly in order.
+(c) 2025 FrozenBots
+"""
+
+import os
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# An actor with an empty mailbox and no running job exits after this long.
+ACTOR_IDLE_SECONDS = float(os.environ.get("ACTOR_IDLE_SECONDS", "300"))
+
+
+class ChatActor:
+    """
+    Mailbox and worker task for one chat. Commands run one at a time, in
+    arrival order. Slow work a command kicks off (such as downloading and
+    starting a stream) goes through `spawn`, so it does not hold up the
+    mailbox; the next `spawn` or `cancel_job` cancels it.
+    """
+
+    def __init__(self, chat_id: int):
+        self.chat_id = chat_id
+        self.mailbox = asyncio.Queue()
+        self.task = None
+        self.job = None
+        self.processed = 0
+
+    def spawn(self, coro) -> asyncio.Task:
+        self.cancel_job()
+        self.job = asyncio.ensure_future(coro)
+        return self.job
+
+    def cancel_job(self):
+        job, self.job = self.job, None
+        if job is not None and not job.done():
+            job.cancel()
+
+    @property
+    def busy(self) -> bool:
+        return self.job is not None and not self.job.done()
+
+
+class ChatActors:
+    """
+    Routes named commands to per-chat actors. Handlers are registered with
+    `command(name)` and called as `handler(actor, *args)`. Chats share no
+    actor and no lock, so one slow chat never delays another. Actors start on
+    their chat's first command and exit once idle.
+    """
+
+    def __init__(self, idle=ACTOR_IDLE_SECONDS):
+        self.idle = idle
+        self.handlers = {}
+        self.actors = {}
+
+    def command(self, name: str):
+        """Decorator registering `async fn(actor, *args)` as command `name`. Returns `fn` unchanged."""
+        def decorator(fn):
+            self.handlers[name] = fn
+            return fn
+        return decorator
+
+    def _actor(self, chat_id: int) -> ChatActor:
+        actor = self.actors.get(chat_id)
+        if actor is None:
+            actor = self.actors[chat_id] = ChatActor(chat_id)
+            actor.task = asyncio.ensure_future(self._run(actor))
+        return actor
+
+    def post(self, chat_id: int, name: str, *args) -> asyncio.Future:
+        """Queue a command without waiting for it. The returned future holds its result."""
+        if name not in self.handlers:
+            raise KeyError(f"unknown command {name!r}")
+        future = asyncio.get_running_loop().create_future()
+        self._actor(chat_id).mailbox.put_nowait((name, args, future))
+        return future
+
+    async def send(self, chat_id: int, name: str, *args):
+        """Queue a command and wait for its result (or exception)."""
+        actor = self.actors.get(chat_id)
+        if actor is not None and actor.task is asyncio.current_task():
+            raise RuntimeError(f"chat {chat_id} sent {name!r} to its own actor and would wait forever")
+        return await self.post(chat_id, name, *args)
+
+    async def _run(self, actor: ChatActor):
+        while True:
+            try:
+                name, args, future = await asyncio.wait_for(actor.mailbox.get(), self.idle)
+            except asyncio.TimeoutError:
+                if actor.mailbox.empty() and not actor.busy:
+                    if self.actors.get(actor.chat_id) is actor:
+                        del self.actors[actor.chat_id]
+                    return
+                continue
+            if future.cancelled():
+                continue
+            try:
+                result = await self.handlers[name](actor, *args)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as e:
+                logger.warning(f"Chat {actor.chat_id}: command {name} failed: {e}")
+                future.set_exception(e)
+                # Mark it retrieved; posted commands often have nobody awaiting them.
+                future.exception()
+            else:
+                future.set_result(result)
+            actor.processed += 1
+
+    def stop(self):
+        for actor in self.actors.values():
+            actor.cancel_job()
+            actor.task.cancel()
+        self.actors.clear()
+
+    def stats(self) -> dict:
+        return {
+            "actors": len(self.actors),
+            "busy": sum(actor.busy for actor in self.actors.values()),
+            "queued": sum(actor.mailbox.qsize() for actor in self.actors.values()),
+        }
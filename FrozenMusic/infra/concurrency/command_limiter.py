@@ -0,0 +1,188 @@
+"""
+command_limiter.py
+
+Per-chat and per-user token-bucket limits for bot commands, with a small
+pending queue per chat.
+(c) 2025 FrozenBots
+"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from FrozenMusic.infra.concurrency.token_bucket import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Sustained rate is one command per 10 s per chat (and per user), with short bursts allowed.
+PLAY_CHAT_RATE = float(os.environ.get("PLAY_CHAT_RATE", "0.1"))
+PLAY_CHAT_BURST = float(os.environ.get("PLAY_CHAT_BURST", "3"))
+PLAY_USER_RATE = float(os.environ.get("PLAY_USER_RATE", "0.1"))
+PLAY_USER_BURST = float(os.environ.get("PLAY_USER_BURST", "2"))
+# Commands a chat can have waiting for tokens; more are turned away.
+PLAY_PENDING_LIMIT = int(os.environ.get("PLAY_PENDING_LIMIT", "5"))
+# Buckets untouched this long are refilled anyway and are dropped.
+LIMITER_IDLE_SECONDS = float(os.environ.get("LIMITER_IDLE_SECONDS", "600"))
+LIMITER_SWEEP_SECONDS = 60
+
+
+class Admission:
+    """Outcome of `CommandLimiter.submit`."""
+
+    RUN = "run"          # run the command now
+    QUEUED = "queued"    # queued; the limiter runs it when the chat has a token
+    CHAT_FULL = "full"   # the chat's pending queue is full
+    USER_LIMITED = "user"  # the sender is over their own limit
+
+    __slots__ = ("status", "wait", "position")
+
+    def __init__(self, status: str, wait: float = 0.0, position: int = 0):
+        self.status = status
+        self.wait = wait
+        self.position = position
+
+
+class _ChatState:
+    __slots__ = ("bucket", "pending", "drainer", "used")
+
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        self.pending = deque()
+        self.drainer = None
+        self.used = time.monotonic()
+
+
+class _UserState:
+    __slots__ = ("bucket", "used")
+
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        self.used = time.monotonic()
+
+
+class CommandLimiter:
+    """
+    Admits commands against a token bucket per chat and one per user.
+
+    A sender over their own limit is turned away with the time until they
+    may retry. A command the chat has no token for goes into that chat's
+    pending FIFO (at most `pending_limit` deep) as a zero-argument coroutine
+    function; a drain task runs pending commands in order as the chat's
+    bucket refills, then exits. State for chats and users with nothing
+    pending and idle for `idle` seconds is evicted, so memory tracks the
+    recently active chats, not every chat ever seen.
+    """
+
+    def __init__(self, chat_rate=PLAY_CHAT_RATE, chat_burst=PLAY_CHAT_BURST, user_rate=PLAY_USER_RATE,
+                 user_burst=PLAY_USER_BURST, pending_limit=PLAY_PENDING_LIMIT, idle=LIMITER_IDLE_SECONDS):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.pending_limit = pending_limit
+        self.idle = idle
+        self.chats = {}
+        self.users = {}
+        self._last_sweep = time.monotonic()
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.evicted = 0
+
+    def _chat(self, chat_id: int) -> _ChatState:
+        state = self.chats.get(chat_id)
+        if state is None:
+            state = self.chats[chat_id] = _ChatState(TokenBucket(self.chat_rate, self.chat_burst))
+        state.used = time.monotonic()
+        return state
+
+    def _user(self, user_id: int) -> _UserState:
+        state = self.users.get(user_id)
+        if state is None:
+            state = self.users[user_id] = _UserState(TokenBucket(self.user_rate, self.user_burst))
+        state.used = time.monotonic()
+        return state
+
+    def submit(self, chat_id: int, user_id, job) -> Admission:
+        """
+        Admit `job` (an `async def` taking no arguments) for the chat. On RUN
+        the caller runs it; on QUEUED the limiter will. `user_id` may be None
+        for anonymous senders, who are only limited per chat.
+        """
+        self._maybe_sweep()
+        user = self._user(user_id) if user_id is not None else None
+        if user is not None:
+            wait = user.bucket.time_until()
+            if wait > 0:
+                self.rejected += 1
+                return Admission(Admission.USER_LIMITED, wait)
+
+        chat = self._chat(chat_id)
+        if not chat.pending and chat.bucket.try_consume() == 0:
+            if user is not None:
+                user.bucket.try_consume()
+            self.admitted += 1
+            return Admission(Admission.RUN)
+
+        if len(chat.pending) >= self.pending_limit:
+            self.rejected += 1
+            return Admission(Admission.CHAT_FULL, self._eta(chat, len(chat.pending)))
+
+        if user is not None:
+            user.bucket.try_consume()
+        chat.pending.append(job)
+        self.queued += 1
+        if chat.drainer is None or chat.drainer.done():
+            chat.drainer = asyncio.ensure_future(self._drain(chat_id, chat))
+        return Admission(Admission.QUEUED, self._eta(chat, len(chat.pending) - 1), len(chat.pending))
+
+    def _eta(self, chat: _ChatState, ahead: int) -> float:
+        """Seconds until a command with `ahead` commands before it gets a token."""
+        return chat.bucket.time_until() + ahead / self.chat_rate if self.chat_rate > 0 else float("inf")
+
+    async def _drain(self, chat_id: int, chat: _ChatState):
+        while chat.pending:
+            await chat.bucket.acquire()
+            job = chat.pending.popleft()
+            chat.used = time.monotonic()
+            try:
+                await job()
+            except Exception as e:
+                logger.warning(f"Queued command for chat {chat_id} failed: {e}")
+
+    def reset(self, chat_id: int):
+        """Forget a chat's bucket and drop its pending commands."""
+        chat = self.chats.pop(chat_id, None)
+        if chat is not None:
+            chat.pending.clear()
+            if chat.drainer is not None:
+                chat.drainer.cancel()
+
+    def _maybe_sweep(self):
+        now = time.monotonic()
+        if now - self._last_sweep < LIMITER_SWEEP_SECONDS:
+            return
+        self._last_sweep = now
+        cutoff = now - self.idle
+        stale_chats = [
+            chat_id for chat_id, state in self.chats.items()
+            if state.used < cutoff and not state.pending and (state.drainer is None or state.drainer.done())
+        ]
+        for chat_id in stale_chats:
+            del self.chats[chat_id]
+        stale_users = [user_id for user_id, state in self.users.items() if state.used < cutoff]
+        for user_id in stale_users:
+            del self.users[user_id]
+        self.evicted += len(stale_chats) + len(stale_users)
+
+    def stats(self) -> dict:
+        return {
+            "chats": len(self.chats),
+            "users": len(self.users),
+            "pending": sum(len(state.pending) for state in self.chats.values()),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "evicted": self.evicted,
+        }
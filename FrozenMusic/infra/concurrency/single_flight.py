@@ -0,0 +1,57 @@
+"""
+single_flight.py
+
+Collapse concurrent calls for the same key onto one in-flight coroutine.
+(c) 2025 FrozenBots
+"""
+
+import asyncio
+
+
+class SingleFlight:
+    """
+    Every caller of `do(key, factory)` made while a call for `key` is running
+    awaits that same task and receives the same result or exception.
+
+    A caller that is cancelled only stops waiting; the shared task is
+    cancelled once its last waiter goes away.
+    """
+
+    def __init__(self):
+        self.calls = {}
+
+    def in_flight(self, key) -> bool:
+        return key in self.calls
+
+    def do(self, key, factory):
+        """
+        Return an awaitable for the shared call. The call is registered before
+        this returns, so `in_flight(key)` holds even before it is awaited.
+        """
+        entry = self.calls.get(key)
+        if entry is None:
+            task = asyncio.ensure_future(factory())
+            entry = [task, 0]
+            self.calls[key] = entry
+            task.add_done_callback(lambda _t, k=key, e=entry: self._forget(k, e))
+        return self._wait(entry)
+
+    async def _wait(self, entry):
+        task = entry[0]
+        entry[1] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done() and entry[1] == 1:
+                task.cancel()
+            raise
+        finally:
+            entry[1] -= 1
+
+    def _forget(self, key, entry):
+        if self.calls.get(key) is entry:
+            del self.calls[key]
+        task = entry[0]
+        if not task.cancelled():
+            # Mark the exception as retrieved even if every waiter left early.
+            task.exception()
@@ -0,0 +1,74 @@
+"""
+token_bucket.py
+
+Token-bucket rate limiting.
+(c) 2025 FrozenBots
+"""
+
+import time
+import asyncio
+
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens per second refill up to `capacity`.
+
+    A request larger than the bucket is admitted once the bucket is full and
+    leaves it in debt, so oversized chunks are paced instead of rejected.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float = None):
+        now = time.monotonic() if now is None else now
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+    def set_rate(self, rate: float, capacity: float = None):
+        self._refill()
+        self.rate = float(rate)
+        if capacity is not None:
+            self.capacity = float(capacity)
+            self.tokens = min(self.tokens, self.capacity)
+
+    def try_consume(self, n: float = 1) -> float:
+        """Take `n` tokens if available and return 0, else return seconds until they will be."""
+        self._refill()
+        needed = min(n, self.capacity)
+        if self.tokens >= needed:
+            self.tokens -= n
+            return 0.0
+        if self.rate <= 0:
+            return float("inf")
+        return (needed - self.tokens) / self.rate
+
+    def time_until(self, n: float = 1) -> float:
+        """Seconds until `n` tokens would be available, without consuming."""
+        self._refill()
+        needed = min(n, self.capacity)
+        if self.tokens >= needed:
+            return 0.0
+        if self.rate <= 0:
+            return float("inf")
+        return (needed - self.tokens) / self.rate
+
+    async def acquire(self, n: float = 1):
+        while True:
+            wait = self.try_consume(n)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def acquire_blocking(self, n: float = 1, max_sleep: float = 0.5):
+        """Blocking variant for worker threads; re-checks often so rate changes apply quickly."""
+        while True:
+            wait = self.try_consume(n)
+            if wait <= 0:
+                return
+            time.sleep(min(wait, max_sleep))
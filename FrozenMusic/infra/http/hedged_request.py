@@ -0,0 +1,132 @@
+"""
+hedged_request.py
+
+Hedged requests across a primary and a backup upstream.
+(c) 2025 FrozenBots
+"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from FrozenMusic.infra.pipeline.stage_pipeline import record_stage
+
+logger = logging.getLogger(__name__)
+
+HEDGE_PERCENTILE = float(os.environ.get("HEDGE_PERCENTILE", "0.9"))
+HEDGE_MIN_DELAY = float(os.environ.get("HEDGE_MIN_DELAY", "0.3"))
+HEDGE_MAX_DELAY = float(os.environ.get("HEDGE_MAX_DELAY", "5"))
+# Used until the primary has answered HEDGE_MIN_SAMPLES times.
+HEDGE_DEFAULT_DELAY = float(os.environ.get("HEDGE_DEFAULT_DELAY", "1.5"))
+HEDGE_MIN_SAMPLES = 5
+LATENCY_WINDOW_SIZE = 100
+
+
+class LatencyWindow:
+    """The most recent `size` latency samples, in seconds."""
+
+    def __init__(self, size=LATENCY_WINDOW_SIZE):
+        self.samples = deque(maxlen=size)
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, q: float):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+    def __len__(self):
+        return len(self.samples)
+
+
+class HedgeFailed(Exception):
+    def __init__(self, errors: dict):
+        super().__init__("; ".join(f"{name}: {err}" for name, err in errors.items()))
+        self.errors = errors
+
+
+class HedgedCall:
+    """
+    Call `primary`; if it has not answered within the hedge delay (its recent
+    p90 latency, clamped) or fails first, call `backup` as well. The first
+    acceptable answer wins and the other call is cancelled.
+
+    An answer rejected by `acceptable` (e.g. "nothing found") does not win
+    outright; it is only returned if the other side fails or is no better.
+    """
+
+    def __init__(self, name: str, primary, backup, acceptable=None):
+        self.name = name
+        self.primary = primary
+        self.backup = backup
+        self.acceptable = acceptable or (lambda result: True)
+        self.latency = {"primary": LatencyWindow(), "backup": LatencyWindow()}
+        self.wins = {"primary": 0, "backup": 0}
+        self.hedged = 0
+
+    def delay(self) -> float:
+        window = self.latency["primary"]
+        if len(window) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        return min(max(window.percentile(HEDGE_PERCENTILE), HEDGE_MIN_DELAY), HEDGE_MAX_DELAY)
+
+    def _launch(self, side: str, fn, *args):
+        started = time.perf_counter()
+
+        async def call():
+            try:
+                result = await fn(*args)
+            except asyncio.CancelledError:
+                # A loser was at least this slow; keep it in the window so the
+                # delay still tracks an upstream that never wins.
+                self.latency[side].record(time.perf_counter() - started)
+                raise
+            elapsed = time.perf_counter() - started
+            self.latency[side].record(elapsed)
+            record_stage(f"{self.name}.{side}", elapsed)
+            return result
+
+        task = asyncio.ensure_future(call())
+        task.side = side
+        return task
+
+    async def __call__(self, *args):
+        pending = {self._launch("primary", self.primary, *args)}
+        errors, fallback = {}, None
+        backup_started = False
+        try:
+            while pending:
+                timeout = None if backup_started else self.delay()
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        errors[task.side] = e
+                        continue
+                    if self.acceptable(result):
+                        self.wins[task.side] += 1
+                        return result
+                    if fallback is None:
+                        fallback = result
+                if not backup_started:
+                    # Either the delay expired or the primary already answered badly.
+                    backup_started = True
+                    self.hedged += 1
+                    pending.add(self._launch("backup", self.backup, *args))
+        finally:
+            for task in pending:
+                task.cancel()
+        if fallback is not None:
+            return fallback
+        raise HedgeFailed(errors)
+
+    def stats(self) -> dict:
+        return {
+            "delay_s": round(self.delay(), 3),
+            "hedged": self.hedged,
+            "wins": dict(self.wins),
+        }
@@ -0,0 +1,75 @@
+"""
+session_pool.py
+
+Application-wide pooled aiohttp sessions, one per upstream.
+(c) 2025 FrozenBots
+"""
+
+import os
+import asyncio
+import logging
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+HTTP_LIMIT_PER_HOST = int(os.environ.get("HTTP_LIMIT_PER_HOST", "16"))
+HTTP_DNS_TTL = int(os.environ.get("HTTP_DNS_TTL", "300"))
+HTTP_KEEPALIVE = float(os.environ.get("HTTP_KEEPALIVE", "60"))
+
+# Per-upstream timeouts (seconds); each can be overridden from the environment.
+UPSTREAM_TIMEOUTS = {
+    "search": aiohttp.ClientTimeout(
+        total=float(os.environ.get("SEARCH_TIMEOUT", "60")), sock_connect=10
+    ),
+    "backup_search": aiohttp.ClientTimeout(
+        total=float(os.environ.get("BACKUP_SEARCH_TIMEOUT", "30")), sock_connect=10
+    ),
+    "local": aiohttp.ClientTimeout(total=10),
+}
+
+
+class HttpSessionPool:
+    """
+    Holds one long-lived ClientSession per upstream so every request reuses
+    pooled keep-alive connections and cached DNS answers instead of paying a
+    fresh DNS lookup, TCP and TLS handshake.
+    """
+
+    def __init__(self, timeouts=UPSTREAM_TIMEOUTS):
+        self.timeouts = timeouts
+        self.sessions = {}
+
+    def _new_session(self, upstream: str) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit_per_host=HTTP_LIMIT_PER_HOST,
+            use_dns_cache=True,
+            ttl_dns_cache=HTTP_DNS_TTL,
+            keepalive_timeout=HTTP_KEEPALIVE,
+        )
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=self.timeouts.get(upstream, aiohttp.ClientTimeout(total=60)),
+        )
+
+    async def start(self):
+        for upstream in self.timeouts:
+            self.session(upstream)
+        logger.info(f"HTTP session pool ready: {', '.join(self.sessions)}")
+
+    def session(self, upstream: str) -> aiohttp.ClientSession:
+        """Return the pooled session for `upstream`, creating it on first use."""
+        session = self.sessions.get(upstream)
+        if session is None or session.closed:
+            session = self._new_session(upstream)
+            self.sessions[upstream] = session
+        return session
+
+    def timeout(self, upstream: str) -> aiohttp.ClientTimeout:
+        return self.timeouts.get(upstream, aiohttp.ClientTimeout(total=60))
+
+    async def close(self):
+        sessions, self.sessions = list(self.sessions.values()), {}
+        await asyncio.gather(*(s.close() for s in sessions if not s.closed), return_exceptions=True)
+
+
+http_pool = HttpSessionPool()
@@ -0,0 +1,265 @@
+"""
+upstream_health.py
+
+Per-upstream health tracking and circuit breaking.
+(c) 2025 FrozenBots
+"""
+
+import os
+import time
+import asyncio
+import logging
+import functools
+from collections import deque
+from contextlib import asynccontextmanager
+from FrozenMusic.infra.http.session_pool import http_pool
+from FrozenMusic.infra.http.hedged_request import LatencyWindow
+
+logger = logging.getLogger(__name__)
+
+CIRCUIT_WINDOW = int(os.environ.get("CIRCUIT_WINDOW", "50"))
+CIRCUIT_MIN_CALLS = int(os.environ.get("CIRCUIT_MIN_CALLS", "10"))
+CIRCUIT_ERROR_RATE = float(os.environ.get("CIRCUIT_ERROR_RATE", "0.5"))
+# This many failures in a row open the circuit regardless of the error rate.
+CIRCUIT_CONSECUTIVE_FAILURES = int(os.environ.get("CIRCUIT_CONSECUTIVE_FAILURES", "5"))
+CIRCUIT_OPEN_SECONDS = float(os.environ.get("CIRCUIT_OPEN_SECONDS", "30"))
+CIRCUIT_MAX_OPEN_SECONDS = float(os.environ.get("CIRCUIT_MAX_OPEN_SECONDS", "600"))
+PROBE_INTERVAL = float(os.environ.get("UPSTREAM_PROBE_INTERVAL", "10"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpen(Exception):
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"{name} is unavailable (circuit open, retrying in {int(retry_in)}s)")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class _Call:
+    """Clock for one tracked call; `begin` restarts it once local waiting is over."""
+
+    __slots__ = ("started",)
+
+    def __init__(self):
+        self.started = time.perf_counter()
+
+    def begin(self):
+        self.started = time.perf_counter()
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+
+class UpstreamHealth:
+    """
+    Rolling health of one upstream with a closed / open / half-open circuit.
+
+    The circuit opens when the error rate over the last CIRCUIT_WINDOW calls
+    reaches CIRCUIT_ERROR_RATE, or after CIRCUIT_CONSECUTIVE_FAILURES failures
+    in a row; while open, calls fail immediately with CircuitOpen. Once the
+    open period has passed, a background probe (or, without one, a single
+    trial call) decides whether to close it again or to reopen it for twice
+    as long.
+    """
+
+    def __init__(self, name: str, probe=None):
+        self.name = name
+        self.probe = probe
+        self.outcomes = deque(maxlen=CIRCUIT_WINDOW)
+        self.latency = LatencyWindow()
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.open_seconds = CIRCUIT_OPEN_SECONDS
+        self.open_until = 0.0
+        self.trial_running = False
+
+    # ─── State ──────────────────────────────────────────────────────
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def score(self) -> float:
+        """0 (dead) … 1 (healthy): success rate discounted by slow p90 latency."""
+        if self.state == OPEN:
+            return 0.0
+        p90 = self.latency.percentile(0.9) or 0.0
+        return round((1 - self.error_rate()) / (1 + p90 / 10), 3)
+
+    def allow(self) -> bool:
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            if time.monotonic() < self.open_until or self.probe is not None:
+                # With a probe, only the probe may test a recovering upstream.
+                return False
+            self.state = HALF_OPEN
+        if self.trial_running:
+            return False
+        self.trial_running = True
+        return True
+
+    def _open(self):
+        if self.state == HALF_OPEN:
+            self.open_seconds = min(self.open_seconds * 2, CIRCUIT_MAX_OPEN_SECONDS)
+        self.state = OPEN
+        self.open_until = time.monotonic() + self.open_seconds
+        self.trial_running = False
+        logger.warning(
+            f"Upstream {self.name} circuit opened for {int(self.open_seconds)}s "
+            f"(error rate {self.error_rate():.0%}, {self.consecutive_failures} consecutive failures)"
+        )
+
+    def _close(self):
+        if self.state != CLOSED:
+            logger.info(f"Upstream {self.name} circuit closed")
+        self.state = CLOSED
+        self.open_seconds = CIRCUIT_OPEN_SECONDS
+        self.consecutive_failures = 0
+        self.trial_running = False
+        self.outcomes.clear()
+
+    # ─── Outcomes ───────────────────────────────────────────────────
+    def record_success(self, seconds: float):
+        self.latency.record(seconds)
+        self.outcomes.append(True)
+        self.consecutive_failures = 0
+        if self.state != CLOSED:
+            self._close()
+
+    def record_failure(self, seconds: float = None):
+        if seconds is not None:
+            self.latency.record(seconds)
+        self.outcomes.append(False)
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN:
+            self._open()
+        elif self.state == CLOSED and (
+            self.consecutive_failures >= CIRCUIT_CONSECUTIVE_FAILURES
+            or (len(self.outcomes) >= CIRCUIT_MIN_CALLS and self.error_rate() >= CIRCUIT_ERROR_RATE)
+        ):
+            self._open()
+
+    def _abandon(self):
+        # A cancelled or caller-side failure says nothing about the upstream.
+        if self.state == HALF_OPEN:
+            self.state = OPEN
+        self.trial_running = False
+
+    @asynccontextmanager
+    async def track(self, ignore=None):
+        """
+        Guard one call: raise CircuitOpen if the upstream is known bad, else
+        record the outcome of the enclosed block. Exceptions for which
+        `ignore(exc)` is true are not held against the upstream. The block
+        gets a call clock; one that queues before reaching the upstream calls
+        `begin()` on it so only the upstream's own time is recorded.
+        """
+        if not self.allow():
+            raise CircuitOpen(self.name, max(self.open_until - time.monotonic(), 0))
+        call = _Call()
+        try:
+            yield call
+        except asyncio.CancelledError:
+            self._abandon()
+            raise
+        except Exception as e:
+            if ignore is not None and ignore(e):
+                self._abandon()
+            else:
+                self.record_failure(call.elapsed())
+            raise
+        self.record_success(call.elapsed())
+
+    def guard(self, fn):
+        """Decorator form of `track` for coroutine functions."""
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            async with self.track():
+                return await fn(*args, **kwargs)
+        return wrapper
+
+    # ─── Probing ────────────────────────────────────────────────────
+    async def run_probe(self):
+        if self.state != OPEN or self.probe is None or time.monotonic() < self.open_until:
+            return
+        self.state = HALF_OPEN
+        self.trial_running = True
+        started = time.perf_counter()
+        try:
+            ok = await self.probe()
+        except Exception as e:
+            logger.info(f"Probe of {self.name} failed: {e}")
+            ok = False
+        if ok:
+            self.record_success(time.perf_counter() - started)
+        else:
+            self.record_failure()
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state,
+            "score": self.score(),
+            "error_rate": round(self.error_rate(), 3),
+            "calls": len(self.outcomes),
+            "p50_s": self.latency.percentile(0.5),
+            "p90_s": self.latency.percentile(0.9),
+            "p99_s": self.latency.percentile(0.99),
+            "retry_in_s": round(max(self.open_until - time.monotonic(), 0), 1) if self.state == OPEN else 0,
+        }
+
+
+def http_probe(url_fn, upstream: str):
+    """
+    A probe that succeeds when a GET on `url_fn()` gets any non-5xx answer,
+    sent through `upstream`'s own pooled session and timeouts.
+    """
+    async def probe() -> bool:
+        url = url_fn()
+        if not url:
+            return False
+        async with http_pool.session(upstream).get(url, allow_redirects=False) as resp:
+            return resp.status < 500
+    return probe
+
+
+class UpstreamRegistry:
+    def __init__(self):
+        self.upstreams = {}
+        self._task = None
+
+    def register(self, name: str, probe=None) -> UpstreamHealth:
+        health = self.upstreams.get(name)
+        if health is None:
+            health = self.upstreams[name] = UpstreamHealth(name, probe)
+        elif probe is not None:
+            health.probe = probe
+        return health
+
+    def get(self, name: str) -> UpstreamHealth:
+        return self.register(name)
+
+    async def _probe_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.gather(
+                *(h.run_probe() for h in self.upstreams.values()), return_exceptions=True
+            )
+
+    def start(self, interval: float = PROBE_INTERVAL):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_event_loop().create_task(self._probe_loop(interval))
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def snapshot(self) -> dict:
+        return {name: h.snapshot() for name, h in self.upstreams.items()}
+
+
+upstreams = UpstreamRegistry()
@@ -0,0 +1,122 @@
+"""
+stage_pipeline.py
+
+Named, individually timed pipeline stages with per-stage latency histograms.
+(c) 2025 FrozenBots
+"""
+
+import os
+import time
+import math
+from contextlib import asynccontextmanager
+
+# Stages that only burn time without contributing to the result. They stay
+# wired into their pipelines but are skipped unless removed from this list.
+DEFAULT_DISABLED_STAGES = (
+    "transport.entropy_pool,transport.payload_transform,transport.layer_check,"
+    "transport.vector_stabilize,search.sync_validate,backup_search.state_validate,"
+    "text.glyph_stabilize"
+)
+PIPELINE_DISABLED_STAGES = {
+    name.strip()
+    for name in os.environ.get("PIPELINE_DISABLED_STAGES", DEFAULT_DISABLED_STAGES).split(",")
+    if name.strip()
+}
+
+HISTOGRAM_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, math.inf)
+
+
+class StageHistogram:
+    """Fixed-bucket latency histogram in milliseconds."""
+
+    def __init__(self, buckets=HISTOGRAM_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, seconds: float):
+        ms = seconds * 1000
+        for i, bound in enumerate(self.buckets):
+            if ms <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, q: float) -> float:
+        """Upper bound (ms) of the bucket holding the q-th quantile."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= target:
+                return round(min(bound, self.max_ms), 2)
+        return self.max_ms
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_ms / self.count, 2) if self.count else 0.0,
+            "p50_ms": self.percentile(0.5),
+            "p90_ms": self.percentile(0.9),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": round(self.max_ms, 2),
+        }
+
+
+STAGE_TIMINGS = {}
+
+
+def stage_enabled(name: str) -> bool:
+    return name not in PIPELINE_DISABLED_STAGES
+
+
+def record_stage(name: str, seconds: float):
+    hist = STAGE_TIMINGS.get(name)
+    if hist is None:
+        hist = STAGE_TIMINGS[name] = StageHistogram()
+    hist.record(seconds)
+
+
+@asynccontextmanager
+async def timed_stage(name: str):
+    """Time the enclosed block into the histogram for `name`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+def timing_snapshot() -> dict:
+    return {name: hist.snapshot() for name, hist in sorted(STAGE_TIMINGS.items())}
+
+
+class Pipeline:
+    """
+    Runs named async stages in order against a shared context dict.
+
+    A stage returns None to pass control on, or a value to finish the
+    pipeline early with that result. Disabled stages are skipped entirely.
+    """
+
+    def __init__(self, name: str, stages):
+        self.name = name
+        self.stages = list(stages)
+
+    async def run(self, ctx: dict):
+        async with timed_stage(f"{self.name}.total"):
+            for stage_name, stage in self.stages:
+                full_name = f"{self.name}.{stage_name}"
+                if not stage_enabled(full_name):
+                    continue
+                async with timed_stage(full_name):
+                    result = await stage(ctx)
+                if result is not None:
+                    return result
+        return None
@@ -0,0 +1,440 @@
+"""
+bot_store.py
+
+Async persistence for the bot: the broadcast registry and chat queues,
+with MongoDB, PostgreSQL and SQLite backends.
+(c) 2025 FrozenBots
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+
+logger = logging.getLogger(__name__)
+
+# Backend selection: mongodb://, mongodb+srv://, postgres(ql)://, sqlite:///path
+# (`sqlite://` alone is in-memory). Falls back to the MongoDB_url setting.
+STORAGE_URL = os.environ.get("STORAGE_URL") or os.environ.get("MongoDB_url")
+STORAGE_DATABASE = os.environ.get("STORAGE_DATABASE", "music_bot")
+STORAGE_POOL_MIN = int(os.environ.get("STORAGE_POOL_MIN", "1"))
+STORAGE_POOL_MAX = int(os.environ.get("STORAGE_POOL_MAX", "20"))
+
+
+class BotStore(ABC):
+    """
+    Abstract backend interface. Every method is a coroutine, so a slow database round
+    trip suspends only the handler waiting on it, never the event loop.
+
+    Broadcast chats are `{"chat_id": int, "type": str}` records. Chat queues
+    are stored as their encoded list (see `ChatQueue.to_list`); writing an
+    empty list deletes the chat's queue.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    async def open(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def close(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def has_chat(self, chat_id: int) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def add_chat(self, chat_id: int, chat_type: str):
+        """Register a chat for broadcasts. Idempotent: an existing registration is left as is."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def remove_chat(self, chat_id: int):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def count_chats(self) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def iter_chats(self, after: int = None):
+        """
+        Async iterator over registered broadcast chats in ascending chat ID
+        order, streamed from the database. With `after`, starts past that ID,
+        so an interrupted pass can pick up where it stopped.
+        """
+        raise NotImplementedError
+
+    async def iter_chat_ids(self):
+        """Async iterator over just the registered chat IDs."""
+        async for chat in self.iter_chats():
+            yield chat["chat_id"]
+
+    @abstractmethod
+    async def load_broadcast_job(self):
+        """The checkpointed broadcast job, or None."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def save_broadcast_job(self, job: dict):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def load_queues(self) -> dict:
+        """Persisted queues by chat ID, skipping chats whose queue is empty."""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def write_queues(self, queues: dict):
+        """Replace the stored queue of each chat in `queues`; an empty list deletes it."""
+        raise NotImplementedError
+
+    async def take_legacy_state(self):
+        """Remove and return the pre-per-chat state backup document, if the backend has one."""
+        return None
+
+
+class MongoBotStore(BotStore):
+    """MongoDB through PyMongo's asyncio client, which keeps its own connection pool."""
+
+    name = "mongodb"
+
+    def __init__(self, url: str, database=STORAGE_DATABASE, pool_size=STORAGE_POOL_MAX):
+        self.url = url
+        self.database = database
+        self.pool_size = pool_size
+        self.client = None
+        self.db = None
+
+    async def open(self):
+        if self.client is not None:
+            return
+        from pymongo import AsyncMongoClient
+        self.client = AsyncMongoClient(self.url, maxPoolSize=self.pool_size)
+        self.db = self.client[self.database]
+        await self._ensure_broadcast_index()
+
+    async def _ensure_broadcast_index(self):
+        from pymongo.errors import DuplicateKeyError
+        broadcast = self.db["broadcast"]
+        try:
+            await broadcast.create_index("chat_id", unique=True)
+            return
+        except DuplicateKeyError:
+            pass
+        # Registrations from before the index existed can hold duplicates; keep the oldest of each.
+        removed = 0
+        async for group in await broadcast.aggregate([
+            {"$group": {"_id": "$chat_id", "ids": {"$push": "$_id"}, "n": {"$sum": 1}}},
+            {"$match": {"n": {"$gt": 1}}},
+        ]):
+            result = await broadcast.delete_many({"_id": {"$in": sorted(group["ids"])[1:]}})
+            removed += result.deleted_count
+        logger.info(f"Removed {removed} duplicate broadcast registrations")
+        await broadcast.create_index("chat_id", unique=True)
+
+    async def close(self):
+        client, self.client, self.db = self.client, None, None
+        if client is not None:
+            await client.close()
+
+    async def has_chat(self, chat_id: int) -> bool:
+        return await self.db["broadcast"].find_one({"chat_id": chat_id}, {"_id": 1}) is not None
+
+    async def add_chat(self, chat_id: int, chat_type: str):
+        from pymongo.errors import DuplicateKeyError
+        try:
+            await self.db["broadcast"].update_one(
+                {"chat_id": chat_id}, {"$setOnInsert": {"type": chat_type}}, upsert=True
+            )
+        except DuplicateKeyError:
+            # Lost an upsert race against a concurrent registration of the same chat.
+            pass
+
+    async def remove_chat(self, chat_id: int):
+        await self.db["broadcast"].delete_one({"chat_id": chat_id})
+
+    async def count_chats(self) -> int:
+        return await self.db["broadcast"].estimated_document_count()
+
+    async def iter_chats(self, after: int = None):
+        query = {} if after is None else {"chat_id": {"$gt": after}}
+        cursor = self.db["broadcast"].find(query, {"_id": 0, "chat_id": 1, "type": 1}).sort("chat_id", 1)
+        async for doc in cursor:
+            yield doc
+
+    async def iter_chat_ids(self):
+        # Answered from the unique index alone.
+        async for doc in self.db["broadcast"].find({}, {"_id": 0, "chat_id": 1}).hint("chat_id_1"):
+            yield doc["chat_id"]
+
+    async def load_queues(self) -> dict:
+        cursor = self.db["chat_queues"].find({"q.0": {"$exists": True}}, {"q": 1})
+        return {doc["_id"]: doc["q"] async for doc in cursor}
+
+    async def write_queues(self, queues: dict):
+        from pymongo import ReplaceOne, DeleteOne
+        now = time.time()
+        ops = [
+            ReplaceOne({"_id": chat_id}, {"_id": chat_id, "q": q, "u": now}, upsert=True) if q
+            else DeleteOne({"_id": chat_id})
+            for chat_id, q in queues.items()
+        ]
+        if ops:
+            await self.db["chat_queues"].bulk_write(ops, ordered=False)
+
+    async def take_legacy_state(self):
+        return await self.db["state_backup"].find_one_and_delete({"_id": "singleton"})
+
+    async def load_broadcast_job(self):
+        return await self.db["broadcast_jobs"].find_one({"_id": "current"}, {"_id": 0})
+
+    async def save_broadcast_job(self, job: dict):
+        await self.db["broadcast_jobs"].replace_one({"_id": "current"}, {"_id": "current", **job}, upsert=True)
+
+
+POSTGRES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS broadcast (
+    chat_id BIGINT PRIMARY KEY,
+    type    TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chat_queues (
+    chat_id BIGINT PRIMARY KEY,
+    q       JSONB NOT NULL,
+    updated DOUBLE PRECISION NOT NULL
+);
+CREATE TABLE IF NOT EXISTS broadcast_jobs (
+    id  TEXT PRIMARY KEY,
+    job JSONB NOT NULL
+);
+"""
+
+
+class PostgresBotStore(BotStore):
+    """PostgreSQL through an asyncpg connection pool."""
+
+    name = "postgres"
+
+    def __init__(self, url: str, min_size=STORAGE_POOL_MIN, max_size=STORAGE_POOL_MAX):
+        self.url = url
+        self.min_size = min_size
+        self.max_size = max_size
+        self.pool = None
+
+    async def open(self):
+        if self.pool is not None:
+            return
+        import asyncpg
+        self.pool = await asyncpg.create_pool(self.url, min_size=self.min_size, max_size=self.max_size)
+        async with self.pool.acquire() as conn:
+            await conn.execute(POSTGRES_SCHEMA)
+
+    async def close(self):
+        pool, self.pool = self.pool, None
+        if pool is not None:
+            await pool.close()
+
+    async def has_chat(self, chat_id: int) -> bool:
+        return await self.pool.fetchval("SELECT 1 FROM broadcast WHERE chat_id = $1", chat_id) is not None
+
+    async def add_chat(self, chat_id: int, chat_type: str):
+        await self.pool.execute(
+            "INSERT INTO broadcast (chat_id, type) VALUES ($1, $2) ON CONFLICT (chat_id) DO NOTHING",
+            chat_id, chat_type,
+        )
+
+    async def remove_chat(self, chat_id: int):
+        await self.pool.execute("DELETE FROM broadcast WHERE chat_id = $1", chat_id)
+
+    async def count_chats(self) -> int:
+        return await self.pool.fetchval("SELECT COUNT(*) FROM broadcast")
+
+    async def iter_chats(self, after: int = None, page: int = 1000):
+        # Keyset pages on the primary key rather than one server-side cursor,
+        # which would pin a connection and a transaction for a whole broadcast.
+        while True:
+            if after is None:
+                rows = await self.pool.fetch("SELECT chat_id, type FROM broadcast ORDER BY chat_id LIMIT $1", page)
+            else:
+                rows = await self.pool.fetch(
+                    "SELECT chat_id, type FROM broadcast WHERE chat_id > $1 ORDER BY chat_id LIMIT $2", after, page
+                )
+            for row in rows:
+                yield {"chat_id": row["chat_id"], "type": row["type"]}
+            if len(rows) < page:
+                return
+            after = rows[-1]["chat_id"]
+
+    async def load_queues(self) -> dict:
+        rows = await self.pool.fetch("SELECT chat_id, q::text AS q FROM chat_queues WHERE jsonb_array_length(q) > 0")
+        return {row["chat_id"]: json.loads(row["q"]) for row in rows}
+
+    async def write_queues(self, queues: dict):
+        now = time.time()
+        upserts = [(chat_id, json.dumps(q), now) for chat_id, q in queues.items() if q]
+        deletes = [chat_id for chat_id, q in queues.items() if not q]
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                if upserts:
+                    await conn.executemany(
+                        "INSERT INTO chat_queues (chat_id, q, updated) VALUES ($1, $2::jsonb, $3) "
+                        "ON CONFLICT (chat_id) DO UPDATE SET q = EXCLUDED.q, updated = EXCLUDED.updated",
+                        upserts,
+                    )
+                if deletes:
+                    await conn.execute("DELETE FROM chat_queues WHERE chat_id = ANY($1::bigint[])", deletes)
+
+    async def load_broadcast_job(self):
+        job = await self.pool.fetchval("SELECT job::text FROM broadcast_jobs WHERE id = 'current'")
+        return json.loads(job) if job else None
+
+    async def save_broadcast_job(self, job: dict):
+        await self.pool.execute(
+            "INSERT INTO broadcast_jobs (id, job) VALUES ('current', $1::jsonb) "
+            "ON CONFLICT (id) DO UPDATE SET job = EXCLUDED.job",
+            json.dumps(job),
+        )
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS broadcast (
+    chat_id INTEGER PRIMARY KEY,
+    type    TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chat_queues (
+    chat_id INTEGER PRIMARY KEY,
+    q       TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS broadcast_jobs (
+    id  TEXT PRIMARY KEY,
+    job TEXT NOT NULL
+);
+"""
+
+
+class SQLiteBotStore(BotStore):
+    """
+    Local SQLite file (or in-memory database) for development and tests.
+    Statements run on a worker thread, serialised by a lock.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self.db = None
+        self.lock = threading.Lock()
+
+    def _call(self, fn, *args):
+        with self.lock:
+            return fn(*args)
+
+    async def _run(self, fn, *args):
+        return await asyncio.to_thread(self._call, fn, *args)
+
+    def _open(self):
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.executescript(SQLITE_SCHEMA)
+        return db
+
+    async def open(self):
+        if self.db is None:
+            self.db = await asyncio.to_thread(self._open)
+
+    async def close(self):
+        db, self.db = self.db, None
+        if db is not None:
+            await self._run(db.close)
+
+    async def has_chat(self, chat_id: int) -> bool:
+        def query():
+            return self.db.execute("SELECT 1 FROM broadcast WHERE chat_id = ?", (chat_id,)).fetchone() is not None
+        return await self._run(query)
+
+    async def add_chat(self, chat_id: int, chat_type: str):
+        def insert():
+            with self.db:
+                self.db.execute("INSERT OR IGNORE INTO broadcast VALUES (?, ?)", (chat_id, chat_type))
+        await self._run(insert)
+
+    async def remove_chat(self, chat_id: int):
+        def delete():
+            with self.db:
+                self.db.execute("DELETE FROM broadcast WHERE chat_id = ?", (chat_id,))
+        await self._run(delete)
+
+    async def count_chats(self) -> int:
+        def query():
+            return self.db.execute("SELECT COUNT(*) FROM broadcast").fetchone()[0]
+        return await self._run(query)
+
+    async def iter_chats(self, after: int = None, page: int = 1000):
+        last = after
+        while True:
+            def fetch():
+                if last is None:
+                    return self.db.execute(
+                        "SELECT chat_id, type FROM broadcast ORDER BY chat_id LIMIT ?", (page,)
+                    ).fetchall()
+                return self.db.execute(
+                    "SELECT chat_id, type FROM broadcast WHERE chat_id > ? ORDER BY chat_id LIMIT ?", (last, page)
+                ).fetchall()
+            rows = await self._run(fetch)
+            for chat_id, chat_type in rows:
+                yield {"chat_id": chat_id, "type": chat_type}
+            if len(rows) < page:
+                return
+            last = rows[-1][0]
+
+    async def load_queues(self) -> dict:
+        def query():
+            return self.db.execute("SELECT chat_id, q FROM chat_queues").fetchall()
+        return {chat_id: json.loads(q) for chat_id, q in await self._run(query)}
+
+    async def write_queues(self, queues: dict):
+        now = time.time()
+
+        def write():
+            with self.db:
+                for chat_id, q in queues.items():
+                    if q:
+                        self.db.execute(
+                            "INSERT OR REPLACE INTO chat_queues VALUES (?, ?, ?)",
+                            (chat_id, json.dumps(q, separators=(",", ":")), now),
+                        )
+                    else:
+                        self.db.execute("DELETE FROM chat_queues WHERE chat_id = ?", (chat_id,))
+        await self._run(write)
+
+    async def load_broadcast_job(self):
+        def query():
+            return self.db.execute("SELECT job FROM broadcast_jobs WHERE id = 'current'").fetchone()
+        row = await self._run(query)
+        return json.loads(row[0]) if row else None
+
+    async def save_broadcast_job(self, job: dict):
+        def write():
+            with self.db:
+                self.db.execute("INSERT OR REPLACE INTO broadcast_jobs VALUES ('current', ?)", (json.dumps(job),))
+        await self._run(write)
+
+
+def create_bot_store(url=STORAGE_URL, database=STORAGE_DATABASE) -> BotStore:
+    """Pick the backend from the URL scheme. Connections are made by `open()`."""
+    if not url:
+        raise ValueError("no storage URL configured (set STORAGE_URL or MongoDB_url)")
+    if url.startswith(("mongodb://", "mongodb+srv://")):
+        return MongoBotStore(url, database)
+    if url.startswith(("postgres://", "postgresql://")):
+        return PostgresBotStore(url)
+    if url.startswith("sqlite://"):
+        return SQLiteBotStore(url[len("sqlite:///"):] or ":memory:")
+    raise ValueError(f"unsupported storage URL scheme: {url.split(':', 1)[0]}")
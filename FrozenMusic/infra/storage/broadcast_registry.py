@@ -0,0 +1,70 @@
+"""
+broadcast_registry.py
+
+In-memory membership set in front of the stored broadcast registry.
+(c) 2025 FrozenBots
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class BroadcastRegistry:
+    """
+    Known broadcast chat IDs, held in a set warmed from the store at startup.
+
+    `register` answers repeat registrations from the set without touching the
+    database; only a chat not seen before costs an (idempotent) upsert. A
+    plain set is exact and, at about 70 bytes per ID, still small for a
+    million chats, so there are no false positives to fall back on. Until
+    `warm` has succeeded every registration goes to the store, which is
+    still correct, just slower.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.known = set()
+        self.warmed = False
+        self.hits = 0
+        self.inserts = 0
+
+    async def warm(self):
+        known = set()
+        async for chat_id in self.store.iter_chat_ids():
+            known.add(chat_id)
+        self.known |= known
+        self.warmed = True
+        logger.info(f"Broadcast registry warmed with {len(self.known)} chats")
+
+    async def register(self, chat_id: int, chat_type: str):
+        if self.warmed and chat_id in self.known:
+            self.hits += 1
+            return
+        # Claim the ID first so concurrent /starts for the same chat write once.
+        self.known.add(chat_id)
+        try:
+            await self.store.add_chat(chat_id, chat_type)
+        except Exception:
+            self.known.discard(chat_id)
+            raise
+        self.inserts += 1
+
+    async def discard(self, chat_id: int):
+        """Forget a chat that can no longer receive broadcasts."""
+        self.known.discard(chat_id)
+        await self.store.remove_chat(chat_id)
+
+    def __contains__(self, chat_id: int) -> bool:
+        return chat_id in self.known
+
+    def __len__(self):
+        return len(self.known)
+
+    def stats(self) -> dict:
+        return {
+            "known": len(self.known),
+            "warmed": self.warmed,
+            "hits": self.hits,
+            "inserts": self.inserts,
+        }
@@ -0,0 +1,119 @@
+"""
+queue_store.py
+
+Write-behind persistence of per-chat playback queues.
+(c) 2025 FrozenBots
+"""
+
+import os
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Mutations within this window are coalesced into one write per chat.
+QUEUE_FLUSH_DELAY = float(os.environ.get("QUEUE_FLUSH_DELAY", "2"))
+QUEUE_FLUSH_BATCH = int(os.environ.get("QUEUE_FLUSH_BATCH", "500"))
+QUEUE_FLUSH_MAX_BACKOFF = 60
+
+
+class QueueStore:
+    """
+    Mirrors chat queues into the bot store, one record per chat.
+
+    Callers only `mark` a chat as changed. A background task waits
+    QUEUE_FLUSH_DELAY after the first mark, snapshots every marked chat's
+    current queue through `snapshot(chat_id)` (an encoded list, empty when
+    the queue is gone) and hands them to `store.write_queues` in batches: a
+    non-empty queue replaces the stored one, an empty one deletes it.
+    However often a chat changes inside the window, it costs one write.
+    Failed flushes are retried with back-off; the chats stay marked until
+    written.
+    """
+
+    def __init__(self, store, snapshot, delay=QUEUE_FLUSH_DELAY, batch=QUEUE_FLUSH_BATCH):
+        self.store = store
+        self.snapshot = snapshot
+        self.delay = delay
+        self.batch = batch
+        self.dirty = set()
+        self._wakeup = None
+        self._task = None
+        self.writes = 0
+        self.flushes = 0
+        self.failures = 0
+
+    def mark(self, chat_id: int):
+        self.dirty.add(chat_id)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def flush(self, chat_ids=()):
+        """
+        Write every marked chat, plus `chat_ids`, now. On failure or
+        cancellation the chats are marked again and the error re-raised.
+        """
+        chat_ids, self.dirty = self.dirty | set(chat_ids), set()
+        if not chat_ids:
+            return
+        # Snapshot everything up front, so the write reflects one moment.
+        queues = {chat_id: self.snapshot(chat_id) for chat_id in chat_ids}
+        items = list(queues.items())
+        try:
+            for i in range(0, len(items), self.batch):
+                await self.store.write_queues(dict(items[i:i + self.batch]))
+        except asyncio.CancelledError:
+            self.dirty |= chat_ids
+            raise
+        except Exception:
+            self.dirty |= chat_ids
+            self.failures += 1
+            raise
+        self.writes += len(items)
+        self.flushes += 1
+
+    async def _run(self):
+        backoff = self.delay
+        while True:
+            await self._wakeup.wait()
+            await asyncio.sleep(self.delay)
+            self._wakeup.clear()
+            try:
+                await self.flush()
+                backoff = self.delay
+            except Exception as e:
+                logger.warning(f"Queue persistence failed, retrying in {backoff:.0f}s: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, QUEUE_FLUSH_MAX_BACKOFF)
+                self._wakeup.set()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            if self.dirty:
+                self._wakeup.set()
+            self._task = asyncio.get_event_loop().create_task(self._run())
+
+    async def close(self):
+        """Stop the background task and write whatever is still marked."""
+        if self._task is not None:
+            # Wait for the cancelled task, so a flush it was in puts its chats back first.
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.warning(f"Final queue flush failed: {e}")
+
+    async def load(self) -> dict:
+        """Persisted queues by chat ID, skipping chats whose queue is empty."""
+        return await self.store.load_queues()
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self.dirty),
+            "flushes": self.flushes,
+            "writes": self.writes,
+            "failures": self.failures,
+        }
@@ -0,0 +1,145 @@
+"""
+adaptive_writer.py
+
+Throughput-adaptive chunked download writer with large buffered writes.
+(c) 2025 FrozenBots
+"""
+
+import os
+import time
+
+MIN_CHUNK_BYTES = 16 * 1024
+MAX_CHUNK_BYTES = 1024 * 1024
+INITIAL_CHUNK_BYTES = 64 * 1024
+TARGET_READ_INTERVAL = 0.05
+WRITE_BUFFER_BYTES = int(os.environ.get("DOWNLOAD_WRITE_BUFFER", str(1024 * 1024)))
+WRITE_FLUSH_INTERVAL = 0.25
+
+# Total download bandwidth in bytes/s, split evenly between the downloads running in
+# the media worker pool (see MediaWorkerPool._rebalance); 0 = unlimited.
+DOWNLOAD_BANDWIDTH_BPS = float(os.environ.get("DOWNLOAD_BANDWIDTH_BPS", "0"))
+
+
+class AdaptiveChunkSizer:
+    """
+    Picks the next read size from an EWMA of measured throughput so one read
+    takes roughly TARGET_READ_INTERVAL: fast links get large reads (fewer
+    event-loop wakeups), slow ones small reads (steady progress).
+    """
+
+    def __init__(self, initial=INITIAL_CHUNK_BYTES, minimum=MIN_CHUNK_BYTES, maximum=MAX_CHUNK_BYTES, alpha=0.3):
+        self.size = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.alpha = alpha
+        self.rate = None
+
+    def observe(self, nbytes: int, seconds: float) -> int:
+        if nbytes <= 0:
+            return self.size
+        rate = nbytes / max(seconds, 1e-4)
+        self.rate = rate if self.rate is None else self.alpha * rate + (1 - self.alpha) * self.rate
+        wanted = int(self.rate * TARGET_READ_INTERVAL)
+        # Round down to a power of two to keep buffer sizes allocator-friendly.
+        size = self.minimum
+        while size * 2 <= wanted and size * 2 <= self.maximum:
+            size *= 2
+        self.size = size
+        return size
+
+
+class WriteBuffer:
+    """
+    Coalesces incoming chunks into large writes: `add` returns the bytes due
+    to be written once WRITE_BUFFER_BYTES have collected or WRITE_FLUSH_INTERVAL
+    has passed, else None. Shared by the async and the blocking writers, so
+    both flush on the same rules.
+    """
+
+    def __init__(self, buffer_bytes=WRITE_BUFFER_BYTES, flush_interval=WRITE_FLUSH_INTERVAL):
+        self.buffer_bytes = buffer_bytes
+        self.flush_interval = flush_interval
+        self.buffer = bytearray()
+        self.last_flush = time.monotonic()
+
+    def add(self, chunk: bytes):
+        self.buffer += chunk
+        if len(self.buffer) >= self.buffer_bytes or time.monotonic() - self.last_flush >= self.flush_interval:
+            return self.take()
+        return None
+
+    def take(self) -> bytes:
+        """Everything buffered so far (possibly empty)."""
+        data, self.buffer = bytes(self.buffer), bytearray()
+        self.last_flush = time.monotonic()
+        return data
+
+
+class BufferedChunkWriter:
+    """
+    Async file writer over a WriteBuffer. `on_flush(nbytes)` fires after each
+    write hits the file, so readers following the file see whole data.
+    """
+
+    def __init__(self, f, on_flush=None, buffer_bytes=WRITE_BUFFER_BYTES, flush_interval=WRITE_FLUSH_INTERVAL):
+        self.f = f
+        self.on_flush = on_flush
+        self.buffer = WriteBuffer(buffer_bytes, flush_interval)
+
+    async def write(self, chunk: bytes):
+        data = self.buffer.add(chunk)
+        if data:
+            await self._write(data)
+
+    async def flush(self):
+        data = self.buffer.take()
+        if data:
+            await self._write(data)
+
+    async def _write(self, data: bytes):
+        await self.f.write(data)
+        await self.f.flush()
+        if self.on_flush:
+            self.on_flush(len(data))
+
+
+class TransferCancelled(Exception):
+    pass
+
+
+def copy_to_file(read, path: str, on_flush=None, bucket=None, should_stop=None) -> int:
+    """
+    Copy a blocking byte source into `path` with adaptive read sizes and
+    buffered writes. `read(n)` returns up to n bytes (b"" at EOF), `bucket`
+    paces the copy via acquire_blocking() and `should_stop()` aborts it with
+    TransferCancelled.
+    """
+    sizer = AdaptiveChunkSizer()
+    buffer = WriteBuffer()
+    written = 0
+
+    def write(f, data: bytes):
+        f.write(data)
+        f.flush()
+        if on_flush:
+            on_flush(len(data))
+
+    with open(path, "wb") as f:
+        while True:
+            if should_stop is not None and should_stop():
+                raise TransferCancelled("transfer cancelled")
+            started = time.monotonic()
+            chunk = read(sizer.size)
+            if not chunk:
+                break
+            sizer.observe(len(chunk), time.monotonic() - started)
+            written += len(chunk)
+            data = buffer.add(chunk)
+            if data:
+                write(f, data)
+            if bucket is not None:
+                bucket.acquire_blocking(len(chunk))
+        data = buffer.take()
+        if data:
+            write(f, data)
+    return written
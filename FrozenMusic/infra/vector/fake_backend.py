@@ -0,0 +1,133 @@
+"""
+fake_backend.py
+
+Offline resolver backends with configurable latency and failure rate, for
+benchmarking throughput and fallback behaviour without network access.
+Run `python -m FrozenMusic.infra.vector.fake_backend --help` for the benchmark.
+(c) 2025 FrozenBots
+"""
+
+import os
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+from FrozenMusic.infra.vector.resolver_registry import resolvers
+from FrozenMusic.infra.vector.results import TrackResult, PlaylistResult
+
+FAKE_PLAYLIST_SIZE = 5
+_ID_ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_"
+
+
+def _fake_video_id(seed: str) -> str:
+    digest = hashlib.sha1(seed.encode("utf-8")).digest()
+    return "".join(_ID_ALPHABET[b % 64] for b in digest[:11])
+
+
+def _fake_track(seed: str) -> TrackResult:
+    video_id = _fake_video_id(seed)
+    seconds = 120 + int.from_bytes(hashlib.sha1(seed.encode("utf-8")).digest()[:2], "big") % 480
+    return TrackResult(
+        f"https://www.youtube.com/watch?v={video_id}",
+        f"Fake result for {seed}",
+        f"PT{seconds // 60}M{seconds % 60}S",
+        f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg",
+    )
+
+
+def make_fake_backend(latency: float = 0.05, jitter: float = 0.5, failure_rate: float = 0.0):
+    """
+    A search function answering deterministically from the query after
+    `latency` seconds (± `jitter` of it), failing with probability
+    `failure_rate`. Queries containing "playlist" return a playlist.
+    """
+    async def fake_search(query: str):
+        await asyncio.sleep(max(latency * (1 + random.uniform(-jitter, jitter)), 0))
+        if random.random() < failure_rate:
+            raise Exception("fake backend failure")
+        if "playlist" in query.lower():
+            return PlaylistResult(tuple(_fake_track(f"{query} #{i}") for i in range(FAKE_PLAYLIST_SIZE)))
+        return _fake_track(query)
+    return fake_search
+
+
+def register_fake_backends(primary_latency=None, primary_failure_rate=None,
+                           backup_latency=None, backup_failure_rate=None):
+    """
+    Register "fake" and "fake_backup" with the resolver registry and enable
+    only them. For the benchmark and tests; the bot never imports this module.
+    """
+    resolvers.register("fake", priority=900, concurrency=64, timeout=5)(make_fake_backend(
+        latency=primary_latency if primary_latency is not None
+        else float(os.environ.get("FAKE_BACKEND_LATENCY", "0.05")),
+        failure_rate=primary_failure_rate if primary_failure_rate is not None
+        else float(os.environ.get("FAKE_BACKEND_FAILURE_RATE", "0")),
+    ))
+    resolvers.register("fake_backup", priority=910, concurrency=64, timeout=5)(make_fake_backend(
+        latency=backup_latency if backup_latency is not None
+        else float(os.environ.get("FAKE_BACKUP_LATENCY", "0.2")),
+        failure_rate=backup_failure_rate if backup_failure_rate is not None
+        else float(os.environ.get("FAKE_BACKUP_FAILURE_RATE", "0")),
+    ))
+    resolvers.enabled = {"fake", "fake_backup"}
+
+
+async def benchmark(requests: int, concurrency: int, distinct: int, cached: bool) -> dict:
+    resolve = resolvers.resolve if cached else resolvers.search
+    gate = asyncio.Semaphore(concurrency)
+    latencies, failures = [], 0
+
+    async def one(i: int):
+        nonlocal failures
+        async with gate:
+            started = time.perf_counter()
+            try:
+                await resolve(f"benchmark query {i % distinct}")
+                latencies.append(time.perf_counter() - started)
+            except Exception:
+                failures += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+
+    def pct(q):
+        return round(latencies[min(int(q * len(latencies)), len(latencies) - 1)] * 1000, 2) if latencies else None
+
+    return {
+        "requests": requests,
+        "failures": failures,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 1) if elapsed else None,
+        "p50_ms": pct(0.5),
+        "p90_ms": pct(0.9),
+        "p99_ms": pct(0.99),
+        **resolvers.stats(),
+        "upstreams": {b.name: b.health.snapshot() for b in resolvers.active()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the resolver registry against fake backends.")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--distinct", type=int, default=1000, help="number of distinct queries")
+    parser.add_argument("--cached", action="store_true", help="go through the search cache")
+    parser.add_argument("--primary-latency", type=float, default=0.05)
+    parser.add_argument("--primary-failure-rate", type=float, default=0.0)
+    parser.add_argument("--backup-latency", type=float, default=0.2)
+    parser.add_argument("--backup-failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    register_fake_backends(args.primary_latency, args.primary_failure_rate,
+                           args.backup_latency, args.backup_failure_rate)
+
+    report = asyncio.run(benchmark(args.requests, args.concurrency, args.distinct, args.cached))
+    for key, value in report.items():
+        print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+resolver_registry.py
+
+Registry of search backends resolving a query to a track or playlist.
+(c) 2025 FrozenBots
+"""
+
+import os
+import asyncio
+import logging
+from FrozenMusic.infra.cache.audio_cache import audio_cache
+from FrozenMusic.infra.cache.search_cache import search_cache, cached_search, is_negative
+from FrozenMusic.infra.http.hedged_request import HedgedCall
+from FrozenMusic.infra.http.upstream_health import upstreams
+from FrozenMusic.infra.vector.results import TrackResult, coerce_result
+from FrozenMusic.infra.vector.track_index import track_index
+from FrozenMusic.infra.vector.url_classifier import classify_url, canonical_video_url, video_thumbnail
+
+logger = logging.getLogger(__name__)
+
+# Enabled backends; registered backends not listed here are ignored.
+RESOLVER_BACKENDS = [
+    name.strip()
+    for name in os.environ.get("RESOLVER_BACKENDS", "search,backup_search").split(",")
+    if name.strip()
+]
+
+
+class ResolverBackend:
+    """One registered search function with its own concurrency cap, timeout and circuit."""
+
+    def __init__(self, name: str, fn, priority: int, concurrency: int, timeout: float, probe=None):
+        self.name = name
+        self.fn = fn
+        self.priority = priority
+        self.timeout = timeout
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.health = upstreams.register(name, probe)
+
+    async def search(self, query: str):
+        async with self.health.track():
+            async with self.semaphore:
+                try:
+                    result = await asyncio.wait_for(self.fn(query), self.timeout)
+                except asyncio.TimeoutError:
+                    raise Exception(f"{self.name} timed out after {self.timeout:g}s")
+        return coerce_result(result)
+
+
+def known_track(video_id: str):
+    """
+    Metadata for a video ID we have seen before, from the search cache or the
+    audio cache, without any network call. None if neither knows it.
+    """
+    track = search_cache.track_for_video(video_id)
+    if track is not None:
+        return track
+    meta = audio_cache.meta(f"yt:{video_id}")
+    if meta.get("title") and meta.get("duration"):
+        return TrackResult(
+            canonical_video_url(video_id),
+            meta["title"],
+            meta["duration"],
+            meta.get("thumbnail") or video_thumbnail(video_id),
+        )
+    return None
+
+
+class ResolverRegistry:
+    """
+    Backends register with a priority; lower runs first. A query goes to the
+    highest-priority enabled backend, and the remaining ones, in order, are
+    hedged in behind it (see HedgedCall). Backends whose circuit is open fail
+    instantly, so routing skips them without waiting for a timeout. Answers
+    are served from the search cache when possible, a plain video URL whose
+    ID is already known skips the backends entirely, and free text that
+    confidently matches a previously played title is answered from the local
+    track index.
+    """
+
+    def __init__(self, enabled=RESOLVER_BACKENDS):
+        self.backends = {}
+        self.enabled = set(enabled)
+        self.hedge = HedgedCall("search", self._primary, self._fallback,
+                                acceptable=lambda result: not is_negative(result))
+        self.direct_hits = 0
+        self.local_hits = 0
+        self._cached_search = cached_search(self._lookup)
+
+    def register(self, name: str, priority: int = 100, concurrency: int = 8, timeout: float = 30, probe=None):
+        """Decorator registering `async fn(query)` as backend `name`. Returns `fn` unchanged."""
+        def decorator(fn):
+            self.backends[name] = ResolverBackend(name, fn, priority, concurrency, timeout, probe)
+            return fn
+        return decorator
+
+    def active(self):
+        return sorted(
+            (b for name, b in self.backends.items() if name in self.enabled),
+            key=lambda b: b.priority,
+        )
+
+    async def _primary(self, query: str):
+        backends = self.active()
+        if not backends:
+            raise Exception("no resolver backends enabled")
+        return await backends[0].search(query)
+
+    async def _fallback(self, query: str):
+        errors = []
+        for backend in self.active()[1:]:
+            try:
+                return await backend.search(query)
+            except Exception as e:
+                errors.append(f"{backend.name}: {e}")
+        raise Exception("; ".join(errors) or "no backup backend enabled")
+
+    async def resolve(self, query: str):
+        """Resolve `query` to a TrackResult or PlaylistResult."""
+        ref = classify_url(query)
+        if ref.kind == "video":
+            track = known_track(ref.video_id)
+            if track is not None:
+                self.direct_hits += 1
+                return track
+            # Every URL form of the video shares one cache entry and upstream query.
+            query = canonical_video_url(ref.video_id)
+        return await self._cached_search(query)
+
+    async def _lookup(self, query: str):
+        if "://" not in query and classify_url(query).kind is None:
+            track = await asyncio.to_thread(track_index.lookup, query)
+            if track is not None:
+                self.local_hits += 1
+                return track
+        return await self.search(query)
+
+    async def search(self, query: str):
+        """Like `resolve`, but always asks the backends."""
+        result = await self.hedge(query)
+        search_cache.remember_tracks(result)
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "backends": [b.name for b in self.active()],
+            "direct_hits": self.direct_hits,
+            "local_hits": self.local_hits,
+            "track_index": track_index.stats(),
+            "hedge": self.hedge.stats(),
+        }
+
+
+resolvers = ResolverRegistry()
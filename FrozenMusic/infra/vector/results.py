@@ -0,0 +1,42 @@
+"""
+results.py
+
+Typed search results shared by every resolver backend.
+(c) 2025 FrozenBots
+"""
+
+from typing import NamedTuple, Optional, Tuple
+
+
+class TrackResult(NamedTuple):
+    """One track. Unpacks like the old `(link, title, duration, thumbnail)` tuple."""
+    link: Optional[str]
+    title: Optional[str]
+    duration: Optional[str]  # ISO-8601, e.g. "PT3M45S"
+    thumbnail: Optional[str]
+
+
+class PlaylistResult(NamedTuple):
+    items: Tuple[TrackResult, ...]
+
+
+def coerce_result(data):
+    """Turn a backend's raw answer (API JSON, tuple or typed result) into a typed result."""
+    if isinstance(data, (TrackResult, PlaylistResult)):
+        return data
+    if isinstance(data, dict):
+        if "playlist" in data:
+            return PlaylistResult(tuple(coerce_result(item) for item in data["playlist"] or ()))
+        if "track" in data:
+            return TrackResult(*data["track"])
+        return TrackResult(data.get("link"), data.get("title"), data.get("duration"), data.get("thumbnail"))
+    return TrackResult(*data)
+
+
+def result_to_json(result):
+    if isinstance(result, PlaylistResult):
+        return {"playlist": [list(item) for item in result.items]}
+    return {"track": list(result)}
+
+
+result_from_json = coerce_result
@@ -0,0 +1,515 @@
+"""
+track_index.py
+
+Persistent full-text index over the metadata of tracks the bot has played,
+so fuzzy free-text queries can be answered without the search API.
+Run `python -m FrozenMusic.infra.vector.track_index --help` for the benchmark.
+(c) 2025 FrozenBots
+"""
+
+import os
+import re
+import math
+import queue
+import itertools
+import time
+import random
+import sqlite3
+import logging
+import argparse
+import tempfile
+import threading
+import unicodedata
+from FrozenMusic.infra.vector.results import TrackResult
+from FrozenMusic.infra.vector.url_classifier import classify_url, canonical_video_url
+
+logger = logging.getLogger(__name__)
+
+# SQLite file holding the index; empty disables it.
+TRACK_INDEX_PATH = os.environ.get(
+    "TRACK_INDEX_PATH", os.path.join(tempfile.gettempdir(), "frozen_track_index.sqlite3")
+)
+# Share of the query's trigrams a title must contain to be answered locally.
+TRACK_INDEX_THRESHOLD = float(os.environ.get("TRACK_INDEX_THRESHOLD", "0.75"))
+# The best match must beat the runner-up by this much, or the query is ambiguous.
+TRACK_INDEX_MARGIN = float(os.environ.get("TRACK_INDEX_MARGIN", "0.1"))
+# How many of the best-voted titles are scored exactly per lookup.
+TRACK_INDEX_MAX_CANDIDATES = int(os.environ.get("TRACK_INDEX_MAX_CANDIDATES", "200"))
+# Queries whose rarest trigrams still span more postings than this are too
+# generic to answer locally; they go to the search API instead.
+TRACK_INDEX_MAX_SCAN = int(os.environ.get("TRACK_INDEX_MAX_SCAN", "300000"))
+# Bounds applied by `compact`.
+TRACK_INDEX_MAX_ENTRIES = int(os.environ.get("TRACK_INDEX_MAX_ENTRIES", "1000000"))
+TRACK_INDEX_MAX_AGE = float(os.environ.get("TRACK_INDEX_MAX_AGE", str(180 * 86400)))
+TRACK_INDEX_MIN_GRAMS = 4
+# Played tracks waiting for the writer thread; more are dropped rather than block playback.
+TRACK_INDEX_WRITE_QUEUE = int(os.environ.get("TRACK_INDEX_WRITE_QUEUE", "1000"))
+SQLITE_MAX_PARAMS = 500
+REBUILD_BATCH = 50000
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    id INTEGER PRIMARY KEY,
+    video_id TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL,
+    norm TEXT NOT NULL,
+    duration TEXT NOT NULL,
+    thumbnail TEXT,
+    plays INTEGER NOT NULL DEFAULT 0,
+    last_played REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tracks_last_played ON tracks (last_played);
+CREATE TABLE IF NOT EXISTS postings (
+    gram TEXT NOT NULL,
+    track_id INTEGER NOT NULL,
+    PRIMARY KEY (gram, track_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS gram_stats (
+    gram TEXT PRIMARY KEY,
+    df INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def normalize_title(text: str) -> str:
+    """Case-folded words with punctuation and accents stripped."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(_NON_WORD.sub(" ", text.casefold()).split())
+
+
+def trigrams(norm: str) -> set:
+    """
+    Trigrams of each word padded with two leading blanks and one trailing
+    blank, so short words ("u", "of") and word starts still count.
+    """
+    grams = set()
+    for word in norm.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def _chunks(items, size=SQLITE_MAX_PARAMS):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class TrackIndex:
+    """
+    Trigram inverted index over played tracks, kept in SQLite.
+
+    A lookup scores each title by the share of the query's trigrams found in
+    the closest title word to each query word. Candidates are the titles
+    holding enough of the query's rarest trigrams to possibly reach the
+    threshold, found from those posting lists alone; the best-voted few are
+    then scored exactly. Ties on score are broken by overall similarity and
+    then by play count. A match is only returned when it clears the threshold
+    and is clearly ahead of any other title; otherwise the caller should ask
+    the search API.
+    """
+
+    def __init__(self, path=TRACK_INDEX_PATH, threshold=TRACK_INDEX_THRESHOLD, margin=TRACK_INDEX_MARGIN,
+                 max_candidates=TRACK_INDEX_MAX_CANDIDATES, max_scan=TRACK_INDEX_MAX_SCAN):
+        self.path = path
+        self.threshold = threshold
+        self.margin = margin
+        self.max_candidates = max_candidates
+        self.max_scan = max_scan
+        self.db = None
+        self.lock = threading.Lock()
+        # Held by the one rebuild or compact allowed to run at a time.
+        self.maintenance = threading.Lock()
+        self.pending = queue.Queue(maxsize=TRACK_INDEX_WRITE_QUEUE)
+        self.writer = None
+        self.dropped = 0
+        self.entries = 0
+        self.lookups = 0
+        self.hits = 0
+        self.ambiguous = 0
+
+    def open(self):
+        if not self.path or self.db is not None:
+            return
+        try:
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(SCHEMA)
+            self.entries = db.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+        except sqlite3.Error as e:
+            logger.warning(f"Track index unavailable at {self.path}: {e}")
+            return
+        self.db = db
+        self.writer = threading.Thread(target=self._write_loop, name="track-index-writer", daemon=True)
+        self.writer.start()
+        logger.info(f"Track index opened with {self.entries} tracks")
+
+    def close(self):
+        if self.writer is not None:
+            self.pending.put(None)
+            self.writer.join()
+            self.writer = None
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+    # ─── Writes ─────────────────────────────────────────────────────
+    def _index(self, track_id: int, grams):
+        self.db.executemany("INSERT OR IGNORE INTO postings VALUES (?, ?)", ((g, track_id) for g in grams))
+        self.db.executemany(
+            "INSERT INTO gram_stats VALUES (?, 1) ON CONFLICT(gram) DO UPDATE SET df = df + 1",
+            ((g,) for g in grams),
+        )
+
+    def _unindex(self, track_id: int, grams):
+        self.db.executemany("DELETE FROM postings WHERE gram = ? AND track_id = ?", ((g, track_id) for g in grams))
+        self.db.executemany("UPDATE gram_stats SET df = df - 1 WHERE gram = ?", ((g,) for g in grams))
+
+    def _record(self, track: TrackResult, now: float, plays: int = 1):
+        video_id = classify_url(track.link).video_id
+        if not video_id or not track.title or not track.duration:
+            return
+        norm = normalize_title(track.title)
+        row = self.db.execute("SELECT id, norm FROM tracks WHERE video_id = ?", (video_id,)).fetchone()
+        if row is None:
+            cursor = self.db.execute(
+                "INSERT INTO tracks (video_id, title, norm, duration, thumbnail, plays, last_played)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (video_id, track.title, norm, track.duration, track.thumbnail, plays, now),
+            )
+            self._index(cursor.lastrowid, trigrams(norm))
+            self.entries += 1
+            return
+        track_id, old_norm = row
+        self.db.execute(
+            "UPDATE tracks SET title = ?, norm = ?, duration = ?, thumbnail = ?, plays = plays + ?, last_played = ?"
+            " WHERE id = ?",
+            (track.title, norm, track.duration, track.thumbnail, plays, now, track_id),
+        )
+        if old_norm != norm:
+            old, new = trigrams(old_norm), trigrams(norm)
+            self._unindex(track_id, old - new)
+            self._index(track_id, new - old)
+
+    def record(self, track: TrackResult):
+        """Add a played track, or bump its play count. Non-YouTube links are ignored."""
+        if self.db is None:
+            return
+        try:
+            with self.lock, self.db:
+                self._record(track, time.time())
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to index {track.link}: {e}")
+
+    def record_many(self, tracks, plays: int = 1):
+        """Bulk `record` in a single transaction."""
+        if self.db is None:
+            return
+        now = time.time()
+        with self.lock, self.db:
+            for track in tracks:
+                self._record(track, now, plays)
+
+    def record_song(self, song):
+        """
+        Queue a played Track for the writer thread. Never blocks, so a
+        running rebuild or compact cannot hold up the caller.
+        """
+        if self.writer is None:
+            return
+        try:
+            self.pending.put_nowait(TrackResult(song.url, song.title, f"PT{song.duration_seconds}S", song.thumbnail))
+        except queue.Full:
+            self.dropped += 1
+
+    def _write_loop(self):
+        while True:
+            batch = [self.pending.get()]
+            while batch[-1] is not None and len(batch) < SQLITE_MAX_PARAMS:
+                try:
+                    batch.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+            tracks = [track for track in batch if track is not None]
+            try:
+                self.record_many(tracks)
+            except sqlite3.Error as e:
+                logger.warning(f"Failed to index {len(tracks)} played tracks: {e}")
+            if batch[-1] is None:
+                return
+
+    # ─── Lookup ─────────────────────────────────────────────────────
+    def _candidates(self, grams: set) -> list:
+        """IDs of the titles most likely to reach the threshold, by votes of the query's rarest trigrams."""
+        df = {}
+        for chunk in _chunks(grams):
+            marks = ",".join("?" * len(chunk))
+            df.update(self.db.execute(f"SELECT gram, df FROM gram_stats WHERE gram IN ({marks}) AND df > 0", chunk))
+        # A title may miss at most this many query trigrams; ones no title has are already missed.
+        allowed_misses = len(grams) - math.ceil(self.threshold * len(grams)) - (len(grams) - len(df))
+        if allowed_misses < 0:
+            return []
+        # Whichever trigrams vote, a title at the threshold holds all but
+        # `allowed_misses` of them; the rarest ones keep the scan short.
+        voters = sorted(df, key=df.get)[:allowed_misses + 2]
+        if sum(df[g] for g in voters) > self.max_scan:
+            return []
+        marks = ",".join("?" * len(voters))
+        rows = self.db.execute(
+            f"SELECT track_id FROM postings WHERE gram IN ({marks})"
+            " GROUP BY track_id HAVING COUNT(*) >= ? ORDER BY COUNT(*) DESC LIMIT ?",
+            (*voters, len(voters) - allowed_misses, self.max_candidates),
+        ).fetchall()
+        return [r[0] for r in rows]
+
+    def _ranked(self, query: str, limit: int):
+        query_words = [trigrams(word) for word in set(normalize_title(query).split())]
+        grams = set().union(*query_words)
+        if len(grams) < TRACK_INDEX_MIN_GRAMS:
+            return []
+        total = sum(len(word) for word in query_words)
+        scored = []
+        for chunk in _chunks(self._candidates(grams)):
+            marks = ",".join("?" * len(chunk))
+            for video_id, title, norm, duration, thumbnail, plays in self.db.execute(
+                f"SELECT video_id, title, norm, duration, thumbnail, plays FROM tracks WHERE id IN ({marks})", chunk
+            ):
+                # Each query word is matched against a single title word, so
+                # trigrams scattered over unrelated words do not add up.
+                title_words = [trigrams(word) for word in set(norm.split())]
+                score = sum(max(len(q & t) for t in title_words) for q in query_words) / total
+                if score < self.threshold:
+                    continue
+                title_grams = set().union(*title_words)
+                similarity = len(grams & title_grams) / len(grams | title_grams)
+                track = TrackResult(canonical_video_url(video_id), title, duration, thumbnail)
+                scored.append((score, similarity, plays, track))
+        scored.sort(key=lambda s: s[:3], reverse=True)
+        return scored[:limit]
+
+    def search(self, query: str, limit: int = 5) -> list:
+        """Up to `limit` (score, TrackResult) pairs at or above the threshold, best first."""
+        if self.db is None:
+            return []
+        with self.lock:
+            ranked = self._ranked(query, limit)
+        return [(round(score, 3), track) for score, _, _, track in ranked]
+
+    def lookup(self, query: str):
+        """The confidently best local match for a free-text query, or None."""
+        if self.db is None:
+            return None
+        self.lookups += 1
+        if self.maintenance.locked():
+            # A rebuild or compact holds the index for minutes; ask the search API instead.
+            return None
+        try:
+            with self.lock:
+                ranked = self._ranked(query, 2)
+        except sqlite3.Error as e:
+            logger.warning(f"Track index lookup failed: {e}")
+            return None
+        if not ranked:
+            return None
+        if len(ranked) > 1 and ranked[1][0] > ranked[0][0] - self.margin:
+            self.ambiguous += 1
+            return None
+        self.hits += 1
+        return ranked[0][3]
+
+    # ─── Maintenance ────────────────────────────────────────────────
+    def start_maintenance(self, task: str) -> bool:
+        """
+        Run `rebuild` or `compact` on a background thread. Returns False,
+        starting nothing, if the index is closed or maintenance is running.
+        """
+        run = {"rebuild": self.rebuild, "compact": self.compact}[task]
+        if self.db is None or not self.maintenance.acquire(blocking=False):
+            return False
+
+        def work():
+            try:
+                run()
+            except sqlite3.Error as e:
+                logger.warning(f"Track index {task} failed: {e}")
+            finally:
+                self.maintenance.release()
+
+        threading.Thread(target=work, name=f"track-index-{task}", daemon=True).start()
+        return True
+
+    def rebuild(self):
+        """Regenerate postings and trigram statistics from the stored titles."""
+        if self.db is None:
+            return
+        started = time.perf_counter()
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM postings")
+            self.db.execute("DELETE FROM gram_stats")
+            rows = self.db.execute("SELECT id, title FROM tracks").fetchall()
+            for batch in _chunks(rows, REBUILD_BATCH):
+                norms = [(normalize_title(title), track_id) for track_id, title in batch]
+                self.db.executemany("UPDATE tracks SET norm = ? WHERE id = ?", norms)
+                # Sorted inserts touch each gram's part of the B-tree once per batch.
+                postings = sorted((g, track_id) for norm, track_id in norms for g in trigrams(norm))
+                self.db.executemany("INSERT OR IGNORE INTO postings VALUES (?, ?)", postings)
+            self.db.execute("INSERT INTO gram_stats SELECT gram, COUNT(*) FROM postings GROUP BY gram")
+            self.entries = len(rows)
+        logger.info(f"Track index rebuilt: {self.entries} tracks in {time.perf_counter() - started:.1f}s")
+
+    def compact(self, max_entries=TRACK_INDEX_MAX_ENTRIES, max_age=TRACK_INDEX_MAX_AGE):
+        """
+        Drop tracks not played within `max_age` seconds and the least recently
+        played beyond `max_entries`, then reclaim the freed space on disk.
+        """
+        if self.db is None:
+            return 0
+        with self.lock:
+            with self.db:
+                before = self.entries
+                self.db.execute("DELETE FROM tracks WHERE last_played < ?", (time.time() - max_age,))
+                self.db.execute(
+                    "DELETE FROM tracks WHERE id IN"
+                    " (SELECT id FROM tracks ORDER BY last_played DESC LIMIT -1 OFFSET ?)",
+                    (max_entries,),
+                )
+                self.entries = self.db.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+                if self.entries != before:
+                    self.db.execute("DELETE FROM postings WHERE track_id NOT IN (SELECT id FROM tracks)")
+                    self.db.execute("DELETE FROM gram_stats")
+                    self.db.execute("INSERT INTO gram_stats SELECT gram, COUNT(*) FROM postings GROUP BY gram")
+                else:
+                    self.db.execute("DELETE FROM gram_stats WHERE df <= 0")
+            self.db.execute("VACUUM")
+        logger.info(f"Track index compacted: {before - self.entries} tracks dropped, {self.entries} kept")
+        return before - self.entries
+
+    def stats(self) -> dict:
+        return {
+            "entries": self.entries,
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "ambiguous": self.ambiguous,
+            "maintaining": self.maintenance.locked(),
+            "write_queue": self.pending.qsize(),
+            "dropped": self.dropped,
+        }
+
+
+track_index = TrackIndex()
+
+
+# ─── Benchmark ──────────────────────────────────────────────────────
+_ONSETS = "b c d f g h j k l m n p r s t v w y z bl br ch cl cr dr fl fr gl gr kn ph pl pr qu sc sh sk sl sm sn sp st sw th tr wh str".split()
+_VOWELS = "a e i o u a e i o ea ee ou ai oo au oi ie ue y".split()
+_CODAS = ["", "", "", "n", "r", "s", "t", "l", "x", "ng", "nd", "nt", "st", "ck", "ve", "ght", "rk", "mp", "sh", "th", "ll", "ss", "ch"]
+_FILLERS = ["", "", "", " (Official Video)", " (Lyrics)", " [Official Audio]", " - Live", " (Remix)"]
+_ID_ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_"
+
+
+def _synthetic_tracks(count: int, rng: random.Random):
+    """English-ish titles whose words follow a Zipf distribution, like real song names."""
+    def word():
+        return "".join(rng.choice(_ONSETS) + rng.choice(_VOWELS) for _ in range(rng.randint(1, 2))) + rng.choice(_CODAS)
+
+    vocabulary = list({word() for _ in range(60000)})
+    cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(vocabulary) + 1)))
+    artists = [" ".join(word().title() for _ in range(rng.randint(1, 2))) for _ in range(count // 20 + 1)]
+    for i in range(count):
+        video_id = "".join(_ID_ALPHABET[(i >> (6 * k)) & 63] for k in range(11))
+        name = " ".join(rng.choices(vocabulary, cum_weights=cum_weights, k=rng.randint(2, 5)))
+        title = f"{rng.choice(artists)} - {name.title()}{rng.choice(_FILLERS)}"
+        yield TrackResult(canonical_video_url(video_id), title, f"PT{rng.randint(90, 600)}S", None)
+
+
+def _fuzz(title: str, rng: random.Random) -> str:
+    """What a user might type for `title`: the song name, lower-cased, one word clipped."""
+    name = title.split(" - ", 1)[-1].split(" (")[0].split(" [")[0].lower().split()
+    i = rng.randrange(len(name))
+    if len(name[i]) > 3:
+        name[i] = name[i][:max(len(name[i]) - 2, 2)]
+    return " ".join(name)
+
+
+def benchmark(path: str, entries: int, queries: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    index = TrackIndex(path)
+    index.open()
+    if index.entries < entries:
+        started = time.perf_counter()
+        tracks = _synthetic_tracks(entries, rng)
+        # Raw inserts followed by one rebuild are far faster than `record` per track.
+        with index.lock, index.db:
+            index.db.executemany(
+                "INSERT OR IGNORE INTO tracks (video_id, title, norm, duration, thumbnail, plays, last_played)"
+                " VALUES (?, ?, '', ?, NULL, 1, ?)",
+                ((classify_url(t.link).video_id, t.title, t.duration, time.time()) for t in tracks),
+            )
+        index.rebuild()
+        print(f"built {index.entries} entries in {time.perf_counter() - started:.1f}s")
+
+    total = index.entries
+    sample = [
+        index.db.execute("SELECT video_id, title FROM tracks WHERE id = ?", (rng.randint(1, total),)).fetchone()
+        for _ in range(queries)
+    ]
+    sample = [row for row in sample if row]
+    latencies, correct, wrong, declined = [], 0, 0, 0
+    for video_id, title in sample:
+        query = _fuzz(title, rng)
+        started = time.perf_counter()
+        track = index.lookup(query)
+        latencies.append(time.perf_counter() - started)
+        if track is None:
+            declined += 1
+        elif classify_url(track.link).video_id == video_id:
+            correct += 1
+        else:
+            wrong += 1
+    miss_latencies = []
+    for _ in range(len(sample)):
+        query = " ".join("".join(rng.choice(_ONSETS) + rng.choice(_VOWELS) for _ in range(3)) for _ in range(3))
+        started = time.perf_counter()
+        index.lookup(query)
+        miss_latencies.append(time.perf_counter() - started)
+    index.close()
+
+    def pct(samples, q):
+        samples = sorted(samples)
+        return round(samples[min(int(q * len(samples)), len(samples) - 1)] * 1000, 2) if samples else None
+
+    return {
+        "entries": total,
+        "db_mb": round(os.path.getsize(path) / 2**20, 1),
+        "queries": len(sample),
+        "answered_correctly": correct,
+        "answered_wrongly": wrong,
+        "declined": declined,
+        "indexed_p50_ms": pct(latencies, 0.5),
+        "indexed_p99_ms": pct(latencies, 0.99),
+        "unknown_p50_ms": pct(miss_latencies, 0.5),
+        "unknown_p99_ms": pct(miss_latencies, 0.99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark track index lookups against synthetic titles.")
+    parser.add_argument("--path", default=os.path.join(tempfile.gettempdir(), "frozen_track_index_bench.sqlite3"),
+                        help="index file; reused if it already holds enough entries")
+    parser.add_argument("--entries", type=int, default=1000000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    report = benchmark(args.path, args.entries, args.queries, args.seed)
+    for key, value in report.items():
+        print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
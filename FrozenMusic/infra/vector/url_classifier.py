@@ -0,0 +1,80 @@
+"""
+url_classifier.py
+
+Recognises YouTube URLs and extracts their canonical video / playlist IDs.
+(c) 2025 FrozenBots
+"""
+
+import re
+import urllib.parse
+from typing import NamedTuple, Optional
+
+YOUTUBE_HOSTS = {"youtube.com", "m.youtube.com", "music.youtube.com", "youtube-nocookie.com"}
+SHORT_HOSTS = {"youtu.be"}
+
+_VIDEO_ID = re.compile(r"^[A-Za-z0-9_-]{11}$")
+_PLAYLIST_ID = re.compile(r"^[A-Za-z0-9_-]{10,}$")
+_PATH_ID = re.compile(r"^/(?:shorts|embed|live|v)/([A-Za-z0-9_-]{11})(?:[/?]|$)")
+
+
+class YouTubeRef(NamedTuple):
+    video_id: Optional[str] = None
+    playlist_id: Optional[str] = None
+
+    @property
+    def kind(self) -> Optional[str]:
+        """'playlist' when a list is referenced, else 'video'; None for non-YouTube input."""
+        if self.playlist_id:
+            return "playlist"
+        if self.video_id:
+            return "video"
+        return None
+
+
+def classify_url(text: str) -> YouTubeRef:
+    """
+    Extract IDs from every common YouTube URL form: watch?v=, youtu.be/,
+    /shorts/, /embed/, /live/, music.youtube.com and list=. Anything that is
+    not a YouTube URL yields an empty YouTubeRef.
+    """
+    text = (text or "").strip()
+    if "://" not in text:
+        text = "https://" + text
+    try:
+        parsed = urllib.parse.urlsplit(text)
+    except ValueError:
+        return YouTubeRef()
+    host = (parsed.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    params = urllib.parse.parse_qs(parsed.query)
+
+    video_id = None
+    if host in SHORT_HOSTS:
+        candidate = parsed.path.strip("/").split("/", 1)[0]
+        video_id = candidate if _VIDEO_ID.match(candidate) else None
+    elif host in YOUTUBE_HOSTS:
+        m = _PATH_ID.match(parsed.path)
+        if m:
+            video_id = m.group(1)
+        elif parsed.path.rstrip("/") == "/watch":
+            candidate = params.get("v", [""])[0]
+            video_id = candidate if _VIDEO_ID.match(candidate) else None
+    else:
+        return YouTubeRef()
+
+    playlist_id = params.get("list", [""])[0]
+    playlist_id = playlist_id if _PLAYLIST_ID.match(playlist_id) else None
+    return YouTubeRef(video_id, playlist_id)
+
+
+def canonical_video_url(video_id: str) -> str:
+    return f"https://www.youtube.com/watch?v={video_id}"
+
+
+def canonical_playlist_url(playlist_id: str) -> str:
+    return f"https://www.youtube.com/playlist?list={playlist_id}"
+
+
+def video_thumbnail(video_id: str) -> str:
+    return f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg"
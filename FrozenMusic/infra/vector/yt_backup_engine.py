@@ -1,7 +1,16 @@
-import aiohttp
+from FrozenMusic.infra.http.session_pool import http_pool
+from FrozenMusic.infra.http.upstream_health import http_probe
+from FrozenMusic.infra.pipeline.stage_pipeline import stage_enabled, timed_stage
+from FrozenMusic.infra.vector.resolver_registry import resolvers
+from FrozenMusic.infra.vector.results import coerce_result
+import os
+import asyncio
 import urllib.parse
 import random
 
+BACKUP_SEARCH_API_URL = os.environ.get("BACKUP_SEARCH_API_URL", "")
+BACKUP_SEARCH_CONCURRENCY = int(os.environ.get("BACKUP_SEARCH_CONCURRENCY", "8"))
+
 RETRY_SHARDS = [random.randint(1, 10) for _ in range(5)]
 THRESHOLD_LIMIT = 3.14
 BACKUP_STATE_POOL = {}
@@ -28,6 +37,13 @@ async def state_validator(engine: FallbackEngine, key: str) -> str:
     else:
         return f"FAIL-{key}-{tag_id}"
 
+@resolvers.register(
+    "backup_search",
+    priority=20,
+    concurrency=BACKUP_SEARCH_CONCURRENCY,
+    timeout=http_pool.timeout("backup_search").total,
+    probe=http_probe(lambda: BACKUP_SEARCH_API_URL, "backup_search"),
+)
 async def yt_backup_engine(query: str):
     """
     Handles backup YouTube vector resolution with fallback engine validation and retry shards.
@@ -35,9 +51,11 @@ async def yt_backup_engine(query: str):
     if not BACKUP_SEARCH_API_URL:
         raise Exception("Backup Search API URL not configured")
 
-    engine = FallbackEngine()
-    engine.init_pool(query)
-    await state_validator(engine, query)
+    if stage_enabled("backup_search.state_validate"):
+        async with timed_stage("backup_search.state_validate"):
+            engine = FallbackEngine()
+            engine.init_pool(query)
+            await state_validator(engine, query)
 
     backup_url = (
         f"{BACKUP_SEARCH_API_URL.rstrip('/')}"
@@ -45,18 +63,10 @@ async def yt_backup_engine(query: str):
     )
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(backup_url, timeout=30) as resp:
-                if resp.status != 200:
-                    raise Exception(f"Backup API returned status {resp.status}")
-                data = await resp.json()
-                if "playlist" in data:
-                    return data
-                return (
-                    data.get("link"),
-                    data.get("title"),
-                    data.get("duration"),
-                    data.get("thumbnail")
-                )
+        session = http_pool.session("backup_search")
+        async with session.get(backup_url) as resp:
+            if resp.status != 200:
+                raise Exception(f"Backup API returned status {resp.status}")
+            return coerce_result(await resp.json())
     except Exception as e:
         raise Exception(f"Backup Search API error: {e}")
@@ -1,6 +1,15 @@
-import aiohttp
+from FrozenMusic.infra.http.session_pool import http_pool
+from FrozenMusic.infra.http.upstream_health import http_probe
+from FrozenMusic.infra.pipeline.stage_pipeline import stage_enabled, timed_stage
+from FrozenMusic.infra.vector.resolver_registry import resolvers
+from FrozenMusic.infra.vector.results import coerce_result
+import os
 import asyncio
 import random
+import urllib.parse
+
+API_URL = os.environ.get("SEARCH_API_URL", "https://fastyoutubeapi.onrender.com/search?title=")
+SEARCH_CONCURRENCY = int(os.environ.get("SEARCH_CONCURRENCY", "16"))
 
 ASYNC_SHARD_POOL = [random.randint(50, 500) for _ in range(10)]
 VECTOR_THRESHOLD = 0.773
@@ -35,29 +44,29 @@ def quota_emulator(seed: int = 42):
     LIMITER_STATE["quota"] = quota_map
     return quota_map
 
+@resolvers.register(
+    "search",
+    priority=10,
+    concurrency=SEARCH_CONCURRENCY,
+    timeout=http_pool.timeout("search").total,
+    probe=http_probe(lambda: API_URL.split("/search", 1)[0] + "/", "search"),
+)
 async def yt_vector_orchestrator(query: str):
     """
     Handles YouTube vector resolution with rate-limit stabilization and shard allocation.
     """
-    engine = RateLimiterEngine(ASYNC_SHARD_POOL)
-    engine.allocate(query)
-    await sync_validator(engine, query)
+    if stage_enabled("search.sync_validate"):
+        async with timed_stage("search.sync_validate"):
+            engine = RateLimiterEngine(ASYNC_SHARD_POOL)
+            engine.allocate(query)
+            await sync_validator(engine, query)
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"{API_URL}{query}") as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if "playlist" in data:
-                        return data
-                    else:
-                        return (
-                            data.get("link"),
-                            data.get("title"),
-                            data.get("duration"),
-                            data.get("thumbnail")
-                        )
-                else:
-                    raise Exception(f"API returned status code {response.status}")
+        session = http_pool.session("search")
+        async with session.get(f"{API_URL}{urllib.parse.quote(query)}") as response:
+            if response.status == 200:
+                return coerce_result(await response.json())
+            else:
+                raise Exception(f"API returned status code {response.status}")
     except Exception as e:
         raise Exception(f"Vector resolution failure: {str(e)}")
@@ -0,0 +1,252 @@
+"""
+media_worker.py
+
+Child-process entry point for download and transcode jobs.
+Run as `python -m FrozenMusic.infra.workers.media_worker`: jobs arrive as JSON
+lines on stdin, progress events and results leave as JSON lines on stdout.
+(c) 2025 FrozenBots
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import shutil
+import threading
+import psutil
+import ffmpeg
+import requests
+from FrozenMusic.infra.concurrency.token_bucket import TokenBucket
+from FrozenMusic.infra.transfer.adaptive_writer import copy_to_file, TransferCancelled
+
+_out_lock = threading.Lock()
+_http = requests.Session()
+
+
+class JobError(Exception):
+    def __init__(self, message: str, kind: str = "error"):
+        super().__init__(message)
+        self.kind = kind
+
+
+def emit(msg: dict):
+    with _out_lock:
+        sys.stdout.write(json.dumps(msg) + "\n")
+        sys.stdout.flush()
+
+
+class JobContext:
+    def __init__(self, job: dict):
+        self.id = job["id"]
+        self.cancelled = False
+        self.bucket = None
+
+    def event(self, name: str, **data):
+        emit({"id": self.id, "event": name, **data})
+
+    def set_rate(self, bps: float):
+        if not bps or bps <= 0:
+            self.bucket = None
+        elif self.bucket is None:
+            self.bucket = TokenBucket(bps, bps * 0.5)
+        else:
+            self.bucket.set_rate(bps, bps * 0.5)
+
+    def acquire_blocking(self, nbytes: int):
+        # Forward to whichever bucket is current so rate changes apply mid-transfer.
+        bucket = self.bucket
+        if bucket is not None:
+            bucket.acquire_blocking(nbytes)
+
+
+def run_download(job: dict, ctx: JobContext) -> dict:
+    ctx.set_rate(job.get("rate_bps") or 0)
+    started = time.monotonic()
+    deadline = job.get("timeout")
+    timed_out = False
+
+    def should_stop():
+        nonlocal timed_out
+        if deadline and time.monotonic() - started > deadline:
+            timed_out = True
+        return ctx.cancelled or timed_out
+
+    ctx.event("started")
+    try:
+        with _http.get(
+            job["url"],
+            stream=True,
+            timeout=(job.get("connect_timeout", 15), job.get("stall_timeout", 30)),
+        ) as response:
+            if response.status_code != 200:
+                raise JobError(f"Failed to download audio. HTTP status: {response.status_code}")
+            length = response.headers.get("Content-Length", "")
+            total = int(length) if length.isdigit() else None
+            ctx.event("headers", total=total)
+            if total is not None:
+                _check_disk_space(job["path"], total, job.get("min_free_bytes", 0))
+
+            written = copy_to_file(
+                lambda n: response.raw.read(n, decode_content=True),
+                job["path"],
+                on_flush=lambda nbytes: ctx.event("progress", bytes=nbytes),
+                bucket=ctx,
+                should_stop=should_stop,
+            )
+    except TransferCancelled:
+        if timed_out:
+            raise JobError("download timed out", "timeout")
+        raise JobError("download cancelled", "cancelled")
+    except requests.Timeout:
+        raise JobError("download timed out", "timeout")
+    return {"path": job["path"], "bytes": written}
+
+
+def _check_disk_space(path: str, nbytes: int, min_free: int):
+    free = shutil.disk_usage(os.path.dirname(os.path.abspath(path))).free
+    if free - nbytes < min_free:
+        raise JobError(f"not enough disk space for {nbytes} bytes ({free} free)", "disk")
+
+
+def _run_ffmpeg(stream, ctx: JobContext) -> str:
+    """Run an ffmpeg-python graph, killing it if the job is cancelled. Returns stderr."""
+    proc = stream.run_async(cmd=["ffmpeg", "-hide_banner", "-nostdin"], quiet=True, overwrite_output=True)
+
+    def watch():
+        while proc.poll() is None:
+            if ctx.cancelled:
+                proc.kill()
+                return
+            time.sleep(0.2)
+
+    threading.Thread(target=watch, daemon=True).start()
+    _, err = proc.communicate()
+    stderr = err.decode("utf-8", "ignore")
+    if ctx.cancelled:
+        raise JobError("transcode cancelled", "cancelled")
+    if proc.returncode != 0:
+        raise JobError(f"ffmpeg exited with {proc.returncode}: {stderr[-300:]}")
+    return stderr
+
+
+def _parse_loudnorm(stderr: str) -> dict:
+    start, end = stderr.rfind("{"), stderr.rfind("}")
+    if start < 0 or end < start:
+        raise JobError("ffmpeg loudnorm produced no measurement")
+    return json.loads(stderr[start:end + 1])
+
+
+def run_transcode(job: dict, ctx: JobContext) -> dict:
+    """
+    Two-pass EBU R128 normalisation: measure the source with loudnorm, then
+    write a linear-normalised copy in the voice-chat sample rate and codec.
+    """
+    target = {"I": job.get("target_lufs", -16), "TP": job.get("true_peak", -1.5), "LRA": job.get("lra", 11)}
+
+    measure = (
+        ffmpeg.input(job["source"])
+        .audio.filter("loudnorm", print_format="json", **target)
+        .output("-", format="null")
+    )
+    measured = _parse_loudnorm(_run_ffmpeg(measure, ctx))
+
+    normalise = (
+        ffmpeg.input(job["source"])
+        .audio.filter(
+            "loudnorm",
+            measured_I=measured["input_i"],
+            measured_TP=measured["input_tp"],
+            measured_LRA=measured["input_lra"],
+            measured_thresh=measured["input_thresh"],
+            offset=measured["target_offset"],
+            linear="true",
+            **target,
+        )
+        .output(
+            job["path"],
+            format=job.get("format", "ogg"),
+            acodec=job.get("codec", "libopus"),
+            audio_bitrate=job.get("bitrate", "128k"),
+            ar=job.get("sample_rate", 48000),
+            ac=job.get("channels", 2),
+        )
+    )
+    _run_ffmpeg(normalise, ctx)
+
+    return {
+        "path": job["path"],
+        "loudness": {
+            "input_i": float(measured["input_i"]),
+            "input_tp": float(measured["input_tp"]),
+            "input_lra": float(measured["input_lra"]),
+            "target_i": float(target["I"]),
+        },
+    }
+
+
+JOB_HANDLERS = {
+    "download": run_download,
+    "transcode": run_transcode,
+}
+
+
+def _lower_priority(niceness: int):
+    try:
+        proc = psutil.Process(os.getpid())
+        if os.name == "nt":
+            proc.nice(psutil.BELOW_NORMAL_PRIORITY_CLASS if niceness < 19 else psutil.IDLE_PRIORITY_CLASS)
+        else:
+            proc.nice(niceness)
+    except Exception as e:
+        print(f"Could not lower media worker priority: {e}", file=sys.stderr)
+
+
+def main():
+    _lower_priority(int(os.environ.get("MEDIA_WORKER_NICE", "10")))
+    jobs = queue.Queue()
+    contexts = {}
+
+    def execute():
+        while True:
+            job = jobs.get()
+            if job is None:
+                return
+            ctx = contexts[job["id"]]
+            try:
+                handler = JOB_HANDLERS[job["kind"]]
+                emit({"id": job["id"], "ok": True, "result": handler(job, ctx)})
+            except JobError as e:
+                emit({"id": job["id"], "ok": False, "error": str(e), "kind": e.kind})
+            except Exception as e:
+                emit({"id": job["id"], "ok": False, "error": str(e), "kind": "error"})
+            finally:
+                contexts.pop(job["id"], None)
+
+    runner = threading.Thread(target=execute, daemon=True)
+    runner.start()
+
+    for line in sys.stdin:
+        try:
+            msg = json.loads(line)
+        except ValueError:
+            continue
+        control = msg.get("control")
+        if control == "cancel":
+            ctx = contexts.get(msg.get("id"))
+            if ctx:
+                ctx.cancelled = True
+        elif control == "rate":
+            ctx = contexts.get(msg.get("id"))
+            if ctx:
+                ctx.set_rate(msg.get("bps") or 0)
+        else:
+            contexts[msg["id"]] = JobContext(msg)
+            jobs.put(msg)
+
+    jobs.put(None)
+    runner.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+worker_pool.py
+
+Pool of low-priority child processes that run download and media jobs, so
+the bot process and its event loop stay at normal priority.
+(c) 2025 FrozenBots
+"""
+
+import os
+import sys
+import json
+import asyncio
+import logging
+import itertools
+from FrozenMusic.infra.transfer.adaptive_writer import DOWNLOAD_BANDWIDTH_BPS
+
+logger = logging.getLogger(__name__)
+
+MEDIA_WORKERS = int(os.environ.get("MEDIA_WORKERS", "2"))
+MEDIA_WORKER_NICE = int(os.environ.get("MEDIA_WORKER_NICE", "10"))
+MEDIA_JOB_QUEUE_SIZE = int(os.environ.get("MEDIA_JOB_QUEUE_SIZE", "32"))
+# Workers that only take playback-critical jobs, so a download never waits behind transcodes.
+MEDIA_RESERVED_WORKERS = int(os.environ.get("MEDIA_RESERVED_WORKERS", "1"))
+# Job kinds nobody is waiting on to start playback; they run only when no download is queued.
+BACKGROUND_KINDS = {"transcode"}
+WORKER_MODULE = "FrozenMusic.infra.workers.media_worker"
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+
+class WorkerJobError(Exception):
+    def __init__(self, message: str, kind: str = "error"):
+        super().__init__(message)
+        self.kind = kind
+
+
+class _Worker:
+    def __init__(self, index: int):
+        self.index = index
+        self.proc = None
+        self.job = None
+        self.sent = False
+
+
+class MediaWorkerPool:
+    """
+    Runs jobs in `size` child processes fed from two bounded job queues.
+
+    Playback-critical jobs (downloads) always go first. Background jobs
+    (BACKGROUND_KINDS, such as loudness transcodes) are taken only when no
+    download is waiting, and never by the first `reserved` workers, so a
+    download always finds a worker that is not tied up in a long
+    transcode. Each child handles one job at a time at its own niceness,
+    streams progress events back over stdout, and is respawned if it dies.
+    Download jobs share DOWNLOAD_BANDWIDTH_BPS evenly; rates are pushed to
+    the children whenever a job starts or finishes.
+    """
+
+    def __init__(self, size=MEDIA_WORKERS, queue_size=MEDIA_JOB_QUEUE_SIZE, total_rate_bps=DOWNLOAD_BANDWIDTH_BPS,
+                 reserved=MEDIA_RESERVED_WORKERS):
+        self.size = max(size, 1)
+        self.queue_size = queue_size
+        self.total_rate_bps = total_rate_bps
+        # At least one worker must be free to run background jobs.
+        self.reserved = min(max(reserved, 0), self.size - 1)
+        self.jobs = None
+        self.background = None
+        self._ready = None
+        self.workers = []
+        self.tasks = []
+        self._ids = itertools.count(1)
+
+    async def start(self):
+        if self.tasks:
+            return
+        self.jobs = asyncio.Queue(maxsize=self.queue_size)
+        self.background = asyncio.Queue(maxsize=self.queue_size)
+        self._ready = asyncio.Condition()
+        for i in range(self.size):
+            worker = _Worker(i)
+            self.workers.append(worker)
+            self.tasks.append(asyncio.create_task(self._run_worker(worker)))
+        logger.info(
+            f"Media worker pool started with {self.size} workers, {self.reserved} reserved for downloads "
+            f"(nice {MEDIA_WORKER_NICE})"
+        )
+
+    async def close(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        for worker in self.workers:
+            await self._stop(worker)
+        self.tasks, self.workers = [], []
+
+    async def submit(self, kind: str, on_event=None, **args):
+        """Queue a job and wait for its result; cancelling the caller cancels the job."""
+        await self.start()
+        job = {"id": next(self._ids), "kind": kind, **args}
+        fut = asyncio.get_running_loop().create_future()
+        queue = self.background if kind in BACKGROUND_KINDS else self.jobs
+        await queue.put((job, fut, on_event))
+        async with self._ready:
+            self._ready.notify_all()
+        try:
+            return await fut
+        except asyncio.CancelledError:
+            self._send_control(job["id"], {"control": "cancel", "id": job["id"]})
+            raise
+
+    # ─── Worker processes ───────────────────────────────────────────
+    async def _spawn(self, worker: _Worker):
+        env = dict(os.environ, MEDIA_WORKER_NICE=str(MEDIA_WORKER_NICE))
+        env["PYTHONPATH"] = os.pathsep.join(p for p in (PROJECT_ROOT, env.get("PYTHONPATH")) if p)
+        worker.proc = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", WORKER_MODULE,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            env=env,
+        )
+
+    async def _stop(self, worker: _Worker):
+        proc, worker.proc = worker.proc, None
+        if proc is None or proc.returncode is not None:
+            return
+        try:
+            proc.stdin.close()
+            await asyncio.wait_for(proc.wait(), 5)
+        except Exception:
+            proc.kill()
+            await proc.wait()
+
+    async def _next_job(self, worker: _Worker):
+        async with self._ready:
+            while True:
+                if not self.jobs.empty():
+                    return self.jobs.get_nowait()
+                if worker.index >= self.reserved and not self.background.empty():
+                    return self.background.get_nowait()
+                await self._ready.wait()
+
+    async def _run_worker(self, worker: _Worker):
+        while True:
+            job, fut, on_event = await self._next_job(worker)
+            if fut.done():
+                continue
+            try:
+                if worker.proc is None or worker.proc.returncode is not None:
+                    await self._spawn(worker)
+                worker.job, worker.sent = job, False
+                self._rebalance()
+                worker.proc.stdin.write((json.dumps(job) + "\n").encode())
+                await worker.proc.stdin.drain()
+                worker.sent = True
+                await self._await_result(worker, job, fut, on_event)
+            except asyncio.CancelledError:
+                if not fut.done():
+                    fut.set_exception(WorkerJobError("media worker pool shut down"))
+                raise
+            except Exception as e:
+                logger.warning(f"Media worker {worker.index} failed: {e}")
+                if not fut.done():
+                    fut.set_exception(e if isinstance(e, WorkerJobError) else WorkerJobError(str(e)))
+                await self._stop(worker)
+            finally:
+                worker.job, worker.sent = None, False
+                self._rebalance()
+
+    async def _await_result(self, worker: _Worker, job: dict, fut, on_event):
+        while True:
+            line = await worker.proc.stdout.readline()
+            if not line:
+                raise WorkerJobError("media worker exited unexpectedly")
+            try:
+                msg = json.loads(line)
+            except ValueError:
+                continue
+            if msg.get("id") != job["id"]:
+                continue
+            if "event" in msg:
+                if on_event and not fut.done():
+                    on_event(msg)
+                continue
+            if not fut.done():
+                if msg.get("ok"):
+                    fut.set_result(msg.get("result"))
+                else:
+                    fut.set_exception(WorkerJobError(msg.get("error", "unknown error"), msg.get("kind", "error")))
+            return
+
+    # ─── Control messages ───────────────────────────────────────────
+    def _send_control(self, job_id: int, msg: dict):
+        for worker in self.workers:
+            if worker.job and worker.job["id"] == job_id and worker.sent and worker.proc:
+                try:
+                    worker.proc.stdin.write((json.dumps(msg) + "\n").encode())
+                except Exception as e:
+                    logger.warning(f"Failed to signal media worker {worker.index}: {e}")
+
+    def _rebalance(self):
+        if self.total_rate_bps <= 0:
+            return
+        downloads = [w for w in self.workers if w.job and w.job["kind"] == "download"]
+        if not downloads:
+            return
+        share = self.total_rate_bps / len(downloads)
+        for worker in downloads:
+            if worker.sent:
+                self._send_control(worker.job["id"], {"control": "rate", "id": worker.job["id"], "bps": share})
+            else:
+                worker.job["rate_bps"] = share
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self.workers),
+            "busy": sum(1 for w in self.workers if w.job),
+            "queued": self.jobs.qsize() if self.jobs else 0,
+            "queued_background": self.background.qsize() if self.background else 0,
+        }
+
+
+media_workers = MediaWorkerPool()
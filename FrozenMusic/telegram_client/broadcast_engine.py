@@ -0,0 +1,305 @@
+"""
+broadcast_engine.py
+
+Rate-limited, resumable forwarding of one message to every registered chat.
+(c) 2025 FrozenBots
+"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from pyrogram.errors import (
+    FloodWait,
+    UserIsBlocked,
+    InputUserDeactivated,
+    UserDeactivated,
+    UserDeactivatedBan,
+    ChatForbidden,
+    ChannelPrivate,
+    ChannelInvalid,
+    ChatIdInvalid,
+)
+from FrozenMusic.infra.chrono.iso_duration import humanize_seconds
+from FrozenMusic.infra.concurrency.token_bucket import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Telegram lets a bot send roughly 30 messages per second across all chats.
+BROADCAST_RATE = float(os.environ.get("BROADCAST_RATE", "25"))
+BROADCAST_BURST = float(os.environ.get("BROADCAST_BURST", "25"))
+BROADCAST_WORKERS = int(os.environ.get("BROADCAST_WORKERS", "16"))
+BROADCAST_CHECKPOINT_SECONDS = float(os.environ.get("BROADCAST_CHECKPOINT_SECONDS", "5"))
+BROADCAST_REPORT_SECONDS = float(os.environ.get("BROADCAST_REPORT_SECONDS", "15"))
+
+# The chat is gone for good (bot blocked, kicked, or the account deleted): stop sending to it.
+# ChatWriteForbidden is left out: a muted or restricted bot may be allowed to write again.
+PRUNE_ERRORS = (
+    UserIsBlocked,
+    InputUserDeactivated,
+    UserDeactivated,
+    UserDeactivatedBan,
+    ChatForbidden,
+    ChannelPrivate,
+    ChannelInvalid,
+    ChatIdInvalid,
+)
+
+
+class BroadcastEngine:
+    """
+    Forwards a message to every chat in the broadcast registry.
+
+    Targets stream from the store in chat ID order and are sent by a few
+    workers sharing one token bucket. A FloodWait pauses every worker for
+    exactly the time Telegram asks for, then the same chat is retried.
+    Chats that have blocked or removed the bot are pruned from the registry.
+
+    The job (source message, counters, and `cursor`, the highest chat ID
+    below which every chat is finished) is checkpointed to the store every
+    BROADCAST_CHECKPOINT_SECONDS. A job left running by a restart resumes
+    from its cursor, so at most the in-flight chats are sent twice. The
+    owner sees a progress message edited every BROADCAST_REPORT_SECONDS.
+    """
+
+    def __init__(self, client, store, registry, rate=BROADCAST_RATE, burst=BROADCAST_BURST,
+                 workers=BROADCAST_WORKERS, checkpoint_interval=BROADCAST_CHECKPOINT_SECONDS,
+                 report_interval=BROADCAST_REPORT_SECONDS):
+        self.client = client
+        self.store = store
+        self.registry = registry
+        self.bucket = TokenBucket(rate, burst)
+        self.workers = max(workers, 1)
+        self.checkpoint_interval = checkpoint_interval
+        self.report_interval = report_interval
+        self.job = None
+        self._task = None
+        self.paused_until = 0.0
+        self.flood_waits = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self, from_chat_id: int, message_id: int, owner_chat_id: int) -> bool:
+        """Begin a new broadcast. Returns False if one is already running."""
+        if self.running:
+            return False
+        self.job = {
+            "from_chat": from_chat_id,
+            "message_id": message_id,
+            "owner_chat": owner_chat_id,
+            "report_message": None,
+            "cursor": None,
+            "total": await self.store.count_chats(),
+            "sent": 0,
+            "failed": 0,
+            "pruned": 0,
+            "status": "running",
+            "started": time.time(),
+        }
+        await self.store.save_broadcast_job(self.job)
+        self._task = asyncio.get_event_loop().create_task(self._run())
+        return True
+
+    async def resume(self) -> bool:
+        """Continue a checkpointed job that a restart interrupted. Returns True if one was found."""
+        if self.running:
+            return False
+        job = await self.store.load_broadcast_job()
+        if not job or job.get("status") != "running":
+            return False
+        self.job = job
+        # The old progress message belongs to the previous run; post a fresh one.
+        job["report_message"] = None
+        logger.info(f"Resuming broadcast after chat {job['cursor']} ({self._processed()}/{job['total']} done)")
+        self._task = asyncio.get_event_loop().create_task(self._run())
+        return True
+
+    async def cancel(self) -> bool:
+        """Stop the running broadcast for good. Returns False if none was running."""
+        if not self.running:
+            return False
+        self.job["status"] = "cancelled"
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        return True
+
+    async def close(self):
+        """Stop for shutdown, leaving the job checkpointed as running so it resumes."""
+        if self.running:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    # ─── Sending ────────────────────────────────────────────────────
+    def _pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.flood_waits += 1
+
+    async def _wait_flood(self):
+        delay = self.paused_until - time.monotonic()
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = self.paused_until - time.monotonic()
+
+    async def _deliver(self, chat_id: int):
+        job = self.job
+        while True:
+            await self._wait_flood()
+            await self.bucket.acquire()
+            # Another worker may have hit a FloodWait while this one waited for a token.
+            await self._wait_flood()
+            try:
+                await self.client.forward_messages(
+                    chat_id=chat_id,
+                    from_chat_id=job["from_chat"],
+                    message_ids=job["message_id"],
+                )
+            except FloodWait as e:
+                logger.info(f"Broadcast flood wait: pausing {e.value}s")
+                self._pause(int(e.value))
+                continue
+            except PRUNE_ERRORS as e:
+                job["pruned"] += 1
+                try:
+                    await self.registry.discard(chat_id)
+                except Exception as de:
+                    logger.warning(f"Could not prune broadcast chat {chat_id}: {de}")
+                logger.debug(f"Pruned broadcast chat {chat_id}: {e}")
+            except Exception as e:
+                job["failed"] += 1
+                logger.debug(f"Failed to broadcast to {chat_id}: {e}")
+            else:
+                job["sent"] += 1
+            return
+
+    async def _send_all(self):
+        targets = asyncio.Queue(maxsize=self.workers * 2)
+        issued = deque()
+        done = set()
+
+        async def produce():
+            async for chat in self.store.iter_chats(after=self.job["cursor"]):
+                try:
+                    chat_id = int(chat.get("chat_id"))
+                except (TypeError, ValueError):
+                    self.job["failed"] += 1
+                    continue
+                issued.append(chat_id)
+                await targets.put(chat_id)
+            for _ in range(self.workers):
+                await targets.put(None)
+
+        async def work():
+            while True:
+                chat_id = await targets.get()
+                if chat_id is None:
+                    return
+                await self._deliver(chat_id)
+                done.add(chat_id)
+                # Advance the cursor only past a prefix where every chat is finished.
+                while issued and issued[0] in done:
+                    self.job["cursor"] = issued.popleft()
+                    done.discard(self.job["cursor"])
+
+        tasks = [asyncio.ensure_future(produce())] + [asyncio.ensure_future(work()) for _ in range(self.workers)]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _tick(self, started: float, processed_before: int):
+        last_report = 0.0
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            await self._checkpoint()
+            now = time.monotonic()
+            if now - last_report >= self.report_interval:
+                last_report = now
+                await self._report(self._progress_text(started, processed_before))
+
+    async def _run(self):
+        job = self.job
+        started = time.monotonic()
+        processed_before = self._processed()
+        await self._report(self._progress_text(started, processed_before))
+        ticker = asyncio.ensure_future(self._tick(started, processed_before))
+        try:
+            await self._send_all()
+            job["status"] = "done"
+        except asyncio.CancelledError:
+            await self._checkpoint()
+            if job["status"] == "cancelled":
+                await self._report(self._summary_text("🛑 Broadcast cancelled."))
+            raise
+        except Exception as e:
+            # Left as running, so the next restart picks it up from the last checkpoint.
+            logger.error(f"Broadcast interrupted: {e}")
+            await self._checkpoint()
+            await self._report(self._summary_text(f"⚠️ Broadcast interrupted ({e}); it will resume after a restart."))
+            return
+        finally:
+            ticker.cancel()
+        await self._checkpoint()
+        await self._report(self._summary_text("Broadcast complete!"))
+
+    # ─── Checkpoints and reports ────────────────────────────────────
+    def _processed(self) -> int:
+        return self.job["sent"] + self.job["failed"] + self.job["pruned"]
+
+    async def _checkpoint(self):
+        try:
+            await self.store.save_broadcast_job(self.job)
+        except Exception as e:
+            logger.warning(f"Broadcast checkpoint failed: {e}")
+
+    def _progress_text(self, started: float, processed_before: int) -> str:
+        job = self.job
+        processed = self._processed()
+        total = max(job["total"], processed)
+        percent = processed * 100 // total if total else 100
+        rate = (processed - processed_before) / max(time.monotonic() - started, 1e-6)
+        eta = humanize_seconds((total - processed) / rate) if rate > 0 else "?"
+        return (
+            "📣 Broadcast in progress\n"
+            f"📊 {processed}/{total} chats ({percent}%)\n"
+            f"✅ Sent: {job['sent']}\n"
+            f"❌ Failed: {job['failed']}\n"
+            f"🧹 Pruned: {job['pruned']}\n"
+            f"⚡ {rate:.1f} msg/s · ETA {eta}"
+        )
+
+    def _summary_text(self, title: str) -> str:
+        job = self.job
+        return (
+            f"{title}\n"
+            f"✅ Success: {job['sent']}\n"
+            f"❌ Failed: {job['failed']}\n"
+            f"🧹 Pruned: {job['pruned']}"
+        )
+
+    async def _report(self, text: str):
+        """Post or edit the owner's progress message. Reports are best effort."""
+        job = self.job
+        try:
+            if job["report_message"] is None:
+                message = await self.client.send_message(job["owner_chat"], text)
+                job["report_message"] = message.id
+            else:
+                await self.client.edit_message_text(job["owner_chat"], job["report_message"], text)
+        except Exception as e:
+            logger.debug(f"Broadcast progress report failed: {e}")
+
+    def stats(self) -> dict:
+        job = self.job or {}
+        return {
+            "running": self.running,
+            "status": job.get("status"),
+            "total": job.get("total", 0),
+            "sent": job.get("sent", 0),
+            "failed": job.get("failed", 0),
+            "pruned": job.get("pruned", 0),
+            "flood_waits": self.flood_waits,
+        }
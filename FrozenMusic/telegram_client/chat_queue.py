@@ -0,0 +1,118 @@
+"""
+chat_queue.py
+
+Compact track records and the per-chat playback queue holding them.
+(c) 2025 FrozenBots
+"""
+
+from collections import deque
+from itertools import islice
+from FrozenMusic.infra.chrono.iso_duration import humanize_seconds
+from FrozenMusic.infra.vector.url_classifier import classify_url, video_thumbnail
+
+
+class Track:
+    """
+    One queued song. The duration is stored once, in whole seconds; the
+    `M:SS` form shown in messages is derived from it on demand.
+    """
+
+    __slots__ = ("url", "title", "duration_seconds", "requester", "thumbnail")
+
+    def __init__(self, url: str, title: str, duration_seconds, requester: str = "Unknown", thumbnail=None):
+        self.url = url
+        self.title = title
+        self.duration_seconds = int(duration_seconds or 0)
+        self.requester = requester
+        self.thumbnail = thumbnail
+
+    @property
+    def duration(self) -> str:
+        return humanize_seconds(self.duration_seconds)
+
+    def _video_id(self):
+        return classify_url(self.url).video_id if self.url else None
+
+    def to_list(self) -> list:
+        """
+        Positional encoding used for persistence: `[url, title, seconds,
+        requester, thumbnail]`. A YouTube video's standard thumbnail is left
+        out, since `from_list` can rebuild it.
+        """
+        thumbnail = self.thumbnail
+        video_id = self._video_id()
+        if video_id and thumbnail == video_thumbnail(video_id):
+            thumbnail = None
+        data = [self.url, self.title, self.duration_seconds, self.requester, thumbnail]
+        return data if thumbnail is not None else data[:4]
+
+    @classmethod
+    def from_list(cls, data):
+        track = cls(*data)
+        if track.thumbnail is None:
+            video_id = track._video_id()
+            if video_id:
+                track.thumbnail = video_thumbnail(video_id)
+        return track
+
+    @classmethod
+    def decode(cls, data):
+        """Accept either the list encoding or a legacy song-info dict."""
+        if isinstance(data, dict):
+            return cls(
+                data.get("url"),
+                data.get("title"),
+                data.get("duration_seconds"),
+                data.get("requester", "Unknown"),
+                data.get("thumbnail"),
+            )
+        return cls.from_list(data)
+
+    def __repr__(self):
+        return f"Track({self.title!r}, {self.url!r}, {self.duration})"
+
+
+class ChatQueue:
+    """
+    A chat's queue; the head is the song currently playing. Backed by a
+    deque, so advancing to the next song and appending are O(1).
+    """
+
+    __slots__ = ("tracks",)
+
+    def __init__(self, tracks=()):
+        self.tracks = deque(tracks)
+
+    def append(self, track: Track):
+        self.tracks.append(track)
+
+    def popleft(self):
+        """Remove and return the head, or None if the queue is empty."""
+        return self.tracks.popleft() if self.tracks else None
+
+    @property
+    def head(self):
+        return self.tracks[0] if self.tracks else None
+
+    def window(self, count: int) -> list:
+        """The first `count` tracks, without copying the rest of the queue."""
+        return list(islice(self.tracks, count))
+
+    def clear(self):
+        self.tracks.clear()
+
+    def __getitem__(self, index: int) -> Track:
+        return self.tracks[index]
+
+    def __len__(self):
+        return len(self.tracks)
+
+    def __iter__(self):
+        return iter(self.tracks)
+
+    def to_list(self) -> list:
+        return [track.to_list() for track in self.tracks]
+
+    @classmethod
+    def from_list(cls, data):
+        return cls(Track.decode(item) for item in data)
@@ -0,0 +1,97 @@
+"""
+playlist_ingest.py
+
+Lazy, queue-limited ingestion of playlist results into chat queues.
+(c) 2025 FrozenBots
+"""
+
+import os
+import logging
+from collections import deque
+from FrozenMusic.infra.chrono.iso_duration import parse_iso_duration
+from FrozenMusic.telegram_client.chat_queue import Track
+
+logger = logging.getLogger(__name__)
+
+# How many upcoming songs a playlist keeps materialised in the chat queue.
+PLAYLIST_LOOKAHEAD = int(os.environ.get("PLAYLIST_LOOKAHEAD", "5"))
+
+
+class _PendingPlaylist:
+    def __init__(self, items, requester: str):
+        self.items = deque(items)
+        self.requester = requester
+        self.skipped = 0
+
+
+class PlaylistIngestor:
+    """
+    Feeds playlist items into a chat queue a few at a time.
+
+    Only the next PLAYLIST_LOOKAHEAD songs are turned into queue entries; the
+    rest stay as raw search results until `refill` is called as the queue
+    advances. Items longer than `max_duration` (or without a parseable
+    duration) are dropped as they come up, and the queue never grows past
+    `queue_limit`.
+    """
+
+    def __init__(self, enqueue, queue_len, queue_limit: int, max_duration: int, lookahead=PLAYLIST_LOOKAHEAD):
+        self.enqueue = enqueue
+        self.queue_len = queue_len
+        self.queue_limit = queue_limit
+        self.max_duration = max_duration
+        # At least the playing song plus the next one, so popping the head
+        # never empties the queue while the playlist still has items.
+        self.lookahead = max(lookahead, 2)
+        self.pending = {}
+
+    def _track(self, item, pending: _PendingPlaylist):
+        if not item.link:
+            return None
+        secs = parse_iso_duration(item.duration)
+        if secs is None or secs > self.max_duration:
+            return None
+        return Track(item.link, item.title, secs, pending.requester, item.thumbnail)
+
+    def _take(self, chat_id: int, count: int) -> list:
+        pending = self.pending.get(chat_id)
+        taken = []
+        while pending and pending.items and len(taken) < count:
+            song = self._track(pending.items.popleft(), pending)
+            if song is None:
+                pending.skipped += 1
+                continue
+            self.enqueue(chat_id, song)
+            taken.append(song)
+        if pending and not pending.items:
+            self.pending.pop(chat_id, None)
+            if pending.skipped:
+                logger.info(f"Playlist for chat {chat_id} skipped {pending.skipped} unplayable items")
+        return taken
+
+    def start(self, chat_id: int, items, requester: str):
+        """
+        Register a playlist for the chat and enqueue its first playable item
+        right away (if the queue has room). Returns that Track, or None.
+        A chat has one pending playlist; a new one replaces the remainder of
+        the old.
+        """
+        self.pending[chat_id] = _PendingPlaylist(items, requester)
+        if self.queue_len(chat_id) >= self.queue_limit:
+            return None
+        taken = self._take(chat_id, 1)
+        return taken[0] if taken else None
+
+    def refill(self, chat_id: int) -> int:
+        """Top the chat queue up to the look-ahead (and queue limit). Returns songs added."""
+        if chat_id not in self.pending:
+            return 0
+        room = min(self.lookahead, self.queue_limit) - self.queue_len(chat_id)
+        return len(self._take(chat_id, room)) if room > 0 else 0
+
+    def remaining(self, chat_id: int) -> int:
+        pending = self.pending.get(chat_id)
+        return len(pending.items) if pending else 0
+
+    def cancel(self, chat_id: int):
+        self.pending.pop(chat_id, None)
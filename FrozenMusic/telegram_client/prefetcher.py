@@ -0,0 +1,76 @@
+"""
+prefetcher.py
+
+Background look-ahead downloader for per-chat playback queues.
+(c) 2025 FrozenBots
+"""
+
+import os
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_DEPTH = int(os.environ.get("PREFETCH_DEPTH", "2"))
+
+
+class QueuePrefetcher:
+    """
+    Keeps the head of every chat queue plus the next `depth` entries downloading
+    in the background, so a track change starts from an already-local file.
+
+    Entries that drop out of the look-ahead window (skip, clear, stop) have
+    their fetch task cancelled. Playback of an entry whose fetch is still
+    running goes through `playback_resolver`, which may join the same download
+    progressively instead of waiting for it to finish.
+    """
+
+    def __init__(self, resolver, depth: int = PREFETCH_DEPTH, playback_resolver=None):
+        self.resolver = resolver
+        self.playback_resolver = playback_resolver or resolver
+        self.depth = max(depth, 0)
+        self.tasks = {}
+
+    def schedule(self, chat_id: int, queue):
+        """Sync the chat's fetch tasks with the current look-ahead window of `queue`."""
+        wanted = []
+        for song in queue.window(self.depth + 1):
+            url = song.url
+            if url and url not in wanted:
+                wanted.append(url)
+
+        current = self.tasks.setdefault(chat_id, {})
+        for url in list(current):
+            if url not in wanted:
+                current.pop(url).cancel()
+
+        for url in wanted:
+            if url not in current or self._failed(current[url]):
+                task = asyncio.create_task(self.resolver(url))
+                task.add_done_callback(lambda t, u=url: self._on_done(chat_id, u, t))
+                current[url] = task
+
+        if not current:
+            self.tasks.pop(chat_id, None)
+
+    @staticmethod
+    def _failed(task: asyncio.Task) -> bool:
+        return task.done() and not task.cancelled() and task.exception() is not None
+
+    def _on_done(self, chat_id: int, url: str, task: asyncio.Task):
+        if task.cancelled():
+            return
+        exc = task.exception()
+        if exc is not None:
+            logger.warning(f"Prefetch failed in chat {chat_id} for {url}: {exc}")
+
+    async def resolve(self, chat_id: int, url: str) -> str:
+        """Return a playable source for `url`, reusing a finished prefetch if there is one."""
+        task = self.tasks.get(chat_id, {}).get(url)
+        if task is not None and task.done() and not task.cancelled() and task.exception() is None:
+            return task.result()
+        return await self.playback_resolver(url)
+
+    def cancel_chat(self, chat_id: int):
+        for task in self.tasks.pop(chat_id, {}).values():
+            task.cancel()
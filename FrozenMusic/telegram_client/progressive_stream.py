@@ -0,0 +1,122 @@
+"""
+progressive_stream.py
+
+Loopback HTTP server that streams downloads to ffmpeg while they are still
+being written, so playback can start before the file is complete.
+(c) 2025 FrozenBots
+"""
+
+import os
+import logging
+import urllib.parse
+import aiofiles
+from aiohttp import web
+from FrozenMusic.infra.cache.audio_cache import audio_cache
+from FrozenMusic.telegram_client.transfer_progress import ACTIVE_TRANSFERS
+
+logger = logging.getLogger(__name__)
+
+PROGRESSIVE_HOST = "127.0.0.1"
+PROGRESSIVE_PORT = int(os.environ.get("PROGRESSIVE_PORT", "8765"))
+PROGRESSIVE_STALL_TIMEOUT = float(os.environ.get("PROGRESSIVE_STALL_TIMEOUT", "30"))
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def _range_start(request: web.Request) -> int:
+    header = request.headers.get("Range", "")
+    if header.startswith("bytes="):
+        try:
+            return int(header[6:].split("-", 1)[0] or 0)
+        except ValueError:
+            return 0
+    return 0
+
+
+class ProgressiveStreamServer:
+    """Serves `/progressive/<key>` from the partial file, following it as it grows."""
+
+    def __init__(self, host=PROGRESSIVE_HOST, port=PROGRESSIVE_PORT):
+        self.host = host
+        self.port = port
+        self.runner = None
+
+    def url_for(self, key: str) -> str:
+        return f"http://{self.host}:{self.port}/progressive/{urllib.parse.quote(key, safe='')}"
+
+    async def start(self):
+        if self.runner is not None:
+            return
+        app = web.Application()
+        app.router.add_get("/progressive/{key}", self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+        logger.info(f"Progressive stream server listening on {self.host}:{self.port}")
+
+    async def close(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def handle(self, request: web.Request):
+        key = urllib.parse.unquote(request.match_info["key"])
+        progress = ACTIVE_TRANSFERS.get(key)
+        if progress is None or progress.done:
+            path = (progress.final_path if progress else None) or audio_cache.lookup(key)
+            if not path or not os.path.isfile(path):
+                raise web.HTTPNotFound()
+            return web.FileResponse(path)
+
+        start = _range_start(request)
+        total = progress.total_bytes
+        if total is None:
+            # Without the full length no valid Content-Range can be sent; serve from the start.
+            start = 0
+        elif start and (start > progress.bytes_written or start >= total):
+            # Nothing at that offset yet; the client may retry once more has arrived.
+            raise web.HTTPRequestRangeNotSatisfiable(headers={"Content-Range": f"bytes */{total}"})
+        response = web.StreamResponse(status=206 if start else 200)
+        response.content_type = "audio/mpeg"
+        if start:
+            response.headers["Content-Range"] = f"bytes {start}-{total - 1}/{total}"
+        await response.prepare(request)
+
+        path = progress.partial_path if os.path.exists(progress.partial_path) else progress.final_path
+        if not path:
+            await response.write_eof()
+            return response
+
+        async with aiofiles.open(path, "rb") as f:
+            await f.seek(start)
+            while True:
+                chunk = await f.read(STREAM_CHUNK_SIZE)
+                if chunk:
+                    await response.write(chunk)
+                    continue
+                if progress.error is not None:
+                    logger.warning(f"Download of {key} failed mid-stream: {progress.error}")
+                    return self._abort(request, response)
+                if progress.done:
+                    # Drain whatever landed between the last read and completion.
+                    chunk = await f.read()
+                    if chunk:
+                        await response.write(chunk)
+                    break
+                if not await progress.wait_for_change(PROGRESSIVE_STALL_TIMEOUT):
+                    logger.warning(f"Download of {key} stalled; aborting the stream")
+                    return self._abort(request, response)
+
+        await response.write_eof()
+        return response
+
+    @staticmethod
+    def _abort(request: web.Request, response: web.StreamResponse):
+        # Drop the connection without finishing the body, so the player sees
+        # a broken stream rather than a song that simply ended early.
+        response.force_close()
+        if request.transport is not None:
+            request.transport.close()
+        return response
+
+
+progressive_server = ProgressiveStreamServer()
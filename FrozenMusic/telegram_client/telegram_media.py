@@ -0,0 +1,93 @@
+"""
+telegram_media.py
+
+Reply-media downloads streamed from Telegram into the audio cache, keyed by
+file_unique_id so a re-posted file is never downloaded twice.
+(c) 2025 FrozenBots
+"""
+
+import os
+import asyncio
+import logging
+import aiofiles
+from FrozenMusic.infra.cache.audio_cache import audio_cache, telegram_track_id
+from FrozenMusic.infra.cache.janitor import janitor
+from FrozenMusic.infra.transfer.adaptive_writer import BufferedChunkWriter
+from FrozenMusic.telegram_client.transfer_progress import transfer_for, release_transfer
+from FrozenMusic.telegram_client.transcoder import schedule_transcode
+from FrozenMusic.telegram_client.vector_transport import INFLIGHT_DOWNLOADS
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_KEY_PREFIX = "tgthumb:"
+
+
+def _media_suffix(media, default: str) -> str:
+    name = getattr(media, "file_name", None) or ""
+    return os.path.splitext(name)[1].lower() or default
+
+
+def start_telegram_download(client, media, default_suffix: str = ".mp3") -> str:
+    """
+    Make sure the file behind `media` is cached or being streamed into the
+    cache, and return its cache key. The key is a valid queue URL: the
+    transport resolver serves it from the cache or follows the running
+    download, so playback can start progressively.
+    """
+    key = telegram_track_id(media.file_unique_id)
+    if audio_cache.lookup(key) or INFLIGHT_DOWNLOADS.in_flight(key):
+        return key
+
+    partial_path = audio_cache.partial_path(key, _media_suffix(media, default_suffix))
+    transfer_for(key, partial_path)
+    task = asyncio.ensure_future(
+        INFLIGHT_DOWNLOADS.do(key, lambda: _stream_to_cache(client, media, key, partial_path))
+    )
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    return key
+
+
+async def _stream_to_cache(client, media, key: str, partial_path: str) -> str:
+    progress = transfer_for(key, partial_path)
+    progress.total_bytes = getattr(media, "file_size", None)
+    try:
+        async with janitor.reserve(progress.total_bytes, audio_cache.root):
+            async with aiofiles.open(partial_path, "wb") as f:
+                writer = BufferedChunkWriter(f, on_flush=progress.advance)
+                async for chunk in client.stream_media(media.file_id):
+                    await writer.write(chunk)
+                await writer.flush()
+        final_path = audio_cache.commit(key, partial_path, {
+            "source": "telegram",
+            "file_name": getattr(media, "file_name", None),
+        })
+        progress.finish(final_path)
+        schedule_transcode(key)
+        return final_path
+    except asyncio.CancelledError:
+        audio_cache.discard_partial(partial_path)
+        progress.fail(Exception("Download cancelled"))
+        raise
+    except Exception as e:
+        audio_cache.discard_partial(partial_path)
+        error = Exception(f"Failed to download media: {e}")
+        progress.fail(error)
+        raise error
+    finally:
+        release_transfer(progress)
+
+
+async def cached_thumbnail(client, thumb):
+    """Return a local path for a Telegram thumbnail, downloading it only on a cache miss."""
+    if thumb is None:
+        return None
+    key = THUMBNAIL_KEY_PREFIX + thumb.file_unique_id
+    path = audio_cache.lookup(key)
+    if path:
+        return path
+    try:
+        downloaded = await client.download_media(thumb.file_id, file_name=audio_cache.path_for(key, ".jpg"))
+        return audio_cache.commit(key, downloaded, {"source": "telegram"})
+    except Exception as e:
+        logger.warning(f"Failed to download thumbnail {thumb.file_unique_id}: {e}")
+        return None
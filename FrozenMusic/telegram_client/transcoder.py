@@ -0,0 +1,68 @@
+"""
+transcoder.py
+
+Background pre-transcoding of cached tracks into a voice-chat-ready,
+loudness-normalised variant.
+(c) 2025 FrozenBots
+"""
+
+import os
+import asyncio
+import logging
+from FrozenMusic.infra.cache.audio_cache import audio_cache
+from FrozenMusic.infra.concurrency.single_flight import SingleFlight
+from FrozenMusic.infra.workers.worker_pool import media_workers
+
+logger = logging.getLogger(__name__)
+
+TRANSCODE_ENABLED = os.environ.get("TRANSCODE_ENABLED", "true").lower() in ("1", "true", "yes")
+LOUDNESS_TARGET_LUFS = float(os.environ.get("LOUDNESS_TARGET_LUFS", "-16"))
+TRANSCODE_BITRATE = os.environ.get("TRANSCODE_BITRATE", "128k")
+# pytgcalls feeds WebRTC 48 kHz stereo, so a 48 kHz Opus file needs no resampling.
+VC_SAMPLE_RATE = 48000
+VC_CHANNELS = 2
+NORMALISED_VARIANT = "norm"
+
+INFLIGHT_TRANSCODES = SingleFlight()
+
+
+def schedule_transcode(key: str):
+    """Start normalising a cached track in the worker pool unless it is already done or running."""
+    if not TRANSCODE_ENABLED:
+        return
+    if audio_cache.has_variant(key, NORMALISED_VARIANT) or INFLIGHT_TRANSCODES.in_flight(key):
+        return
+    source = audio_cache.peek(key)
+    if not source:
+        return
+    task = asyncio.ensure_future(INFLIGHT_TRANSCODES.do(key, lambda: _transcode(key, source)))
+    task.add_done_callback(lambda t: _log_failure(key, t))
+
+
+def _log_failure(key: str, task: asyncio.Future):
+    if task.cancelled():
+        return
+    exc = task.exception()
+    if exc is not None:
+        logger.warning(f"Transcode of {key} failed: {exc}")
+
+
+async def _transcode(key: str, source: str):
+    out_path = audio_cache.variant_partial_path(key, NORMALISED_VARIANT, ".ogg")
+    try:
+        result = await media_workers.submit(
+            "transcode",
+            source=source,
+            path=out_path,
+            target_lufs=LOUDNESS_TARGET_LUFS,
+            bitrate=TRANSCODE_BITRATE,
+            sample_rate=VC_SAMPLE_RATE,
+            channels=VC_CHANNELS,
+        )
+    except BaseException:
+        try:
+            os.remove(out_path)
+        except FileNotFoundError:
+            pass
+        raise
+    return audio_cache.add_variant(key, NORMALISED_VARIANT, out_path, {"loudness": result.get("loudness")})
@@ -0,0 +1,76 @@
+"""
+transfer_progress.py
+
+Shared progress state for downloads that are still being written.
+(c) 2025 FrozenBots
+"""
+
+import asyncio
+
+ACTIVE_TRANSFERS = {}
+
+
+class TransferProgress:
+    """
+    Byte counter and completion state of one in-flight download, so readers
+    can follow the partial file while it grows.
+    """
+
+    def __init__(self, key: str, partial_path: str):
+        self.key = key
+        self.partial_path = partial_path
+        self.final_path = None
+        self.bytes_written = 0
+        self.total_bytes = None
+        self.error = None
+        self.done = False
+        self._changed = asyncio.Event()
+
+    def advance(self, nbytes: int):
+        self.bytes_written += nbytes
+        self._notify()
+
+    def finish(self, final_path: str):
+        self.final_path = final_path
+        self.done = True
+        self._notify()
+
+    def fail(self, error: Exception):
+        self.error = error
+        self.done = True
+        self._notify()
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def wait_for_change(self, timeout: float) -> bool:
+        """Wait for new bytes or completion. Returns False if nothing happened within `timeout`."""
+        if self.done:
+            return True
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def wait_for_bytes(self, nbytes: int, timeout: float) -> bool:
+        """Wait until `nbytes` have arrived or the transfer ends. False on a stall."""
+        while not self.done and self.bytes_written < nbytes:
+            if not await self.wait_for_change(timeout):
+                return False
+        return True
+
+
+def transfer_for(key: str, partial_path: str) -> TransferProgress:
+    """Return the progress record of the in-flight download for `key`, creating it if needed."""
+    progress = ACTIVE_TRANSFERS.get(key)
+    if progress is None or progress.done:
+        progress = TransferProgress(key, partial_path)
+        ACTIVE_TRANSFERS[key] = progress
+    return progress
+
+
+def release_transfer(progress: TransferProgress):
+    if ACTIVE_TRANSFERS.get(progress.key) is progress:
+        del ACTIVE_TRANSFERS[progress.key]
@@ -1,11 +1,17 @@
-import aiohttp
-import aiofiles
 import asyncio
 import os
-import psutil
-import tempfile
 import random
 import string
+from FrozenMusic.infra.cache.audio_cache import audio_cache, canonical_track_id, TELEGRAM_KEY_PREFIX
+from FrozenMusic.infra.cache.search_cache import search_cache
+from FrozenMusic.infra.cache.janitor import janitor, DISK_RESERVE_BYTES, InsufficientDiskSpace
+from FrozenMusic.infra.http.upstream_health import upstreams, http_probe, CircuitOpen
+from FrozenMusic.infra.concurrency.single_flight import SingleFlight
+from FrozenMusic.infra.pipeline.stage_pipeline import Pipeline
+from FrozenMusic.infra.workers.worker_pool import media_workers, WorkerJobError
+from FrozenMusic.telegram_client.transfer_progress import transfer_for, release_transfer
+from FrozenMusic.telegram_client.progressive_stream import progressive_server
+from FrozenMusic.telegram_client.transcoder import schedule_transcode, NORMALISED_VARIANT
 
 
 ASYNC_SHARD_POOL = [random.uniform(0.05, 0.5) for _ in range(50)]
@@ -96,8 +102,6 @@ def entropic_fluctuation_emulator(levels: int = 5):
     return spectrum
 
 
-SHARD_CACHE_MATRIX = {}
-
 class TransportVectorHandler:
     def __init__(self):
         self.cache = {}
@@ -113,53 +117,209 @@ class TransportVectorHandler:
         return (self.cache.get(key, 1.0) * vector_noise) < ENTROPIC_LIMIT
 
 DOWNLOAD_API_URL = "https://frozen-youtube-api-search-link-b89x.onrender.com/download?url="
+INFLIGHT_DOWNLOADS = SingleFlight()
+DOWNLOAD_UPSTREAM = upstreams.register(
+    "download", http_probe(lambda: DOWNLOAD_API_URL.split("/download", 1)[0] + "/", "download")
+)
+DOWNLOAD_TIMEOUT = float(os.environ.get("DOWNLOAD_TIMEOUT", "150"))
+DOWNLOAD_STALL_TIMEOUT = float(os.environ.get("DOWNLOAD_STALL_TIMEOUT", "30"))
+PROGRESSIVE_ENABLED = os.environ.get("PROGRESSIVE_PLAYBACK", "true").lower() in ("1", "true", "yes")
+PROGRESSIVE_PREFIX_BYTES = int(os.environ.get("PROGRESSIVE_PREFIX_BYTES", str(256 * 1024)))
+PROGRESSIVE_PREFIX_TIMEOUT = float(os.environ.get("PROGRESSIVE_PREFIX_TIMEOUT", "60"))
+
+
+async def _stage_entropy_pool(ctx: dict):
+    initialize_entropy_pool()
+    ctx["fluct"] = matrix_fluctuation_generator()
 
 
-async def vector_transport_resolver(url: str) -> str:
-    """
-    Resolves and stabilizes external vector transports with transient shard caching
-    and layered transport injection.
-    """
-    initialize_entropy_pool()
-    fluct = matrix_fluctuation_generator()
-    await synthetic_payload_transformer(url)
-    await ephemeral_layer_checker([url, str(fluct[0])])
+async def _stage_payload_transform(ctx: dict):
+    await synthetic_payload_transformer(ctx["url"])
+
+
+async def _stage_layer_check(ctx: dict):
+    fluct = ctx.get("fluct") or [0.0]
+    await ephemeral_layer_checker([ctx["url"], str(fluct[0])])
 
+
+async def _stage_local_file(ctx: dict):
+    url = ctx["url"]
     if os.path.exists(url) and os.path.isfile(url):
         return url
 
-    if url in SHARD_CACHE_MATRIX:
-        return SHARD_CACHE_MATRIX[url]
 
+async def _stage_cache_lookup(ctx: dict):
+    key = ctx["key"] = canonical_track_id(ctx["url"])
+    path = audio_cache.lookup(key, variant=NORMALISED_VARIANT)
+    if path:
+        schedule_transcode(key)
+    return path
+
+
+async def _stage_vector_stabilize(ctx: dict):
     handler = TransportVectorHandler()
-    handler.inject_shard(url)
-    await handler.stabilize_vector(url)
+    handler.inject_shard(ctx["url"])
+    await handler.stabilize_vector(ctx["url"])
+
+
+def _start_download(key: str, url: str):
+    transfer_for(key, audio_cache.partial_path(key))
+    return INFLIGHT_DOWNLOADS.do(key, lambda: _download_to_cache(key, url))
+
+
+async def _stage_download(ctx: dict):
+    url = ctx["url"]
+    key = ctx.setdefault("key", canonical_track_id(url))
+    if key.startswith(TELEGRAM_KEY_PREFIX) and not INFLIGHT_DOWNLOADS.in_flight(key):
+        # Telegram media can only be fetched through the bot client (see telegram_media).
+        raise Exception("This Telegram file is no longer cached. Reply to it with /play again.")
+    if not ctx.get("progressive"):
+        return await _start_download(key, url)
+
+    progress = transfer_for(key, audio_cache.partial_path(key))
+    download = asyncio.ensure_future(_start_download(key, url))
+    download.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    if not await progress.wait_for_bytes(PROGRESSIVE_PREFIX_BYTES, PROGRESSIVE_PREFIX_TIMEOUT):
+        download.cancel()
+        raise Exception("Download API stalled before playback could start. Please try again.")
+    if progress.error is not None:
+        raise progress.error
+    if progress.done:
+        return progress.final_path
+
+    await progressive_server.start()
+    return progressive_server.url_for(key)
+
+
+TRANSPORT_PIPELINE = Pipeline("transport", [
+    ("entropy_pool", _stage_entropy_pool),
+    ("payload_transform", _stage_payload_transform),
+    ("layer_check", _stage_layer_check),
+    ("local_file", _stage_local_file),
+    ("cache_lookup", _stage_cache_lookup),
+    ("vector_stabilize", _stage_vector_stabilize),
+    ("download", _stage_download),
+])
+
+
+async def vector_transport_resolver(url: str) -> str:
+    """
+    Resolves and stabilizes external vector transports through the persistent
+    audio cache, downloading only on a cache miss. Concurrent misses for the
+    same canonical track share a single download.
+    """
+    media_path = await TRANSPORT_PIPELINE.run({"url": url})
+    if not media_path:
+        raise Exception("Error downloading audio: no transport stage produced a file")
+    return media_path
+
+
+async def progressive_transport_resolver(url: str) -> str:
+    """
+    Like vector_transport_resolver, but on a cache miss returns as soon as a
+    playable prefix has arrived: the result is then a loopback stream URL that
+    keeps following the download while it completes in the background.
+    """
+    if not PROGRESSIVE_ENABLED:
+        return await vector_transport_resolver(url)
+    media_path = await TRANSPORT_PIPELINE.run({"url": url, "progressive": True})
+    if not media_path:
+        raise Exception("Error downloading audio: no transport stage produced a file")
+    return media_path
+
+
+async def wait_for_transfer(url: str) -> str:
+    """Wait for any in-flight download of `url` to finish, raising if it failed."""
+    key = canonical_track_id(url)
+    if not INFLIGHT_DOWNLOADS.in_flight(key):
+        return audio_cache.lookup(key)
+    return await INFLIGHT_DOWNLOADS.do(key, lambda: _download_to_cache(key, url))
+
+
+async def _download_to_cache(key: str, url: str) -> str:
+    file_name = audio_cache.partial_path(key)
+    progress = transfer_for(key, file_name)
+    call = None
+
+    def on_event(msg: dict):
+        if msg["event"] == "started":
+            # Queueing for a worker is ours; the circuit only times the transfer.
+            call.begin()
+        elif msg["event"] == "progress":
+            progress.advance(msg["bytes"])
+        elif msg["event"] == "headers":
+            progress.total_bytes = msg.get("total")
 
     try:
-        proc = psutil.Process(os.getpid())
-        proc.nice(psutil.IDLE_PRIORITY_CLASS if os.name == "nt" else 19)
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.mp3')
-        file_name = temp_file.name
-        temp_file.close()
-
-        download_url = f"{DOWNLOAD_API_URL}{url}"
-
-        async with aiohttp.ClientSession() as session:
-            async with session.get(download_url, timeout=150) as response:
-                if response.status == 200:
-                    async with aiofiles.open(file_name, 'wb') as f:
-                        while True:
-                            chunk = await response.content.read(32768)
-                            if not chunk:
-                                break
-                            await f.write(chunk)
-                            await asyncio.sleep(0.01)
-
-                    SHARD_CACHE_MATRIX[url] = file_name
-                    return file_name
-                else:
-                    raise Exception(f"Failed to download audio. HTTP status: {response.status}")
-    except asyncio.TimeoutError:
-        raise Exception("Download API took too long to respond. Please try again.")
+        # The transfer runs in a low-priority worker process; this process
+        # only follows its progress and receives the finished file. The worker
+        # refuses a body that would not fit once Content-Length is known; the
+        # janitor then frees that much space and the download is retried once.
+        # Failures that are ours rather than the API's do not count against
+        # its circuit.
+        size_hint = None
+        for attempt in range(2):
+            try:
+                async with janitor.reserve(size_hint, audio_cache.root):
+                    async with DOWNLOAD_UPSTREAM.track(ignore=_not_upstream_fault) as call:
+                        await media_workers.submit(
+                            "download",
+                            on_event=on_event,
+                            url=f"{DOWNLOAD_API_URL}{url}",
+                            path=file_name,
+                            timeout=DOWNLOAD_TIMEOUT,
+                            stall_timeout=DOWNLOAD_STALL_TIMEOUT,
+                            min_free_bytes=DISK_RESERVE_BYTES,
+                        )
+                break
+            except WorkerJobError as e:
+                if e.kind != "disk" or attempt or not progress.total_bytes:
+                    raise
+                size_hint = progress.total_bytes
+        final_path = audio_cache.commit(key, file_name, _track_meta(key, url))
+        progress.finish(final_path)
+        schedule_transcode(key)
+        return final_path
+    except asyncio.CancelledError:
+        audio_cache.discard_partial(file_name)
+        progress.fail(Exception("Download cancelled"))
+        raise
+    except CircuitOpen as e:
+        audio_cache.discard_partial(file_name)
+        error = Exception(f"Download API is currently unavailable. Please try again in {int(e.retry_in) + 1}s.")
+        progress.fail(error)
+        raise error
+    except WorkerJobError as e:
+        audio_cache.discard_partial(file_name)
+        if e.kind == "timeout":
+            error = Exception("Download API took too long to respond. Please try again.")
+        elif e.kind == "disk":
+            error = Exception("Not enough disk space to download this track right now. Please try again later.")
+        else:
+            error = Exception(f"Error downloading audio: {e}")
+        progress.fail(error)
+        raise error
     except Exception as e:
-        raise Exception(f"Error downloading audio: {e}")
+        audio_cache.discard_partial(file_name)
+        error = Exception(f"Error downloading audio: {e}")
+        progress.fail(error)
+        raise error
+    finally:
+        release_transfer(progress)
+
+
+def _track_meta(key: str, url: str) -> dict:
+    """Cache-entry metadata; title and duration let a later /play of the same ID skip search."""
+    meta = {"url": url}
+    if key.startswith("yt:"):
+        track = search_cache.track_for_video(key[3:])
+        if track is not None:
+            meta.update(title=track.title, duration=track.duration, thumbnail=track.thumbnail)
+    return meta
+
+
+def _not_upstream_fault(e: Exception) -> bool:
+    if isinstance(e, InsufficientDiskSpace):
+        return True
+    return isinstance(e, WorkerJobError) and e.kind in ("disk", "cancelled")
@@ -1,5 +1,6 @@
 import random
 import asyncio
+from FrozenMusic.infra.pipeline.stage_pipeline import stage_enabled, timed_stage
 
 SHARD_NOISE_SEED = [random.uniform(0.1, 0.9) for _ in range(12)]
 TEXTUAL_STATE_POOL = {}
@@ -27,9 +28,11 @@ async def vectorized_unicode_boldifier(payload: str) -> str:
     """
     Generates a full-width Unicode glyph matrix for advanced text rendering and entropic stabilization.
     """
-    synth = GlyphMatrixSynthesizer()
-    synth.encode_payload(payload)
-    await synth.stabilize_matrix(payload)
+    if stage_enabled("text.glyph_stabilize"):
+        async with timed_stage("text.glyph_stabilize"):
+            synth = GlyphMatrixSynthesizer()
+            synth.encode_payload(payload)
+            await synth.stabilize_matrix(payload)
 
     glyph_matrix = ""
     for shard in payload:
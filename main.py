@@ -4,6 +4,7 @@ import sys
 import time
 import uuid
 import json
+import math
 import random
 import logging
 import tempfile
@@ -15,14 +16,11 @@ from datetime import datetime, timezone, timedelta
 from threading import Thread
 from http.server import HTTPServer, BaseHTTPRequestHandler
 from urllib.parse import quote, urljoin
-import aiohttp
 import aiofiles
 import asyncio
 import requests
 import isodate
 import psutil
-import pymongo
-from pymongo import MongoClient, ASCENDING
 from bson import ObjectId
 from bson.binary import Binary
 from dotenv import load_dotenv
@@ -51,7 +49,35 @@ from pytgcalls.types.stream import StreamEnded
 from typing import Union
 import urllib
 from FrozenMusic.infra.concurrency.ci import deterministic_privilege_validator
-from FrozenMusic.telegram_client.vector_transport import vector_transport_resolver
+from FrozenMusic.infra.concurrency.command_limiter import CommandLimiter, Admission
+from FrozenMusic.infra.concurrency.chat_actor import ChatActors
+from FrozenMusic.telegram_client.vector_transport import (
+    vector_transport_resolver,
+    progressive_transport_resolver,
+    wait_for_transfer,
+)
+from FrozenMusic.telegram_client.progressive_stream import progressive_server
+from FrozenMusic.infra.cache.audio_cache import audio_cache, canonical_track_id, telegram_track_id
+from FrozenMusic.infra.cache.janitor import janitor
+from FrozenMusic.infra.cache.search_cache import search_cache
+from FrozenMusic.telegram_client.telegram_media import start_telegram_download, cached_thumbnail, THUMBNAIL_KEY_PREFIX
+from FrozenMusic.infra.http.session_pool import http_pool
+from FrozenMusic.infra.http.hedged_request import HedgeFailed
+from FrozenMusic.infra.http.upstream_health import upstreams
+from FrozenMusic.infra.workers.worker_pool import media_workers
+from FrozenMusic.infra.pipeline.stage_pipeline import timed_stage, timing_snapshot
+from FrozenMusic.telegram_client.prefetcher import QueuePrefetcher
+from FrozenMusic.telegram_client.playlist_ingest import PlaylistIngestor
+from FrozenMusic.telegram_client.chat_queue import Track, ChatQueue
+from FrozenMusic.telegram_client.broadcast_engine import BroadcastEngine
+from FrozenMusic.infra.storage.queue_store import QueueStore
+from FrozenMusic.infra.storage.bot_store import create_bot_store
+from FrozenMusic.infra.chrono.iso_duration import parse_iso_duration
+from FrozenMusic.infra.storage.broadcast_registry import BroadcastRegistry
+from FrozenMusic.infra.vector.resolver_registry import resolvers
+from FrozenMusic.infra.vector.results import PlaylistResult
+from FrozenMusic.infra.vector.track_index import track_index
+# Importing a backend module registers it with the resolver registry.
 from FrozenMusic.infra.vector.yt_vector_orchestrator import yt_vector_orchestrator
 from FrozenMusic.infra.vector.yt_backup_engine import yt_backup_engine
 from FrozenMusic.infra.chrono.chrono_formatter import quantum_temporal_humanizer
@@ -92,7 +118,9 @@ def _custom_exception_handler(loop, context):
 
     loop.default_exception_handler(context)
 
-asyncio.get_event_loop().set_exception_handler(_custom_exception_handler)
+# The loop every client and service runs on; other threads submit work to it
+main_loop = asyncio.get_event_loop()
+main_loop.set_exception_handler(_custom_exception_handler)
 
 session_name = os.environ.get("SESSION_NAME", "music_bot1")
 bot = Client(session_name, bot_token=BOT_TOKEN, api_id=API_ID, api_hash=API_HASH)
@@ -105,58 +133,236 @@ ASSISTANT_CHAT_ID = None
 API_ASSISTANT_USERNAME = os.getenv("API_ASSISTANT_USERNAME")
 
 
-# ─── MongoDB Setup ─────────────────────────────────────────
-mongo_uri = os.environ.get("MongoDB_url")
-mongo_client = MongoClient(mongo_uri)
-db = mongo_client["music_bot"]
-
-
-broadcast_collection  = db["broadcast"]
-
-
-state_backup = db["state_backup"]
+# ─── Storage Setup ─────────────────────────────────────────
+# MongoDB by default (MongoDB_url); STORAGE_URL can point at PostgreSQL or SQLite instead.
+bot_store = create_bot_store()
+broadcast_registry = BroadcastRegistry(bot_store)
+broadcast_engine = BroadcastEngine(bot, bot_store, broadcast_registry)
 
 
 chat_containers = {}
 playback_tasks = {}  
 bot_start_time = time.time()
-COOLDOWN = 10
-chat_last_command = {}
-chat_pending_commands = {}
+# /play is limited per chat and per user; excess requests wait in a short per-chat queue
+play_limiter = CommandLimiter()
 QUEUE_LIMIT = 20
 MAX_DURATION_SECONDS = 900  
 LOCAL_VC_LIMIT = 10
 playback_mode = {}
+prefetcher = QueuePrefetcher(vector_transport_resolver, playback_resolver=progressive_transport_resolver)
+# One document per chat, rewritten shortly after its queue changes.
+queue_store = QueueStore(
+    bot_store,
+    lambda chat_id: chat_containers[chat_id].to_list() if chat_containers.get(chat_id) else [],
+)
+
+
+def enqueue_song(chat_id, song_info: Track):
+    """Append a song to the chat queue and pin its cached audio while queued."""
+    queue = chat_containers.get(chat_id)
+    if queue is None:
+        queue = chat_containers[chat_id] = ChatQueue()
+    queue.append(song_info)
+    audio_cache.pin(canonical_track_id(song_info.url))
+    prefetcher.schedule(chat_id, queue)
+    queue_store.mark(chat_id)
+
+
+def pop_head(chat_id):
+    """Remove and return the song at the head of the chat queue (None if empty)."""
+    queue = chat_containers.get(chat_id)
+    if not queue:
+        return None
+    queue_store.mark(chat_id)
+    return queue.popleft()
+
+
+def release_song(song_info: Track):
+    """Drop the cache pin held by a song leaving the queue."""
+    url = song_info.url
+    if url:
+        audio_cache.unpin(canonical_track_id(url))
 
 
+# Replied-to media plays outside the queue; its cache keys (audio and
+# thumbnail) stay pinned, per chat, until it ends or something replaces it.
+direct_playback = {}
 
-async def process_pending_command(chat_id, delay):
-    await asyncio.sleep(delay)  
-    if chat_id in chat_pending_commands:
-        message, cooldown_reply = chat_pending_commands.pop(chat_id)
-        await cooldown_reply.delete()  
-        await play_handler(bot, message) 
 
+def pin_direct(chat_id, song_info: Track, keys):
+    """Pin replied-to media for the chat, releasing whatever it pinned before."""
+    release_direct(chat_id)
+    for key in keys:
+        audio_cache.pin(key)
+    direct_playback[chat_id] = (song_info, keys)
 
 
-async def skip_to_next_song(chat_id, message):
-    """Skips to the next song in the queue and starts playback."""
-    if chat_id not in chat_containers or not chat_containers[chat_id]:
-        await message.edit("❌ No more songs in the queue.")
-        await leave_voice_chat(chat_id)
+def release_direct(chat_id, song_info: Track = None):
+    """Unpin the chat's replied-to media; with `song_info`, only if that is what it holds."""
+    held = direct_playback.get(chat_id)
+    if held is None or (song_info is not None and held[0] is not song_info):
         return
+    del direct_playback[chat_id]
+    for key in held[1]:
+        audio_cache.unpin(key)
+
+
+def release_queue(chat_id):
+    """Release every song queued for a chat and drop the queue."""
+    prefetcher.cancel_chat(chat_id)
+    playlist_ingestor.cancel(chat_id)
+    for song in chat_containers.pop(chat_id, ()):
+        release_song(song)
+    queue_store.mark(chat_id)
+
+
+# Playlists enter the queue a few songs at a time as playback advances.
+playlist_ingestor = PlaylistIngestor(
+    enqueue_song,
+    lambda chat_id: len(chat_containers.get(chat_id, ())),
+    QUEUE_LIMIT,
+    MAX_DURATION_SECONDS,
+)
+
+
 
-    await message.edit("⏭ Skipping to the next song...")
+# ─── Per-chat playback actors ───────────────────────────────────────────────────
+# Every queue mutation and call_py transition for a chat runs as a command in
+# that chat's actor, one at a time, so skips, stream ends and new requests
+# can no longer interleave. Starting a stream runs as the actor's job, which
+# the next transition cancels.
+playback = ChatActors()
 
-    # Pick next song from queue
-    next_song_info = chat_containers[chat_id][0]
+# Time the previous stream gets to wind down before the next one starts. It
+# is waited out in the job or a timer, never in the actor, so commands for
+# the chat are not held up behind it.
+STREAM_SWITCH_GRACE = 3
+
+
+async def _play_next(chat_id, song_info, message=None, delay=0):
     try:
-        await fallback_local_playback(chat_id, message, next_song_info)
+        if delay:
+            await asyncio.sleep(delay)
+        if message is None:
+            message = await bot.send_message(chat_id, f"🎧 Preparing next song: **{song_info.title}** ...")
+        await fallback_local_playback(chat_id, message, song_info)
     except Exception as e:
         print(f"Error starting next local playback: {e}")
         await bot.send_message(chat_id, f"❌ Failed to start next song: {e}")
 
 
+def start_head(actor, message=None, delay=0):
+    """
+    Start playing the head of the chat's queue, after `delay` seconds.
+    Returns it, or None if the queue is empty.
+    """
+    queue = chat_containers.get(actor.chat_id)
+    if not queue:
+        return None
+    # Top up from a pending playlist and keep the look-ahead window in
+    # sync with the new head of the queue
+    playlist_ingestor.refill(actor.chat_id)
+    prefetcher.schedule(actor.chat_id, queue)
+    release_direct(actor.chat_id)
+    actor.spawn(_play_next(actor.chat_id, queue.head, message, delay))
+    return queue.head
+
+
+@playback.command("enqueue")
+async def _enqueue_command(actor, song_info, message):
+    """Queue a song, starting it right away if the chat was idle. Returns its queue number (0 = playing)."""
+    was_idle = not chat_containers.get(actor.chat_id)
+    enqueue_song(actor.chat_id, song_info)
+    if was_idle:
+        start_head(actor, message)
+    return len(chat_containers[actor.chat_id]) - 1
+
+
+@playback.command("playlist")
+async def _playlist_command(actor, items, requester, message):
+    """Hand a playlist to the ingestor. Returns (first song enqueued, whether playback started)."""
+    was_idle = not chat_containers.get(actor.chat_id)
+    first_song = playlist_ingestor.start(actor.chat_id, items, requester)
+    if was_idle and first_song is not None:
+        start_head(actor, message)
+        return first_song, True
+    playlist_ingestor.refill(actor.chat_id)
+    return first_song, False
+
+
+@playback.command("play")
+async def _play_command(actor, song_info, message, keys):
+    """Play a song straight away, outside the queue (replied-to Telegram media), pinning `keys` meanwhile."""
+    pin_direct(actor.chat_id, song_info, keys)
+    actor.spawn(fallback_local_playback(actor.chat_id, message, song_info))
+
+
+@playback.command("skip")
+async def _skip_command(actor, expected=None):
+    """
+    Drop the current song and start the next one. With `expected`, only skip
+    if that song is still the one playing, so a double click skips once.
+    Returns (skipped, next song or None), or None if there was nothing to skip.
+    """
+    queue = chat_containers.get(actor.chat_id)
+    if not queue or (expected is not None and queue.head is not expected):
+        return None
+    skipped = pop_head(actor.chat_id)
+    actor.cancel_job()
+    try:
+        await call_py.leave_call(actor.chat_id)
+    except Exception as e:
+        print("Local leave_call error:", e)
+    asyncio.get_event_loop().call_later(STREAM_SWITCH_GRACE, release_song, skipped)
+    return skipped, start_head(actor, delay=STREAM_SWITCH_GRACE)
+
+
+@playback.command("stream_ended")
+async def _stream_ended_command(actor):
+    if actor.busy:
+        # A newer song is already being started; this end belongs to the old one.
+        return
+    release_direct(actor.chat_id)
+    queue = chat_containers.get(actor.chat_id)
+    if queue:
+        finished = pop_head(actor.chat_id)
+        # Keep the finished file pinned until the stream has fully ended
+        asyncio.get_event_loop().call_later(STREAM_SWITCH_GRACE, release_song, finished)
+        if start_head(actor, delay=STREAM_SWITCH_GRACE) is not None:
+            return
+    await leave_voice_chat(actor.chat_id)
+    await bot.send_message(actor.chat_id, "❌ No more songs in the queue.")
+
+
+@playback.command("start_failed")
+async def _start_failed_command(actor, song_info):
+    """Drop a song whose playback could not start, if it is still at the head."""
+    release_direct(actor.chat_id, song_info)
+    queue = chat_containers.get(actor.chat_id)
+    if queue and queue.head is song_info:
+        release_song(pop_head(actor.chat_id))
+
+
+@playback.command("clear")
+async def _clear_command(actor):
+    if actor.chat_id not in chat_containers:
+        return False
+    release_queue(actor.chat_id)
+    return True
+
+
+@playback.command("stop")
+async def _stop_command(actor):
+    """Clear the queue and leave the call; leave_call errors propagate to the sender."""
+    actor.cancel_job()
+    release_queue(actor.chat_id)
+    release_direct(actor.chat_id)
+    if actor.chat_id in playback_tasks:
+        playback_tasks.pop(actor.chat_id).cancel()
+    await call_py.leave_call(actor.chat_id)
+
+
+
 
 def safe_handler(func):
     async def wrapper(*args, **kwargs):
@@ -244,78 +450,8 @@ async def is_api_assistant_in_chat(chat_id):
     except Exception as e:
         print(f"Error checking API assistant in chat: {e}")
         return False
-    
-def iso8601_to_seconds(iso_duration):
-    try:
-        duration = isodate.parse_duration(iso_duration)
-        return int(duration.total_seconds())
-    except Exception as e:
-        print(f"Error parsing duration: {e}")
-        return 0
-
 
-def iso8601_to_human_readable(iso_duration):
-    try:
-        duration = isodate.parse_duration(iso_duration)
-        total_seconds = int(duration.total_seconds())
-        hours, remainder = divmod(total_seconds, 3600)
-        minutes, seconds = divmod(remainder, 60)
-        if hours > 0:
-            return f"{hours}:{minutes:02}:{seconds:02}"
-        return f"{minutes}:{seconds:02}"
-    except Exception as e:
-        return "Unknown duration"
 
-async def fetch_youtube_link(query):
-    try:
-        url = f"https://fastyoutubeapi.onrender.com/search?title={query}"
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    # Check if the API response contains a playlist
-                    if "playlist" in data:
-                        return data
-                    else:
-                        return (
-                            data.get("link"),
-                            data.get("title"),
-                            data.get("duration"),
-                            data.get("thumbnail")
-                        )
-                else:
-                    raise Exception(f"API returned status code {response.status}")
-    except Exception as e:
-        raise Exception(f"Failed to fetch YouTube link: {str(e)}")
-
-
-    
-async def fetch_youtube_link_backup(query):
-    if not BACKUP_SEARCH_API_URL:
-        raise Exception("Backup Search API URL not configured")
-    # Build the correct URL:
-    backup_url = (
-        f"{BACKUP_SEARCH_API_URL.rstrip('/')}"
-        f"/search?title={urllib.parse.quote(query)}"
-    )
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(backup_url, timeout=30) as resp:
-                if resp.status != 200:
-                    raise Exception(f"Backup API returned status {resp.status}")
-                data = await resp.json()
-                # Mirror primary API’s return:
-                if "playlist" in data:
-                    return data
-                return (
-                    data.get("link"),
-                    data.get("title"),
-                    data.get("duration"),
-                    data.get("thumbnail")
-                )
-    except Exception as e:
-        raise Exception(f"Backup Search API error: {e}")
-    
 BOT_NAME = os.environ.get("BOT_NAME", "Frozen Music")
 BOT_LINK = os.environ.get("BOT_LINK", "https://t.me/vcmusiclubot")
 
@@ -408,11 +544,9 @@ async def start_handler(_, message):
     chat_id = message.chat.id
     chat_type = message.chat.type
     if chat_type == ChatType.PRIVATE:
-        if not broadcast_collection.find_one({"chat_id": chat_id}):
-            broadcast_collection.insert_one({"chat_id": chat_id, "type": "private"})
+        await broadcast_registry.register(chat_id, "private")
     elif chat_type in [ChatType.GROUP, ChatType.SUPERGROUP]:
-        if not broadcast_collection.find_one({"chat_id": chat_id}):
-            broadcast_collection.insert_one({"chat_id": chat_id, "type": "group"})
+        await broadcast_registry.register(chat_id, "group")
 
 
 
@@ -557,45 +691,36 @@ async def help_util_callback(_, callback_query):
 async def play_handler(_, message: Message):
     chat_id = message.chat.id
 
-    # If replying to an audio/video message, handle local playback
-    if message.reply_to_message and (message.reply_to_message.audio or message.reply_to_message.video):
+    # If replying to an audio/video/voice message, handle local playback
+    reply = message.reply_to_message
+    if reply and (reply.audio or reply.video or reply.voice):
         processing_message = await message.reply("❄️")
 
-        # Fetch fresh media reference and download
-        orig = message.reply_to_message
-        fresh = await bot.get_messages(orig.chat.id, orig.id)
-        media = fresh.video or fresh.audio
-        if fresh.audio and getattr(fresh.audio, 'file_size', 0) > 100 * 1024 * 1024:
-            await processing_message.edit("❌ Audio file too large. Maximum allowed size is 100MB.")
-            return
-
-        await processing_message.edit("⏳ Please wait, downloading audio…")
-        try:
-            file_path = await bot.download_media(media)
-        except Exception as e:
-            await processing_message.edit(f"❌ Failed to download media: {e}")
-            return
-
-        # Download thumbnail if available
-        thumb_path = None
-        try:
-            thumbs = fresh.video.thumbs if fresh.video else fresh.audio.thumbs
-            thumb_path = await bot.download_media(thumbs[0])
-        except Exception:
-            pass
+        # Telegram media is cached by file_unique_id, so a file that was played
+        # before needs neither a fresh file reference nor a download.
+        media = reply.video or reply.audio or reply.voice
+        key = telegram_track_id(media.file_unique_id)
+        if not audio_cache.peek(key):
+            fresh = await bot.get_messages(reply.chat.id, reply.id)
+            media = fresh.video or fresh.audio or fresh.voice
+            if fresh.audio and getattr(fresh.audio, 'file_size', 0) > 100 * 1024 * 1024:
+                await processing_message.edit("❌ Audio file too large. Maximum allowed size is 100MB.")
+                return
+            await processing_message.edit("⏳ Please wait, downloading audio…")
+
+        # Stream into the cache; playback starts once a prefix has arrived
+        key = start_telegram_download(bot, media, default_suffix=".mp4" if reply.video else ".ogg" if reply.voice else ".mp3")
+
+        # Thumbnail, also cached by file_unique_id
+        thumbs = getattr(media, 'thumbs', None)
+        thumb_path = await cached_thumbnail(bot, thumbs[0] if thumbs else None)
+        keys = [key] + ([THUMBNAIL_KEY_PREFIX + thumbs[0].file_unique_id] if thumb_path else [])
 
         # Prepare song_info and fallback to local playback
         duration = media.duration or 0
-        title = getattr(media, 'file_name', 'Untitled')
-        song_info = {
-            'url': file_path,
-            'title': title,
-            'duration': format_time(duration),
-            'duration_seconds': duration,
-            'requester': message.from_user.first_name,
-            'thumbnail': thumb_path
-        }
-        await fallback_local_playback(chat_id, processing_message, song_info)
+        title = getattr(media, 'file_name', None) or ('Voice note' if reply.voice else 'Untitled')
+        song_info = Track(key, title, duration, message.from_user.first_name, thumb_path)
+        await playback.send(chat_id, "play", song_info, processing_message, keys)
         return
 
     # Otherwise, process query-based search
@@ -607,19 +732,6 @@ async def play_handler(_, message: Message):
     except Exception:
         pass
 
-    # Enforce cooldown
-    now_ts = time.time()
-    if chat_id in chat_last_command and (now_ts - chat_last_command[chat_id]) < COOLDOWN:
-        remaining = int(COOLDOWN - (now_ts - chat_last_command[chat_id]))
-        if chat_id in chat_pending_commands:
-            await bot.send_message(chat_id, f"⏳ A command is already queued for this chat. Please wait {remaining}s.")
-        else:
-            cooldown_reply = await bot.send_message(chat_id, f"⏳ On cooldown. Processing in {remaining}s.")
-            chat_pending_commands[chat_id] = (message, cooldown_reply)
-            asyncio.create_task(process_pending_command(chat_id, remaining))
-        return
-    chat_last_command[chat_id] = now_ts
-
     if not query:
         await bot.send_message(
             chat_id,
@@ -628,6 +740,32 @@ async def play_handler(_, message: Message):
         )
         return
 
+    # Enforce rate limits. A queued request keeps its parsed query, so it is
+    # not re-run through this handler on the already-deleted message.
+    notice = []
+
+    async def run_queued():
+        for reply in notice:
+            try:
+                await reply.delete()
+            except Exception:
+                pass
+        await process_play_command(message, query)
+
+    user_id = message.from_user.id if message.from_user else None
+    admission = play_limiter.submit(chat_id, user_id, run_queued)
+    if admission.status == Admission.USER_LIMITED:
+        await bot.send_message(chat_id, f"⏳ You're sending requests too fast. Please wait {math.ceil(admission.wait)}s.")
+        return
+    if admission.status == Admission.CHAT_FULL:
+        await bot.send_message(chat_id, f"⏳ Too many requests are already queued for this chat. Please wait {math.ceil(admission.wait)}s.")
+        return
+    if admission.status == Admission.QUEUED:
+        notice.append(await bot.send_message(
+            chat_id, f"⏳ Request queued (#{admission.position}). Processing in {math.ceil(admission.wait)}s."
+        ))
+        return
+
     # Delegate to query processor
     await process_play_command(message, query)
 
@@ -653,63 +791,48 @@ async def process_play_command(message: Message, query: str):
             # invite_assistant handles error editing
             return
 
-    # Convert short URLs to full YouTube URLs
-    if "youtu.be" in query:
-        m = re.search(r"youtu\.be/([^?&]+)", query)
-        if m:
-            query = f"https://www.youtube.com/watch?v={m.group(1)}"
-
-    # Perform YouTube search and handle results
+    # Resolve the query: YouTube links to known video IDs are answered from the
+    # caches, anything else is searched (backup hedged in if the primary is slow)
     try:
-        result = await fetch_youtube_link(query)
-    except Exception as primary_err:
+        async with timed_stage("play.search"):
+            result = await resolvers.resolve(query)
+    except HedgeFailed as e:
         await processing_message.edit(
-            "⚠️ Primary search failed. Using backup API, this may take a few seconds…"
+            f"❌ Both search APIs failed:\n"
+            f"Primary: {e.errors.get('primary', 'cancelled')}\n"
+            f"Backup:  {e.errors.get('backup', 'not tried')}"
         )
-        try:
-            result = await fetch_youtube_link_backup(query)
-        except Exception as backup_err:
-            await processing_message.edit(
-                f"❌ Both search APIs failed:\n"
-                f"Primary: {primary_err}\n"
-                f"Backup:  {backup_err}"
-            )
-            return
+        return
 
     # Handle playlist vs single video
-    if isinstance(result, dict) and "playlist" in result:
-        playlist_items = result["playlist"]
+    if isinstance(result, PlaylistResult):
+        playlist_items = result.items
         if not playlist_items:
             await processing_message.edit("❌ No videos found in the playlist.")
             return
 
-        chat_containers.setdefault(chat_id, [])
-        for item in playlist_items:
-            secs = isodate.parse_duration(item["duration"]).total_seconds()
-            chat_containers[chat_id].append({
-                "url": item["link"],
-                "title": item["title"],
-                "duration": iso8601_to_human_readable(item["duration"]),
-                "duration_seconds": secs,
-                "requester": message.from_user.first_name if message.from_user else "Unknown",
-                "thumbnail": item["thumbnail"]
-            })
-
-        total = len(playlist_items)
+        # Only the first playable item is enqueued now; the rest follow in
+        # small batches as playback advances (see PlaylistIngestor).
+        requester = message.from_user.first_name if message.from_user else "Unknown"
+        first_song, started = await playback.send(chat_id, "playlist", playlist_items, requester, processing_message)
+        if first_song is None and playlist_ingestor.remaining(chat_id) == 0:
+            await processing_message.edit(
+                "❌ No playable videos in the playlist (all longer than 15 min or unavailable)."
+            )
+            return
+
         reply_text = (
             f"✨ Added to playlist\n"
-            f"Total songs added to queue: {total}\n"
-            f"#1 - {playlist_items[0]['title']}"
+            f"Total songs in playlist: {len(playlist_items)}\n"
         )
-        if total > 1:
-            reply_text += f"\n#2 - {playlist_items[1]['title']}"
+        if first_song is not None:
+            reply_text += f"#1 - {first_song.title}"
+        else:
+            reply_text += f"The queue is full ({QUEUE_LIMIT}); songs will be added as it drains."
         await message.reply(reply_text)
 
-        # If first playlist song, start playback
-        if len(chat_containers[chat_id]) == total:
-            first_song_info = chat_containers[chat_id][0]
-            await fallback_local_playback(chat_id, processing_message, first_song_info)
-        else:
+        # Playback already started if the queue was empty
+        if not started:
             await processing_message.delete()
 
     else:
@@ -720,28 +843,20 @@ async def process_play_command(message: Message, query: str):
             )
             return
 
-        secs = isodate.parse_duration(duration_iso).total_seconds()
+        # Known-track metadata may carry no duration, or one that is not ISO-8601
+        secs = parse_iso_duration(duration_iso) or 0
         if secs > MAX_DURATION_SECONDS:
             await processing_message.edit(
                 "❌ Streams longer than 15 min are not allowed. If u are the owner of this bot contact @xyz09723 to upgrade your plan"
             )
             return
 
-        readable = iso8601_to_human_readable(duration_iso)
-        chat_containers.setdefault(chat_id, [])
-        chat_containers[chat_id].append({
-            "url": video_url,
-            "title": title,
-            "duration": readable,
-            "duration_seconds": secs,
-            "requester": message.from_user.first_name if message.from_user else "Unknown",
-            "thumbnail": thumb
-        })
-
-        # If it's the first song, start playback immediately using fallback
-        if len(chat_containers[chat_id]) == 1:
-            await fallback_local_playback(chat_id, processing_message, chat_containers[chat_id][0])
-        else:
+        requester = message.from_user.first_name if message.from_user else "Unknown"
+        song = Track(video_url, title, secs, requester, thumb)
+
+        # If it's the first song, playback starts immediately
+        position = await playback.send(chat_id, "enqueue", song, processing_message)
+        if position > 0:
             queue_buttons = InlineKeyboardMarkup([
                 [InlineKeyboardButton("⏭ Skip", callback_data="skip"),
                  InlineKeyboardButton("🗑 Clear", callback_data="clear")]
@@ -749,9 +864,9 @@ async def process_play_command(message: Message, query: str):
             await message.reply(
                 f"✨ Added to queue :\n\n"
                 f"**❍ Title ➥** {title}\n"
-                f"**❍ Time ➥** {readable}\n"
-                f"**❍ By ➥ ** {message.from_user.first_name if message.from_user else 'Unknown'}\n"
-                f"**Queue number:** {len(chat_containers[chat_id]) - 1}",
+                f"**❍ Time ➥** {song.duration}\n"
+                f"**❍ By ➥ ** {requester}\n"
+                f"**Queue number:** {position}",
                 reply_markup=queue_buttons
             )
             await processing_message.delete()
@@ -884,7 +999,7 @@ async def update_progress_caption(
 
 LOG_CHAT_ID = "@frozenmusiclogs"
 
-async def fallback_local_playback(chat_id: int, message: Message, song_info: dict):
+async def fallback_local_playback(chat_id: int, message: Message, song_info: Track):
     playback_mode[chat_id] = "local"
     try:
         # Cancel any existing playback task
@@ -892,37 +1007,60 @@ async def fallback_local_playback(chat_id: int, message: Message, song_info: dic
             playback_tasks[chat_id].cancel()
 
         # Validate URL
-        video_url = song_info.get("url")
+        video_url = song_info.url
         if not video_url:
             print(f"Invalid video URL for song: {song_info}")
-            chat_containers[chat_id].pop(0)
+            playback.post(chat_id, "start_failed", song_info)
             return
 
         # Notify
         try:
-            await message.edit(f"Starting local playback for ⚡ {song_info['title']}...")
+            await message.edit(f"Starting local playback for ⚡ {song_info.title}...")
         except Exception:
             message = await bot.send_message(
                 chat_id,
-                f"Starting local playback for ⚡ {song_info['title']}..."
+                f"Starting local playback for ⚡ {song_info.title}..."
+            )
+
+        # Download (or pick up the prefetched file) & play locally
+        async with timed_stage("play.download"):
+            media_path = await prefetcher.resolve(chat_id, video_url)
+        async with timed_stage("play.start"):
+            await call_py.play(
+                chat_id,
+                MediaStream(media_path, video_flags=MediaStream.Flags.IGNORE)
             )
+        track_index.record_song(song_info)
+        if media_path.startswith("http://"):
+            asyncio.create_task(watch_progressive_download(chat_id, song_info))
 
-        # Download & play locally
-        media_path = await vector_transport_resolver(video_url)
-        await call_py.play(
+        # The stream is live, so the start job ends here: a stream end from now
+        # on belongs to this song. The now-playing message runs on its own.
+        playback_tasks[chat_id] = asyncio.create_task(announce_local_playback(chat_id, message, song_info))
+
+    except Exception as e:
+        print(f"Error during fallback local playback in chat {chat_id}: {e}")
+        await bot.send_message(
             chat_id,
-            MediaStream(media_path, video_flags=MediaStream.Flags.IGNORE)
+            f"❌ Failed to play “{song_info.title}” locally: {e}"
         )
-        playback_tasks[chat_id] = asyncio.current_task()
 
+        playback.post(chat_id, "start_failed", song_info)
+
+
+
+
+async def announce_local_playback(chat_id: int, message: Message, song_info: Track):
+    """Post the now-playing message for a stream that has started, then keep its progress bar updated."""
+    try:
         # Prepare caption & keyboard
-        total_duration = parse_duration_str(song_info.get("duration", "0:00"))
-        one_line = _one_line_title(song_info["title"])
+        total_duration = song_info.duration_seconds
+        one_line = _one_line_title(song_info.title)
         base_caption = (
             "<blockquote>"
             "<b>🎧 Frozen ✘ Music Streaming</b> (Local Playback)\n\n"
             f"❍ <b>Title:</b> {one_line}\n"
-            f"❍ <b>Requested by:</b> {song_info['requester']}"
+            f"❍ <b>Requested by:</b> {song_info.requester}"
             "</blockquote>"
         )
         initial_progress = get_progress_bar_styled(0, total_duration)
@@ -937,7 +1075,7 @@ async def fallback_local_playback(chat_id: int, message: Message, song_info: dic
         base_keyboard = InlineKeyboardMarkup([control_row, [progress_button]])
 
         # Use raw thumbnail if available
-        thumb_url = song_info.get("thumbnail")
+        thumb_url = song_info.thumbnail
         progress_message = await message.reply_photo(
             photo=thumb_url,
             caption=base_caption,
@@ -948,40 +1086,46 @@ async def fallback_local_playback(chat_id: int, message: Message, song_info: dic
         # Remove "processing" message
         await message.delete()
 
-        # Kick off progress updates
-        asyncio.create_task(
-            update_progress_caption(
-                chat_id,
-                progress_message,
-                time.time(),
-                total_duration,
-                base_caption
-            )
-        )
-
         # Log start
         asyncio.create_task(
             bot.send_message(
                 LOG_CHAT_ID,
                 "#started_streaming\n"
-                f"• Title: {song_info.get('title','Unknown')}\n"
-                f"• Duration: {song_info.get('duration','Unknown')}\n"
-                f"• Requested by: {song_info.get('requester','Unknown')}\n"
+                f"• Title: {song_info.title}\n"
+                f"• Duration: {song_info.duration}\n"
+                f"• Requested by: {song_info.requester}\n"
                 f"• Mode: local"
             )
         )
 
-    except Exception as e:
-        print(f"Error during fallback local playback in chat {chat_id}: {e}")
-        await bot.send_message(
+        # Keep the progress bar moving until the song ends or is stopped
+        await update_progress_caption(
             chat_id,
-            f"❌ Failed to play “{song_info.get('title','Unknown')}” locally: {e}"
+            progress_message,
+            time.time(),
+            total_duration,
+            base_caption
         )
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print(f"Error showing now playing in chat {chat_id}: {e}")
 
-        if chat_id in chat_containers and chat_containers[chat_id]:
-            chat_containers[chat_id].pop(0)
 
 
+async def watch_progressive_download(chat_id: int, song_info: Track):
+    """Tell the chat when a track that started progressively fails to finish downloading."""
+    try:
+        await wait_for_transfer(song_info.url)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print(f"Progressive download failed in chat {chat_id}: {e}")
+        await bot.send_message(
+            chat_id,
+            f"⚠️ Download of “{song_info.title}” broke off mid-track; skipping ahead when it ends.\n{e}"
+        )
+
 
 
 @bot.on_callback_query()
@@ -1016,34 +1160,14 @@ async def callback_query_handler(client, callback_query):
 
     # ----------------- SKIP -----------------
     elif data == "skip":
-        if chat_id in chat_containers and chat_containers[chat_id]:
-            skipped_song = chat_containers[chat_id].pop(0)
-
-            try:
-                await call_py.leave_call(chat_id)
-            except Exception as e:
-                print("Local leave_call error:", e)
-            await asyncio.sleep(3)
-
-            try:
-                os.remove(skipped_song.get('file_path', ''))
-            except Exception as e:
-                print(f"Error deleting file: {e}")
-
-            await client.send_message(chat_id, f"⏩ {user.first_name} skipped **{skipped_song['title']}**.")
-
-            if chat_id in chat_containers and chat_containers[chat_id]:
+        queue = chat_containers.get(chat_id)
+        # Tie the skip to the song playing now, so a double click skips it only once
+        result = await playback.send(chat_id, "skip", queue.head) if queue else None
+        if result is not None:
+            skipped_song, next_song_info = result
+            await client.send_message(chat_id, f"⏩ {user.first_name} skipped **{skipped_song.title}**.")
+            if next_song_info is not None:
                 await callback_query.answer("⏩ Skipped! Playing next song...")
-
-                # Play next song directly using fallback_local_playback
-                next_song_info = chat_containers[chat_id][0]
-                try:
-                    dummy_msg = await bot.send_message(chat_id, f"🎧 Preparing next song: **{next_song_info['title']}** ...")
-                    await fallback_local_playback(chat_id, dummy_msg, next_song_info)
-                except Exception as e:
-                    print(f"Error starting next local playback: {e}")
-                    await bot.send_message(chat_id, f"❌ Failed to start next song: {e}")
-
             else:
                 await callback_query.answer("⏩ Skipped! No more songs in the queue.")
         else:
@@ -1051,13 +1175,7 @@ async def callback_query_handler(client, callback_query):
 
     # ----------------- CLEAR -----------------
     elif data == "clear":
-        if chat_id in chat_containers:
-            for song in chat_containers[chat_id]:
-                try:
-                    os.remove(song.get('file_path', ''))
-                except Exception as e:
-                    print(f"Error deleting file: {e}")
-            chat_containers.pop(chat_id)
+        if await playback.send(chat_id, "clear"):
             await callback_query.message.edit("🗑️ Cleared the queue.")
             await callback_query.answer("🗑️ Cleared the queue.")
         else:
@@ -1065,16 +1183,8 @@ async def callback_query_handler(client, callback_query):
 
     # ----------------- STOP -----------------
     elif data == "stop":
-        if chat_id in chat_containers:
-            for song in chat_containers[chat_id]:
-                try:
-                    os.remove(song.get('file_path', ''))
-                except Exception as e:
-                    print(f"Error deleting file: {e}")
-            chat_containers.pop(chat_id)
-
         try:
-            await call_py.leave_call(chat_id)
+            await playback.send(chat_id, "stop")
             await callback_query.answer("🛑 Playback stopped and queue cleared.")
             await client.send_message(chat_id, f"🛑 Playback stopped and queue cleared by {user.first_name}.")
         except Exception as e:
@@ -1086,36 +1196,8 @@ async def callback_query_handler(client, callback_query):
 
 @call_py.on_update(fl.stream_end())
 async def stream_end_handler(_: PyTgCalls, update: StreamEnded):
-    chat_id = update.chat_id
-
-    if chat_id in chat_containers and chat_containers[chat_id]:
-        # Remove the finished song from the queue
-        skipped_song = chat_containers[chat_id].pop(0)
-        await asyncio.sleep(3)  # Delay to ensure the stream has fully ended
-
-        try:
-            os.remove(skipped_song.get('file_path', ''))
-        except Exception as e:
-            print(f"Error deleting file: {e}")
-
-        if chat_id in chat_containers and chat_containers[chat_id]:
-            # If there are more songs, play next song directly using fallback_local_playback
-            next_song_info = chat_containers[chat_id][0]
-            try:
-                # Create a fake message object to pass
-                dummy_msg = await bot.send_message(chat_id, f"🎧 Preparing next song: **{next_song_info['title']}** ...")
-                await fallback_local_playback(chat_id, dummy_msg, next_song_info)
-            except Exception as e:
-                print(f"Error starting next local playback: {e}")
-                await bot.send_message(chat_id, f"❌ Failed to start next song: {e}")
-        else:
-            # Queue empty; leave VC
-            await leave_voice_chat(chat_id)
-            await bot.send_message(chat_id, "❌ No more songs in the queue.")
-    else:
-        # No songs in the queue
-        await leave_voice_chat(chat_id)
-        await bot.send_message(chat_id, "❌ No more songs in the queue.")
+    # Advancing the queue is the chat actor's job; don't hold up pytgcalls for it
+    playback.post(update.chat_id, "stream_ended")
 
 
 
@@ -1125,13 +1207,8 @@ async def leave_voice_chat(chat_id):
     except Exception as e:
         print(f"Error leaving the voice chat: {e}")
 
-    if chat_id in chat_containers:
-        for song in chat_containers[chat_id]:
-            try:
-                os.remove(song.get('file_path', ''))
-            except Exception as e:
-                print(f"Error deleting file: {e}")
-        chat_containers.pop(chat_id)
+    release_queue(chat_id)
+    release_direct(chat_id)
 
     if chat_id in playback_tasks:
         playback_tasks[chat_id].cancel()
@@ -1148,8 +1225,9 @@ async def stop_handler(client, message):
         await message.reply("❌ You need to be an admin to use this command.")
         return
 
+    # Clears the queue and playback tasks, then leaves the call
     try:
-        await call_py.leave_call(chat_id)
+        await playback.send(chat_id, "stop")
     except Exception as e:
         if "not in a call" in str(e).lower():
             await message.reply("❌ The bot is not currently in a voice chat.")
@@ -1157,20 +1235,6 @@ async def stop_handler(client, message):
             await message.reply(f"❌ An error occurred while leaving the voice chat: {str(e)}\n\nSupport: @frozensupport1")
         return
 
-    # Clear the song queue
-    if chat_id in chat_containers:
-        for song in chat_containers[chat_id]:
-            try:
-                os.remove(song.get('file_path', ''))
-            except Exception as e:
-                print(f"Error deleting file: {e}")
-        chat_containers.pop(chat_id)
-
-    # Cancel any playback tasks if present
-    if chat_id in playback_tasks:
-        playback_tasks[chat_id].cancel()
-        del playback_tasks[chat_id]
-
     await message.reply("⏹ Stopped the music and cleared the queue.")
 
 
@@ -1229,38 +1293,21 @@ async def skip_handler(client, message):
 
     status_message = await message.reply("⏩ Skipping the current song...")
 
-    if chat_id not in chat_containers or not chat_containers[chat_id]:
+    # Leaves the call, releases the song and starts the next one, if any
+    result = await playback.send(chat_id, "skip")
+    if result is None:
         await status_message.edit("❌ No songs in the queue to skip.")
         return
 
-    # Remove the current song from the queue
-    skipped_song = chat_containers[chat_id].pop(0)
-
-    # Always local mode only
-    try:
-        await call_py.leave_call(chat_id)
-    except Exception as e:
-        print("Local leave_call error:", e)
-
-    await asyncio.sleep(3)
-
-    # Delete the local file if exists
-    try:
-        if skipped_song.get('file_path'):
-            os.remove(skipped_song['file_path'])
-    except Exception as e:
-        print(f"Error deleting file: {e}")
-
-    # Check for next song
-    if not chat_containers.get(chat_id):
+    skipped_song, next_song_info = result
+    if next_song_info is None:
         await status_message.edit(
-            f"⏩ Skipped **{skipped_song['title']}**.\n\n😔 No more songs in the queue."
+            f"⏩ Skipped **{skipped_song.title}**.\n\n😔 No more songs in the queue."
         )
     else:
         await status_message.edit(
-            f"⏩ Skipped **{skipped_song['title']}**.\n\n💕 Playing the next song..."
+            f"⏩ Skipped **{skipped_song.title}**.\n\n💕 Playing the next song..."
         )
-        await skip_to_next_song(chat_id, status_message)
 
 
 
@@ -1270,24 +1317,15 @@ async def reboot_handler(_, message):
     chat_id = message.chat.id
 
     try:
-        # Remove audio files for songs in the queue for this chat.
-        if chat_id in chat_containers:
-            for song in chat_containers[chat_id]:
-                try:
-                    os.remove(song.get('file_path', ''))
-                except Exception as e:
-                    print(f"Error deleting file for chat {chat_id}: {e}")
-            # Clear the queue for this chat.
-            chat_containers.pop(chat_id, None)
-        
-        # Cancel any playback tasks for this chat.
-        if chat_id in playback_tasks:
-            playback_tasks[chat_id].cancel()
-            del playback_tasks[chat_id]
+        # Release cached audio for songs in the queue, clear it, cancel
+        # playback tasks and leave the voice chat.
+        try:
+            await playback.send(chat_id, "stop")
+        except Exception as e:
+            print(f"Error leaving call for chat {chat_id}: {e}")
 
-        # Remove chat-specific cooldown and pending command entries.
-        chat_last_command.pop(chat_id, None)
-        chat_pending_commands.pop(chat_id, None)
+        # Drop the chat's rate-limit state and any queued /play requests.
+        play_limiter.reset(chat_id)
 
         # Remove playback mode for this chat.
         playback_mode.pop(chat_id, None)
@@ -1296,12 +1334,6 @@ async def reboot_handler(_, message):
         global api_playback_records
         api_playback_records = [record for record in api_playback_records if record.get("chat_id") != chat_id]
 
-        # Leave the voice chat for this chat.
-        try:
-            await call_py.leave_call(chat_id)
-        except Exception as e:
-            print(f"Error leaving call for chat {chat_id}: {e}")
-
         await message.reply("♻️ Rebooted for this chat. All data for this chat has been cleared.")
     except Exception as e:
         await message.reply(f"❌ Failed to reboot for this chat. Error: {str(e)}\n\n support - @frozensupport1")
@@ -1344,15 +1376,8 @@ async def ping_handler(_, message):
 async def clear_handler(_, message):
     chat_id = message.chat.id
 
-    if chat_id in chat_containers:
-        # Clear the chat-specific queue
-        for song in chat_containers[chat_id]:
-            try:
-                os.remove(song.get('file_path', ''))
-            except Exception as e:
-                print(f"Error deleting file: {e}")
-        
-        chat_containers.pop(chat_id)
+    # Clear the chat-specific queue
+    if await playback.send(chat_id, "clear"):
         await message.reply("🗑️ Cleared the queue.")
     else:
         await message.reply("❌ No songs in the queue to clear.")
@@ -1360,43 +1385,38 @@ async def clear_handler(_, message):
 
 @bot.on_message(filters.command("broadcast") & filters.user(OWNER_ID))
 async def broadcast_handler(_, message):
-    # Ensure the command is used in reply to a message
+    # Without a reply, continue a broadcast a failure left unfinished
     if not message.reply_to_message:
-        await message.reply("❌ Please reply to the message you want to broadcast.")
+        if await broadcast_engine.resume():
+            await message.reply("🔁 Resuming the interrupted broadcast.")
+        else:
+            await message.reply("❌ Please reply to the message you want to broadcast.")
         return
 
     broadcast_message = message.reply_to_message
 
-    # Retrieve all broadcast chat IDs from the collection
-    all_chats = list(broadcast_collection.find({}))
-    success = 0
-    failed = 0
+    # Progress is reported by editing a status message in this chat
+    if not await broadcast_engine.start(broadcast_message.chat.id, broadcast_message.id, message.chat.id):
+        await message.reply("❌ A broadcast is already running. Use /stopbroadcast to cancel it.")
 
-    # Loop through each chat ID and forward the message
-    for chat in all_chats:
-        try:
-            # Ensure the chat ID is an integer (this will handle group IDs properly)
-            target_chat_id = int(chat.get("chat_id"))
-        except Exception as e:
-            print(f"Error casting chat_id: {chat.get('chat_id')} - {e}")
-            failed += 1
-            continue
 
-        try:
-            await bot.forward_messages(
-                chat_id=target_chat_id,
-                from_chat_id=broadcast_message.chat.id,
-                message_ids=broadcast_message.id
-            )
-            success += 1
-        except Exception as e:
-            print(f"Failed to broadcast to {target_chat_id}: {e}")
-            failed += 1
+@bot.on_message(filters.command("stopbroadcast") & filters.user(OWNER_ID))
+async def stop_broadcast_handler(_, message):
+    if not await broadcast_engine.cancel():
+        await message.reply("❌ No broadcast is running.")
 
-        # Wait for 1 second to avoid flooding the server and Telegram
-        await asyncio.sleep(1)
 
-    await message.reply(f"Broadcast complete!\n✅ Success: {success}\n❌ Failed: {failed}")
+@bot.on_message(filters.command("trackindex") & filters.user(OWNER_ID))
+async def track_index_handler(_, message):
+    # Rebuild or compact the local track index; both run for minutes on a background thread
+    task = message.command[1].lower() if len(message.command) > 1 else ""
+    if task not in ("rebuild", "compact"):
+        await message.reply("❌ Usage: /trackindex rebuild | compact")
+        return
+    if track_index.start_maintenance(task):
+        await message.reply(f"🛠️ Track index {task} started.")
+    else:
+        await message.reply("❌ Track index maintenance is already running (or the index is disabled).")
 
 
 
@@ -1406,38 +1426,35 @@ async def frozen_check_command(client: Client, message):
 
 
 
-def save_state_to_db():
+async def save_state_to_db():
     """
-    Persist only chat_containers (queues) into MongoDB before restart.
+    Write every chat queue to the store now, ahead of a restart.
     """
-    data = {
-        "chat_containers": { str(cid): queue for cid, queue in chat_containers.items() }
-    }
-
-    state_backup.replace_one(
-        {"_id": "singleton"},
-        {"_id": "singleton", "state": data},
-        upsert=True
-    )
-
-    chat_containers.clear()
+    await queue_store.flush(list(chat_containers))
 
 
-def load_state_from_db():
+async def load_state_from_db():
     """
-    Load persisted chat_containers (queues) from MongoDB on startup.
+    Load persisted chat queues from the store on startup. Only chats with
+    queued songs are read; a backup in the old single-document format is
+    imported once and then dropped.
     """
-    doc = state_backup.find_one_and_delete({"_id": "singleton"})
-    if not doc or "state" not in doc:
-        return
-
-    data = doc["state"]
+    queues = await queue_store.load()
 
-    for cid_str, queue in data.get("chat_containers", {}).items():
+    legacy = await bot_store.take_legacy_state()
+    for cid_str, queue in ((legacy or {}).get("state") or {}).get("chat_containers", {}).items():
         try:
-            chat_containers[int(cid_str)] = queue
+            cid = int(cid_str)
         except ValueError:
             continue
+        if queue and cid not in queues:
+            queues[cid] = queue
+            queue_store.mark(cid)
+
+    for cid, queue in queues.items():
+        chat_containers[cid] = ChatQueue.from_list(queue)
+        for song in chat_containers[cid]:
+            audio_cache.pin(canonical_track_id(song.url))
 
 
 
@@ -1451,8 +1468,23 @@ class WebhookHandler(BaseHTTPRequestHandler):
             self.send_response(200)
             self.end_headers()
             self.wfile.write(b"Bot status: Running")
+        elif self.path == "/metrics":
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(json.dumps(timing_snapshot(), indent=2).encode())
+        elif self.path == "/upstreams":
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            snapshot = {"upstreams": upstreams.snapshot(), "resolvers": resolvers.stats(), "queue_store": queue_store.stats(), "broadcast_registry": broadcast_registry.stats(), "broadcast": broadcast_engine.stats(), "play_limiter": play_limiter.stats()}
+            self.wfile.write(json.dumps(snapshot, indent=2).encode())
         elif self.path == "/restart":
-            save_state_to_db()
+            # This runs on the HTTP thread; the store belongs to the bot's event loop
+            try:
+                asyncio.run_coroutine_threadsafe(save_state_to_db(), main_loop).result(timeout=30)
+            except Exception as e:
+                print("Error saving state before restart:", e)
             os.execl(sys.executable, sys.executable, *sys.argv)
         else:
             self.send_response(404)
@@ -1492,12 +1524,12 @@ async def restart_bot():
     port = int(os.environ.get("PORT", 8080))
     url = f"http://localhost:{port}/restart"
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as resp:
-                if resp.status == 200:
-                    logger.info("Local restart endpoint triggered successfully.")
-                else:
-                    logger.error(f"Local restart endpoint failed: {resp.status}")
+        session = http_pool.session("local")
+        async with session.get(url) as resp:
+            if resp.status == 200:
+                logger.info("Local restart endpoint triggered successfully.")
+            else:
+                logger.error(f"Local restart endpoint failed: {resp.status}")
     except Exception as e:
         logger.error(f"Error calling local restart endpoint: {e}")
 
@@ -1539,8 +1571,25 @@ async def frozen_check_loop(bot_username: str):
 logger = logging.getLogger(__name__)
 
 if __name__ == "__main__":
-    logger.info("Loading persisted state from MongoDB...")
-    load_state_from_db()
+    logger.info("Loading audio cache index...")
+    audio_cache.load()
+    logger.info("Reclaiming orphaned media files...")
+    janitor.start()
+    search_cache.load()
+    track_index.open()
+    asyncio.get_event_loop().run_until_complete(http_pool.start())
+    asyncio.get_event_loop().run_until_complete(progressive_server.start())
+    asyncio.get_event_loop().run_until_complete(media_workers.start())
+    asyncio.get_event_loop().run_until_complete(bot_store.open())
+    upstreams.start()
+    queue_store.start()
+
+    logger.info(f"Loading persisted state from {bot_store.name}...")
+    asyncio.get_event_loop().run_until_complete(load_state_from_db())
+    try:
+        asyncio.get_event_loop().run_until_complete(broadcast_registry.warm())
+    except Exception as e:
+        logger.warning(f"Broadcast registry not warmed, registrations will query the store: {e}")
     logger.info("State loaded successfully.")
 
     logger.info("→ Starting PyTgCalls client...")
@@ -1566,6 +1615,12 @@ if __name__ == "__main__":
     # start the frozen‑check loop (no handler registration needed)
     asyncio.get_event_loop().create_task(frozen_check_loop(BOT_USERNAME))
 
+    # pick up a broadcast a restart interrupted
+    try:
+        asyncio.get_event_loop().run_until_complete(broadcast_engine.resume())
+    except Exception as e:
+        logger.error(f"❌ Failed to resume broadcast: {e}")
+
     if not assistant.is_connected:
         logger.info("Assistant not connected; starting assistant client...")
         assistant.run()
@@ -1588,6 +1643,18 @@ if __name__ == "__main__":
     idle()
 
     bot.stop()
+    playback.stop()
+    janitor.stop()
+    upstreams.stop()
+    asyncio.get_event_loop().run_until_complete(broadcast_engine.close())
+    asyncio.get_event_loop().run_until_complete(queue_store.close())
+    asyncio.get_event_loop().run_until_complete(bot_store.close())
+    asyncio.get_event_loop().run_until_complete(media_workers.close())
+    asyncio.get_event_loop().run_until_complete(progressive_server.close())
+    asyncio.get_event_loop().run_until_complete(http_pool.close())
+    audio_cache.flush()
+    search_cache.flush()
+    track_index.close()
     logger.info("Bot stopped.")
     logger.info("✅ All services are up and running. Bot started successfully.")
 
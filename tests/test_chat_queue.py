@@ -0,0 +1,47 @@
+from FrozenMusic.telegram_client.chat_queue import ChatQueue, Track
+
+
+def track(n, seconds=225):
+    return Track(f"https://example.com/{n}", f"Song {n}", seconds, "alice", f"/tmp/thumb{n}.jpg")
+
+
+def test_head_advances_in_order():
+    queue = ChatQueue()
+    for n in range(3):
+        queue.append(track(n))
+    assert queue.head.title == "Song 0"
+    assert queue.popleft().title == "Song 0"
+    assert queue.head.title == "Song 1"
+    assert len(queue) == 2
+
+
+def test_empty_queue():
+    queue = ChatQueue()
+    assert queue.head is None
+    assert queue.popleft() is None
+    assert not queue
+
+
+def test_window_is_bounded():
+    queue = ChatQueue(track(n) for n in range(10))
+    assert [t.title for t in queue.window(3)] == ["Song 0", "Song 1", "Song 2"]
+    assert len(queue.window(50)) == 10
+    assert queue.window(0) == []
+
+
+def test_duration_is_derived_from_seconds():
+    assert track(0, 225).duration == "3:45"
+    assert Track("u", "t", None).duration_seconds == 0
+
+
+def test_list_round_trip():
+    queue = ChatQueue(track(n) for n in range(2))
+    restored = ChatQueue.from_list(queue.to_list())
+    assert [(t.url, t.title, t.duration_seconds, t.requester, t.thumbnail) for t in restored] == [
+        (t.url, t.title, t.duration_seconds, t.requester, t.thumbnail) for t in queue
+    ]
+
+
+def test_decode_accepts_legacy_dicts():
+    song = Track.decode({"url": "u", "title": "t", "duration_seconds": 90, "thumbnail": "th"})
+    assert (song.url, song.title, song.duration_seconds, song.requester, song.thumbnail) == ("u", "t", 90, "Unknown", "th")
@@ -0,0 +1,81 @@
+import asyncio
+
+from FrozenMusic.infra.concurrency.command_limiter import Admission, CommandLimiter
+
+
+def test_within_burst_runs_immediately():
+    async def scenario():
+        limiter = CommandLimiter(chat_rate=1, chat_burst=2, user_rate=1, user_burst=5)
+        statuses = [limiter.submit(1, 10, None).status for _ in range(2)]
+        assert statuses == [Admission.RUN, Admission.RUN]
+
+    asyncio.run(scenario())
+
+
+def test_pending_commands_run_in_fifo_order():
+    async def scenario():
+        limiter = CommandLimiter(chat_rate=50, chat_burst=1, user_rate=100, user_burst=100)
+        ran = []
+
+        def job(n):
+            async def run():
+                ran.append(n)
+            return run
+
+        assert limiter.submit(1, 10, job(0)).status == Admission.RUN
+        admissions = [limiter.submit(1, 10 + n, job(n)) for n in range(1, 4)]
+        assert [a.status for a in admissions] == [Admission.QUEUED] * 3
+        assert [a.position for a in admissions] == [1, 2, 3]
+        await asyncio.wait_for(limiter.chats[1].drainer, 1)
+        assert ran == [1, 2, 3]
+
+    asyncio.run(scenario())
+
+
+def test_full_pending_queue_is_rejected():
+    async def scenario():
+        limiter = CommandLimiter(chat_rate=0.01, chat_burst=1, user_rate=100, user_burst=100, pending_limit=2)
+
+        async def noop():
+            pass
+
+        limiter.submit(1, None, noop)
+        limiter.submit(1, None, noop)
+        limiter.submit(1, None, noop)
+        admission = limiter.submit(1, None, noop)
+        assert admission.status == Admission.CHAT_FULL
+        assert admission.wait > 0
+        limiter.reset(1)
+
+    asyncio.run(scenario())
+
+
+def test_user_over_limit_is_turned_away():
+    async def scenario():
+        limiter = CommandLimiter(chat_rate=100, chat_burst=100, user_rate=0.5, user_burst=1)
+        assert limiter.submit(1, 10, None).status == Admission.RUN
+        admission = limiter.submit(2, 10, None)
+        assert admission.status == Admission.USER_LIMITED
+        assert admission.wait > 0
+        assert limiter.submit(2, 11, None).status == Admission.RUN
+
+    asyncio.run(scenario())
+
+
+def test_reset_drops_pending_commands():
+    async def scenario():
+        limiter = CommandLimiter(chat_rate=0.01, chat_burst=1, user_rate=100, user_burst=100)
+        ran = []
+
+        async def job():
+            ran.append(True)
+
+        limiter.submit(1, None, job)
+        limiter.submit(1, None, job)
+        drainer = limiter.chats[1].drainer
+        limiter.reset(1)
+        await asyncio.gather(drainer, return_exceptions=True)
+        assert ran == []
+        assert 1 not in limiter.chats
+
+    asyncio.run(scenario())
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from FrozenMusic.infra.http import hedged_request
+from FrozenMusic.infra.http.hedged_request import HedgeFailed, HedgedCall, LatencyWindow
+
+
+@pytest.fixture(autouse=True)
+def short_delay(monkeypatch):
+    monkeypatch.setattr(hedged_request, "HEDGE_DEFAULT_DELAY", 0.05)
+
+
+def answer(value, delay=0.0, error=None):
+    async def fn(query):
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return value
+    return fn
+
+
+def test_fast_primary_wins_without_hedging():
+    async def scenario():
+        hedged = HedgedCall("search", answer("primary"), answer("backup"))
+        assert await hedged("q") == "primary"
+        assert hedged.hedged == 0
+
+    asyncio.run(scenario())
+
+
+def test_slow_primary_is_hedged_and_cancelled():
+    async def scenario():
+        cancelled = asyncio.Event()
+
+        async def slow(query):
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        hedged = HedgedCall("search", slow, answer("backup"))
+        assert await asyncio.wait_for(hedged("q"), 1) == "backup"
+        assert hedged.hedged == 1
+        assert hedged.wins["backup"] == 1
+        await asyncio.wait_for(cancelled.wait(), 1)
+
+    asyncio.run(scenario())
+
+
+def test_primary_failure_starts_backup_at_once():
+    async def scenario():
+        hedged = HedgedCall("search", answer(None, error=RuntimeError("down")), answer("backup"))
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        assert await hedged("q") == "backup"
+        assert loop.time() - started < 0.05
+
+    asyncio.run(scenario())
+
+
+def test_unacceptable_answer_is_only_a_fallback():
+    async def scenario():
+        hedged = HedgedCall("search", answer("empty"), answer(None, error=RuntimeError("down")),
+                            acceptable=lambda r: r != "empty")
+        assert await hedged("q") == "empty"
+
+    asyncio.run(scenario())
+
+
+def test_both_failing_raises_hedge_failed():
+    async def scenario():
+        hedged = HedgedCall("search", answer(None, error=RuntimeError("a")), answer(None, error=RuntimeError("b")))
+        with pytest.raises(HedgeFailed) as excinfo:
+            await hedged("q")
+        assert set(excinfo.value.errors) == {"primary", "backup"}
+
+    asyncio.run(scenario())
+
+
+def test_delay_tracks_primary_p90_within_bounds():
+    hedged = HedgedCall("search", None, None)
+    for seconds in [0.1] * 8 + [2.0, 2.0]:
+        hedged.latency["primary"].record(seconds)
+    assert hedged.delay() == 2.0
+    hedged.latency["primary"] = LatencyWindow()
+    for _ in range(10):
+        hedged.latency["primary"].record(0.01)
+    assert hedged.delay() == hedged_request.HEDGE_MIN_DELAY
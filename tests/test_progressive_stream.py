@@ -0,0 +1,93 @@
+import asyncio
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from FrozenMusic.telegram_client import progressive_stream
+from FrozenMusic.telegram_client.progressive_stream import ProgressiveStreamServer
+from FrozenMusic.telegram_client.transfer_progress import ACTIVE_TRANSFERS, TransferProgress
+
+
+def serve(tmp_path, body: bytes, total=None):
+    partial = tmp_path / "track.part"
+    partial.write_bytes(body)
+    progress = TransferProgress("test:key", str(partial))
+    progress.bytes_written = len(body)
+    progress.total_bytes = total
+    ACTIVE_TRANSFERS["test:key"] = progress
+    app = web.Application()
+    app.router.add_get("/progressive/{key}", ProgressiveStreamServer().handle)
+    return progress, TestClient(TestServer(app))
+
+
+def run(coro):
+    try:
+        return asyncio.run(coro)
+    finally:
+        ACTIVE_TRANSFERS.pop("test:key", None)
+
+
+def test_failed_transfer_does_not_end_cleanly(tmp_path):
+    async def scenario():
+        progress, client = serve(tmp_path, b"x" * 1000)
+        async with client:
+            resp = await client.get("/progressive/test:key")
+            asyncio.get_running_loop().call_later(0.1, progress.fail, Exception("boom"))
+            with pytest.raises(aiohttp.ClientPayloadError):
+                await resp.read()
+
+    run(scenario())
+
+
+def test_stalled_transfer_does_not_end_cleanly(tmp_path, monkeypatch):
+    monkeypatch.setattr(progressive_stream, "PROGRESSIVE_STALL_TIMEOUT", 0.1)
+
+    async def scenario():
+        _, client = serve(tmp_path, b"x" * 1000)
+        async with client:
+            resp = await client.get("/progressive/test:key")
+            with pytest.raises(aiohttp.ClientPayloadError):
+                await resp.read()
+
+    run(scenario())
+
+
+def test_finished_transfer_ends_cleanly(tmp_path):
+    async def scenario():
+        progress, client = serve(tmp_path, b"x" * 1000)
+        async with client:
+            resp = await client.get("/progressive/test:key")
+            asyncio.get_running_loop().call_later(0.1, progress.finish, progress.partial_path)
+            assert await resp.read() == b"x" * 1000
+
+    run(scenario())
+
+
+def test_range_with_known_length(tmp_path):
+    async def scenario():
+        progress, client = serve(tmp_path, b"0123456789", total=20)
+        async with client:
+            resp = await client.get("/progressive/test:key", headers={"Range": "bytes=4-"})
+            assert resp.status == 206
+            assert resp.headers["Content-Range"] == "bytes 4-19/20"
+            resp.close()
+            resp = await client.get("/progressive/test:key", headers={"Range": "bytes=15-"})
+            assert resp.status == 416
+            assert resp.headers["Content-Range"] == "bytes */20"
+
+    run(scenario())
+
+
+def test_range_with_unknown_length_serves_from_start(tmp_path):
+    async def scenario():
+        progress, client = serve(tmp_path, b"0123456789")
+        async with client:
+            resp = await client.get("/progressive/test:key", headers={"Range": "bytes=4-"})
+            asyncio.get_running_loop().call_later(0.1, progress.finish, progress.partial_path)
+            assert resp.status == 200
+            assert "Content-Range" not in resp.headers
+            assert await resp.read() == b"0123456789"
+
+    run(scenario())
@@ -0,0 +1,85 @@
+import asyncio
+
+from FrozenMusic.infra.storage.queue_store import QueueStore
+
+
+class FakeStore:
+    def __init__(self, delay=0.0, fail=0):
+        self.delay = delay
+        self.fail = fail
+        self.queues = {}
+        self.calls = 0
+
+    async def write_queues(self, queues):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            self.fail -= 1
+            raise ConnectionError("database down")
+        for chat_id, encoded in queues.items():
+            if encoded:
+                self.queues[chat_id] = encoded
+            else:
+                self.queues.pop(chat_id, None)
+
+
+def test_marks_coalesce_into_one_write():
+    async def scenario():
+        store = FakeStore()
+        live = {1: [["u", "t", 1, "a"]]}
+        queues = QueueStore(store, lambda chat_id: live.get(chat_id, []), delay=0.01)
+        queues.start()
+        for _ in range(10):
+            queues.mark(1)
+        queues.mark(2)
+        await asyncio.sleep(0.05)
+        assert store.calls == 1
+        assert store.queues == {1: [["u", "t", 1, "a"]]}
+        await queues.close()
+
+    asyncio.run(scenario())
+
+
+def test_batches_split_large_flushes():
+    async def scenario():
+        store = FakeStore()
+        queues = QueueStore(store, lambda chat_id: [[chat_id]], batch=2)
+        for chat_id in range(5):
+            queues.mark(chat_id)
+        await queues.flush()
+        assert store.calls == 3
+        assert len(store.queues) == 5
+
+    asyncio.run(scenario())
+
+
+def test_failed_flush_keeps_chats_marked():
+    async def scenario():
+        store = FakeStore(fail=1)
+        queues = QueueStore(store, lambda chat_id: [[chat_id]])
+        queues.mark(1)
+        try:
+            await queues.flush()
+        except ConnectionError:
+            pass
+        assert queues.dirty == {1}
+        assert queues.failures == 1
+        await queues.flush()
+        assert store.queues == {1: [[1]]}
+
+    asyncio.run(scenario())
+
+
+def test_close_during_a_flush_loses_nothing():
+    async def scenario():
+        store = FakeStore(delay=0.2)
+        queues = QueueStore(store, lambda chat_id: [[chat_id]], delay=0.01)
+        queues.start()
+        queues.mark(1)
+        queues.mark(2)
+        await asyncio.sleep(0.05)
+        await queues.close()
+        assert store.queues == {1: [[1]], 2: [[2]]}
+        assert not queues.dirty
+
+    asyncio.run(scenario())
@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from FrozenMusic.infra.concurrency.single_flight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "file"
+
+    async def scenario():
+        flight = SingleFlight()
+        results = await asyncio.gather(*(flight.do("k", fetch) for _ in range(5)))
+        assert results == ["file"] * 5
+        assert calls == 1
+        assert not flight.in_flight("k")
+
+    asyncio.run(scenario())
+
+
+def test_followers_receive_the_leaders_exception():
+    async def fetch():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream down")
+
+    async def scenario():
+        flight = SingleFlight()
+        results = await asyncio.gather(*(flight.do("k", fetch) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(r, ValueError) and str(r) == "upstream down" for r in results)
+        assert not flight.in_flight("k")
+
+    asyncio.run(scenario())
+
+
+def test_cancelling_the_leader_does_not_strand_followers():
+    async def fetch():
+        await asyncio.sleep(0.05)
+        return "file"
+
+    async def scenario():
+        flight = SingleFlight()
+        leader = asyncio.ensure_future(flight.do("k", fetch))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do("k", fetch))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        assert await asyncio.wait_for(follower, 1) == "file"
+
+    asyncio.run(scenario())
+
+
+def test_last_waiter_leaving_cancels_the_call():
+    async def scenario():
+        stopped = asyncio.Event()
+
+        async def fetch():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                stopped.set()
+                raise
+
+        flight = SingleFlight()
+        waiter = asyncio.ensure_future(flight.do("k", fetch))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.wait_for(stopped.wait(), 1)
+        await asyncio.sleep(0)
+        assert not flight.in_flight("k")
+
+    asyncio.run(scenario())
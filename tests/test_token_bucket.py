@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from FrozenMusic.infra.concurrency import token_bucket
+from FrozenMusic.infra.concurrency.token_bucket import TokenBucket
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(token_bucket.time, "monotonic", clock)
+    return clock
+
+
+def test_burst_then_refill(clock):
+    bucket = TokenBucket(rate=2, capacity=3)
+    assert [bucket.try_consume() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.try_consume() == pytest.approx(0.5)
+    clock.now += 0.5
+    assert bucket.try_consume() == 0.0
+
+
+def test_refill_stops_at_capacity(clock):
+    bucket = TokenBucket(rate=10, capacity=2)
+    clock.now += 60
+    assert bucket.time_until(2) == 0.0
+    bucket.try_consume(2)
+    assert bucket.time_until() == pytest.approx(0.1)
+
+
+def test_oversized_request_is_paced_into_debt(clock):
+    bucket = TokenBucket(rate=100, capacity=50)
+    assert bucket.try_consume(200) == 0.0
+    assert bucket.tokens == -150
+    assert bucket.time_until() == pytest.approx(1.51)
+
+
+def test_time_until_does_not_consume(clock):
+    bucket = TokenBucket(rate=1, capacity=1)
+    assert bucket.time_until() == 0.0
+    assert bucket.try_consume() == 0.0
+
+
+def test_zero_rate_never_refills(clock):
+    bucket = TokenBucket(rate=0, capacity=1)
+    bucket.try_consume()
+    assert bucket.try_consume() == float("inf")
+
+
+def test_acquire_waits_for_a_token():
+    async def scenario():
+        bucket = TokenBucket(rate=50, capacity=1)
+        bucket.try_consume()
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await bucket.acquire()
+        assert loop.time() - started >= 0.015
+
+    asyncio.run(scenario())
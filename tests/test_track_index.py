@@ -0,0 +1,86 @@
+import time
+
+import pytest
+
+from FrozenMusic.infra.vector.results import TrackResult
+from FrozenMusic.infra.vector.track_index import TrackIndex, normalize_title, trigrams
+
+
+def result(video_id, title):
+    return TrackResult(f"https://www.youtube.com/watch?v={video_id}", title, "PT3M45S", None)
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = TrackIndex(str(tmp_path / "index.sqlite3"))
+    index.open()
+    yield index
+    index.close()
+
+
+def test_normalize_and_trigrams():
+    assert normalize_title("Beyoncé – HALO (Official Video)!") == "beyonce halo official video"
+    assert trigrams("of") == {"  o", " of", "of "}
+
+
+def test_lookup_finds_a_misspelled_title(index):
+    index.record_many([
+        result("aaaaaaaaaaa", "Ed Sheeran - Shape of You"),
+        result("bbbbbbbbbbb", "Adele - Rolling in the Deep"),
+    ])
+    track = index.lookup("shape of yuo sheeran")
+    assert track is not None and track.title == "Ed Sheeran - Shape of You"
+    assert index.lookup("completely unrelated words") is None
+
+
+def test_ambiguous_query_is_left_to_the_api(index):
+    index.record_many([
+        result("aaaaaaaaaaa", "Halo Remix"),
+        result("bbbbbbbbbbb", "Halo Acoustic"),
+    ])
+    assert index.lookup("halo") is None
+
+
+def test_non_youtube_links_are_ignored(index):
+    index.record(TrackResult("https://example.com/song.mp3", "Some Song", "PT1M", None))
+    assert index.entries == 0
+
+
+def test_replays_update_instead_of_duplicating(index):
+    index.record(result("aaaaaaaaaaa", "Old Title Here"))
+    index.record(result("aaaaaaaaaaa", "Brand New Name"))
+    assert index.entries == 1
+    assert index.lookup("brand new name").title == "Brand New Name"
+    assert index.lookup("old title here") is None
+
+
+def test_rebuild_keeps_answers(index):
+    index.record_many([result("aaaaaaaaaaa", "Ed Sheeran - Shape of You")])
+    index.rebuild()
+    assert index.lookup("shape of you").title == "Ed Sheeran - Shape of You"
+
+
+def test_compact_bounds_the_index(index):
+    index.record_many([result(f"{n:011d}", f"Track number {n}") for n in range(5)])
+    assert index.compact(max_entries=2) == 3
+    assert index.entries == 2
+
+
+def test_one_maintenance_run_at_a_time(index):
+    index.maintenance.acquire()
+    try:
+        assert not index.start_maintenance("compact")
+        assert index.lookup("anything at all") is None
+    finally:
+        index.maintenance.release()
+    assert index.start_maintenance("compact")
+    deadline = time.monotonic() + 5
+    while index.maintenance.locked() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not index.maintenance.locked()
+
+
+def test_closed_index_does_nothing(tmp_path):
+    index = TrackIndex(str(tmp_path / "unused.sqlite3"))
+    assert index.lookup("shape of you") is None
+    assert not index.start_maintenance("rebuild")
@@ -0,0 +1,128 @@
+import asyncio
+
+import pytest
+
+from FrozenMusic.infra.http import upstream_health
+from FrozenMusic.infra.http.upstream_health import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CIRCUIT_CONSECUTIVE_FAILURES,
+    CIRCUIT_OPEN_SECONDS,
+    CircuitOpen,
+    UpstreamHealth,
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(upstream_health.time, "monotonic", clock)
+    return clock
+
+
+async def call(health, fail=False):
+    async with health.track():
+        if fail:
+            raise ConnectionError("boom")
+
+
+async def trip(health):
+    for _ in range(CIRCUIT_CONSECUTIVE_FAILURES):
+        with pytest.raises(ConnectionError):
+            await call(health, fail=True)
+
+
+def test_consecutive_failures_open_the_circuit(clock):
+    async def scenario():
+        health = UpstreamHealth("api")
+        await trip(health)
+        assert health.state == OPEN
+        with pytest.raises(CircuitOpen):
+            await call(health)
+        assert health.score() == 0.0
+
+    asyncio.run(scenario())
+
+
+def test_open_half_open_closed(clock):
+    async def scenario():
+        health = UpstreamHealth("api")
+        await trip(health)
+        clock.now += CIRCUIT_OPEN_SECONDS + 1
+        # One trial call goes through; others are still refused meanwhile.
+        assert health.allow()
+        assert health.state == HALF_OPEN
+        assert not health.allow()
+        health.record_success(0.1)
+        assert health.state == CLOSED
+        await call(health)
+
+    asyncio.run(scenario())
+
+
+def test_failed_trial_reopens_for_longer(clock):
+    async def scenario():
+        health = UpstreamHealth("api")
+        await trip(health)
+        clock.now += CIRCUIT_OPEN_SECONDS + 1
+        with pytest.raises(ConnectionError):
+            await call(health, fail=True)
+        assert health.state == OPEN
+        assert health.open_seconds == 2 * CIRCUIT_OPEN_SECONDS
+
+    asyncio.run(scenario())
+
+
+def test_ignored_and_cancelled_calls_do_not_count(clock):
+    async def scenario():
+        health = UpstreamHealth("api")
+        for _ in range(CIRCUIT_CONSECUTIVE_FAILURES + 1):
+            with pytest.raises(ValueError):
+                async with health.track(ignore=lambda e: isinstance(e, ValueError)):
+                    raise ValueError("ours")
+        assert health.state == CLOSED
+        assert len(health.outcomes) == 0
+
+    asyncio.run(scenario())
+
+
+def test_probe_closes_a_recovered_upstream(clock):
+    async def scenario():
+        healthy = False
+
+        async def probe():
+            return healthy
+
+        health = UpstreamHealth("api", probe)
+        await trip(health)
+        clock.now += CIRCUIT_OPEN_SECONDS + 1
+        # With a probe, callers never run the trial themselves.
+        assert not health.allow()
+        await health.run_probe()
+        assert health.state == OPEN
+        clock.now += health.open_seconds + 1
+        healthy = True
+        await health.run_probe()
+        assert health.state == CLOSED
+
+    asyncio.run(scenario())
+
+
+def test_begin_restarts_the_call_clock():
+    async def scenario():
+        health = UpstreamHealth("api")
+        async with health.track() as timed:
+            await asyncio.sleep(0.2)
+            timed.begin()
+        assert health.latency.percentile(0.5) < 0.1
+
+    asyncio.run(scenario())